@@ -0,0 +1,441 @@
+import asyncio
+
+import psycopg
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import AsyncConnectionPool
+
+import backend_fit as db
+from deletion_fit import STEP_NAMES, TOMBSTONE_QUERY
+from feed_fit import (BACKFILL_QUERY, FANOUT_QUERY, FEED_QUERY, TRIM_QUERY, UNFOLLOW_QUERY, backfill_params,
+                      fanout_params, feed_page, feed_params, timelines_to_trim, trim_params)
+from goals_fit import GOAL_PROGRESS_QUERY, REFRESH_GOALS_QUERY, GoalProgress, validate_goal
+from insights_fit import ROLLUP_INSIGHTS_QUERY, empty_insights, insights_from_row
+from instrumentation_fit import log_error
+from leaderboard_fit import leaderboard_from_rows, leaderboard_query, normalize_metric
+from progression_fit import APPLY_PROGRESS_QUERY, PROGRESS_QUERY, ExerciseProgress, apply_progress_params, progress_params
+from stats_fit import APPLY_WORKOUT_QUERY, apply_workout_params, exercise_volume
+
+# Async counterpart of backend_fit on psycopg 3 and its AsyncConnectionPool.
+# Same functions, arguments, return values and error handling as the sync
+# module (errors go through log_error and a fallback value is returned), and
+# the same SQL wherever backend_fit exposes it. Writes also invalidate the
+# in-process read and leaderboard caches of backend_fit so both paths can share
+# a process. The global leaderboard and rank are served by that shared
+# LeaderboardCache, which is synchronous, so they run in a worker thread.
+# load_dashboard fans the independent dashboard reads out concurrently.
+
+_pool = None
+_pool_lock = asyncio.Lock()
+
+
+async def get_pool():
+    """Returns the shared async connection pool, opening it on first use."""
+    global _pool
+    if _pool is None:
+        async with _pool_lock:
+            if _pool is None:
+                pool = AsyncConnectionPool(
+                    make_conninfo(**db.DATABASE_CONFIG),
+                    min_size=db.POOL_CONFIG['minconn'],
+                    max_size=db.POOL_CONFIG['maxconn'],
+                    timeout=db.POOL_CONFIG['timeout'],
+                    max_idle=db.POOL_CONFIG['max_idle'],
+                    open=False,
+                )
+                await pool.open()
+                _pool = pool
+    return _pool
+
+
+async def close_pool():
+    """Closes the shared async connection pool."""
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+async def _fetchone(query, params):
+    pool = await get_pool()
+    async with pool.connection() as conn:
+        cur = await conn.execute(query, params)
+        return await cur.fetchone()
+
+
+async def _fetchall(query, params):
+    pool = await get_pool()
+    async with pool.connection() as conn:
+        cur = await conn.execute(query, params)
+        return await cur.fetchall()
+
+
+# --- CRUD Operations for User Profile ---
+
+async def create_user(name, email, weight):
+    """Creates a new user profile."""
+    try:
+        row = await _fetchone(
+            "INSERT INTO users (name, email, weight_kg) VALUES (%s, %s, %s) RETURNING id;",
+            (name, email, weight)
+        )
+        return row[0]
+    except psycopg.errors.UniqueViolation:
+        print("Error: A user with this email already exists.")
+        return None
+    except Exception as e:
+        log_error("Error creating user", e)
+        return None
+
+
+async def read_user(user_id):
+    """Retrieves a user's profile."""
+    try:
+        return await _fetchone("SELECT id, name, email, weight_kg FROM users WHERE id = %s AND deleted_at IS NULL;", (user_id,))
+    except Exception as e:
+        log_error("Error reading user data", e)
+        return None
+
+
+async def update_user(user_id, name, email, weight):
+    """Updates a user's profile."""
+    try:
+        followers = await _fetchall(
+            """
+            WITH updated AS (
+                UPDATE users SET name = %s, email = %s, weight_kg = %s WHERE id = %s
+            )
+            SELECT user_id FROM friends WHERE friend_id = %s;
+            """,
+            (name, email, weight, user_id, user_id)
+        )
+        db.invalidate_reads(user_id, 'user')
+        for (follower_id,) in followers:
+            db.invalidate_reads(follower_id, 'friends')
+        return True
+    except Exception as e:
+        log_error("Error updating user", e)
+        return False
+
+
+async def delete_user(user_id):
+    """Deletes a user's profile; their rows are purged in the background (see backend_fit.delete_user)."""
+    try:
+        pool = await get_pool()
+        async with pool.connection() as conn:
+            cur = await conn.execute(TOMBSTONE_QUERY, {'user_id': user_id, 'first_step': STEP_NAMES[0]})
+            tombstoned, followers = await cur.fetchone()
+        if not tombstoned:
+            return True
+        db.invalidate_reads(user_id)
+        for follower_id in followers:
+            db.invalidate_reads(follower_id, 'friends')
+        db._update_leaderboard_cache('remove_user', user_id)
+        db.get_deletion_worker().wake()
+        return True
+    except Exception as e:
+        log_error("Error deleting user", e)
+        return False
+
+
+# --- CRUD Operations for Workouts and Exercises ---
+
+async def create_workout(user_id, date, duration, exercises, idempotency_key=None):
+    """Creates a new workout and its associated exercises; a retry with the same idempotency_key is a no-op."""
+    try:
+        db.check_workout_date(date)
+        pool = await get_pool()
+        async with pool.connection() as conn:
+            async with conn.transaction():
+                cur = await conn.execute(db.CREATE_WORKOUT_QUERY,
+                                         db.create_workout_params(user_id, date, duration, exercises,
+                                                                  idempotency_key))
+                row = await cur.fetchone()
+                if row is None:
+                    return True
+                workout_id = row[0]
+                await conn.execute(APPLY_WORKOUT_QUERY,
+                                   apply_workout_params(user_id, date, duration, exercises))
+                if exercises:
+                    await conn.execute(APPLY_PROGRESS_QUERY,
+                                       apply_progress_params(user_id, workout_id, date, exercises))
+                cur = await conn.execute(FANOUT_QUERY,
+                                         fanout_params(user_id, workout_id, date, duration, exercises))
+                full = timelines_to_trim(await cur.fetchall())
+                if full:
+                    await conn.execute(TRIM_QUERY, trim_params(full))
+                await conn.execute(REFRESH_GOALS_QUERY, {'user_id': user_id})
+        db.invalidate_reads(user_id, 'workouts', 'insights', 'goals', 'progress')
+        volume = sum(v for v in map(exercise_volume, exercises) if v is not None)
+        db._update_leaderboard_cache('record_workout', user_id, date, duration, volume, row[1])
+        return True
+    except Exception as e:
+        log_error("Error creating workout", e)
+        return False
+
+
+async def read_workouts(user_id, limit=None, before=None, start_date=None, end_date=None):
+    """Retrieves workouts and their exercises for a given user, newest first (see backend_fit.read_workouts)."""
+    query, params = db._workouts_query(user_id, limit, before, start_date, end_date)
+    try:
+        return list(db._group_workout_rows(await _fetchall(query, params)))
+    except Exception as e:
+        log_error("Error reading workouts", e)
+        return []
+
+
+async def read_workouts_page(user_id, page_size=20, before=None, start_date=None, end_date=None):
+    """Retrieves one page of workouts as (workouts, next_before) (see backend_fit.read_workouts_page)."""
+    workouts = await read_workouts(user_id, page_size + 1, before, start_date, end_date)
+    if len(workouts) <= page_size:
+        return workouts, None
+    workouts = workouts[:page_size]
+    return workouts, (workouts[-1]['date'], workouts[-1]['id'])
+
+
+# --- CRUD Operations for Friends ---
+
+async def create_friendship(user_id, friend_email):
+    """Adds a friend to a user's friend list."""
+    try:
+        pool = await get_pool()
+        async with pool.connection() as conn:
+            cur = await conn.execute("SELECT id, name FROM users WHERE email = %s AND deleted_at IS NULL;", (friend_email,))
+            friend_id_data = await cur.fetchone()
+            if not friend_id_data:
+                print("Friend not found.")
+                return False
+            friend_id, friend_name = friend_id_data
+            await conn.execute("INSERT INTO friends (user_id, friend_id) VALUES (%s, %s);", (user_id, friend_id))
+            await conn.execute(BACKFILL_QUERY, backfill_params(user_id, [friend_id]))
+        db.invalidate_reads(user_id, 'friends')
+        db._update_leaderboard_cache('add_friend', user_id, friend_id, friend_name)
+        return True
+    except psycopg.errors.UniqueViolation:
+        print("Friendship already exists.")
+        return False
+    except Exception as e:
+        log_error("Error adding friend", e)
+        return False
+
+
+async def read_friends(user_id):
+    """Retrieves a list of a user's friends."""
+    try:
+        return await _fetchall(
+            "SELECT u.name, u.email FROM friends f JOIN users u ON f.friend_id = u.id WHERE f.user_id = %s;",
+            (user_id,)
+        )
+    except Exception as e:
+        log_error("Error reading friends", e)
+        return []
+
+
+async def delete_friendship(user_id, friend_email):
+    """Removes a friend from a user's friend list."""
+    try:
+        pool = await get_pool()
+        async with pool.connection() as conn:
+            cur = await conn.execute(
+                """
+                DELETE FROM friends
+                WHERE user_id = %s AND friend_id = (SELECT id FROM users WHERE email = %s)
+                RETURNING friend_id;
+                """,
+                (user_id, friend_email)
+            )
+            row = await cur.fetchone()
+            if not row:
+                print("Friend not found.")
+                return False
+            await conn.execute(UNFOLLOW_QUERY, {'user_id': user_id, 'friend_ids': [row[0]]})
+        db.invalidate_reads(user_id, 'friends')
+        db._update_leaderboard_cache('remove_friend', user_id, row[0])
+        return True
+    except Exception as e:
+        log_error("Error deleting friend", e)
+        return False
+
+
+# --- Batch Friend Operations and Lookups ---
+
+async def find_users_by_email(emails):
+    """Looks up many users at once; returns {email: (id, name)} for the emails that exist."""
+    try:
+        rows = await _fetchall(db.FIND_USERS_QUERY, (list(emails),))
+        return {email: (user_id, name) for email, user_id, name in rows}
+    except Exception as e:
+        log_error("Error looking up users", e)
+        return {}
+
+
+async def create_friendships(user_id, friend_emails):
+    """Adds many friends by email in one statement (see backend_fit.create_friendships)."""
+    emails = list(dict.fromkeys(friend_emails))
+    try:
+        pool = await get_pool()
+        async with pool.connection() as conn:
+            cur = await conn.execute(db.ADD_FRIENDS_QUERY, {'user_id': user_id, 'emails': emails})
+            rows = await cur.fetchall()
+            added = [friend_id for _, friend_id, _, was_added in rows if was_added]
+            if added:
+                await conn.execute(BACKFILL_QUERY, backfill_params(user_id, added))
+    except Exception as e:
+        log_error("Error adding friends", e)
+        return None
+    return db._friendships_added(user_id, emails, rows)
+
+
+async def delete_friendships(user_id, friend_emails):
+    """Removes many friends by email in one statement; returns the emails actually removed, or None on error."""
+    try:
+        pool = await get_pool()
+        async with pool.connection() as conn:
+            cur = await conn.execute(db.REMOVE_FRIENDS_QUERY, (user_id, list(friend_emails)))
+            removed = await cur.fetchall()
+            if removed:
+                await conn.execute(UNFOLLOW_QUERY, {'user_id': user_id,
+                                                    'friend_ids': [friend_id for _, friend_id in removed]})
+    except Exception as e:
+        log_error("Error removing friends", e)
+        return None
+    return db._friendships_removed(user_id, removed)
+
+
+async def read_friends_of_users(user_ids):
+    """Retrieves the friend lists of many users in one query; returns {user_id: [(friend_id, name, email), ...]}."""
+    user_ids = list(user_ids)
+    try:
+        rows = await _fetchall(db.FRIENDS_OF_USERS_QUERY, (user_ids,))
+    except Exception as e:
+        log_error("Error reading friends", e)
+        return {}
+    return db._group_friends(user_ids, rows)
+
+
+# --- Activity Feed ---
+
+async def read_feed(user_id, page_size=20, before=None):
+    """Retrieves one page of a user's activity feed (see backend_fit.read_feed)."""
+    try:
+        return feed_page(await _fetchall(FEED_QUERY, feed_params(user_id, page_size, before)), page_size)
+    except Exception as e:
+        log_error("Error reading activity feed", e)
+        return [], None
+
+
+# --- CRUD Operations for Goals ---
+
+async def create_goal(user_id, description, target_value, metric=None, period=None, exercise_name=None):
+    """Creates a new fitness goal (see backend_fit.create_goal)."""
+    try:
+        validate_goal(metric, period, exercise_name)
+        pool = await get_pool()
+        async with pool.connection() as conn:
+            await conn.execute(
+                """
+                INSERT INTO goals (user_id, description, target_value, metric, period, exercise_name)
+                VALUES (%s, %s, %s, %s, %s, %s);
+                """,
+                (user_id, description, target_value, metric, period, exercise_name)
+            )
+            if metric is not None:
+                await conn.execute(REFRESH_GOALS_QUERY, {'user_id': user_id})
+        db.invalidate_reads(user_id, 'goals')
+        return True
+    except Exception as e:
+        log_error("Error creating goal", e)
+        return False
+
+
+async def read_goals(user_id):
+    """Retrieves all of a user's goals with their progress (goals_fit.GoalProgress) in one query."""
+    try:
+        return [GoalProgress(*row) for row in await _fetchall(GOAL_PROGRESS_QUERY, {'user_id': user_id})]
+    except Exception as e:
+        log_error("Error reading goals", e)
+        return []
+
+
+async def update_goal(goal_id, description, target_value, current_value):
+    """Updates a fitness goal. current_value is ignored for goals tracked from workouts."""
+    try:
+        owner = await _fetchone(
+            """
+            UPDATE goals
+            SET description = %s, target_value = %s,
+                current_value = CASE WHEN metric IS NULL THEN %s ELSE current_value END
+            WHERE id = %s
+            RETURNING user_id;
+            """,
+            (description, target_value, current_value, goal_id)
+        )
+        if owner:
+            db.invalidate_reads(owner[0], 'goals')
+        return True
+    except Exception as e:
+        log_error("Error updating goal", e)
+        return False
+
+
+async def delete_goal(goal_id):
+    """Deletes a fitness goal."""
+    try:
+        owner = await _fetchone("DELETE FROM goals WHERE id = %s RETURNING user_id;", (goal_id,))
+        if owner:
+            db.invalidate_reads(owner[0], 'goals')
+        return True
+    except Exception as e:
+        log_error("Error deleting goal", e)
+        return False
+
+
+# --- Business Insights and Leaderboard ---
+
+async def get_exercise_progress(user_id):
+    """Per-exercise progression (progression_fit.ExerciseProgress) read from the progression tables."""
+    try:
+        return [ExerciseProgress(*row) for row in await _fetchall(PROGRESS_QUERY, progress_params(user_id))]
+    except Exception as e:
+        log_error("Error reading exercise progress", e)
+        return []
+
+
+async def get_business_insights(user_id):
+    """Provides the user's insights_fit.Insights, read from the stats rollups."""
+    try:
+        row = await _fetchone(ROLLUP_INSIGHTS_QUERY, (user_id,))
+        return insights_from_row(row) if row else empty_insights()
+    except Exception as e:
+        log_error("Error getting business insights", e)
+        return None
+
+
+async def get_leaderboard(user_id, metric='total_workout_minutes', window='week', limit=None):
+    """Ranks the user and their friends; returns a leaderboard_fit.Leaderboard."""
+    try:
+        metric = normalize_metric(metric)
+        rows = await _fetchall(leaderboard_query(metric, window), {'user_id': user_id, 'limit': limit})
+        return leaderboard_from_rows(rows, user_id, metric, window, limit)
+    except Exception as e:
+        log_error("Error getting leaderboard", e)
+        return None
+
+
+async def get_global_leaderboard(metric='minutes', window='week', limit=10):
+    """Ranks all users; returns a list of leaderboard_fit.LeaderboardRow (see backend_fit.get_global_leaderboard)."""
+    return await asyncio.to_thread(db.get_global_leaderboard, metric, window, limit)
+
+
+async def get_global_rank(user_id, metric='minutes', window='week'):
+    """Returns a user's rank among all users (see backend_fit.get_global_rank)."""
+    return await asyncio.to_thread(db.get_global_rank, user_id, metric, window)
+
+
+async def load_dashboard(user_id, recent_workouts=3):
+    """Loads everything the Dashboard shows, issuing the independent queries concurrently."""
+    goals, workouts, insights = await asyncio.gather(
+        read_goals(user_id),
+        read_workouts(user_id, limit=recent_workouts),
+        get_business_insights(user_id),
+    )
+    return {'goals': goals, 'workouts': workouts, 'insights': insights}
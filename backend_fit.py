@@ -1,5 +1,26 @@
+import threading
+
 import psycopg2
 
+from cache_fit import ReadThroughCache
+from deletion_fit import DeletionWorker, read_jobs, tombstone_user
+from export_fit import CHUNK_SIZE, WORKERS, export_tables
+from feed_fit import fanout_workout, follow_backfill, read_feed_page, unfollow_cleanup
+from goals_fit import read_goal_progress, refresh_goal_progress, validate_goal
+from history_fit import load_history
+from import_fit import detect_format, import_records, read_records
+from ingest_fit import IngestResult, IngestWorker, WorkoutQueue, record_args, workout_record
+from insights_fit import read_insights
+from instrumentation_fit import InstrumentedCursor, instrumented, log_error, metrics, serve, track_acquire
+from leaderboard_cache_fit import LeaderboardCache, make_store
+from leaderboard_fit import compute_leaderboard
+from migrations_fit import apply_migrations
+from partitions_fit import (create_upcoming, latest_workout_date, list_partitions, maintain, partition_for,
+                            require_partitioned)
+from pool_fit import ConnectionPool
+from progression_fit import apply_progress, read_progress, rebuild_progress
+from stats_fit import apply_workout, exercise_volume
+
 # Database configuration
 DATABASE_CONFIG = {
     'dbname': 'Tracker',
@@ -9,384 +30,1071 @@ DATABASE_CONFIG = {
     'port': '5432'
 }
 
+# Connection pool configuration
+POOL_CONFIG = {
+    'minconn': 1,
+    'maxconn': 10,
+    'timeout': 30.0,                # seconds to wait for a free connection
+    'max_idle': 300.0,              # idle connections above minconn are closed after this
+    'health_check_interval': 30.0,  # ping connections idle for longer than this on checkout
+}
+
+# Apply pending schema migrations (migrations_fit.py) when the pool is first created
+MIGRATE_ON_STARTUP = True
+
+# Leaderboard cache configuration (leaderboard_cache_fit.py)
+LEADERBOARD_CACHE_CONFIG = {
+    'enabled': True,
+    'backend': 'local',          # 'local' (in-process) or 'redis' (shared between processes)
+    'redis_url': 'redis://localhost:6379/0',
+    'global_ttl': 300.0,         # seconds before a global board is reloaded from the rollups
+    'board_ttl': 60.0,           # seconds before a friend board is rebuilt
+    'board_maxsize': 10000,      # friend boards kept in memory (LRU)
+}
+
+# Per-user read-through cache for read_user, read_friends, read_goals,
+# read_workouts and get_business_insights; writes invalidate the affected entries
+READ_CACHE_CONFIG = {
+    'enabled': True,
+    'maxsize': 5000,   # cached results across all users (LRU)
+    'ttl': 30.0,       # seconds; bounds staleness for writes made by other processes
+}
+
+# Instrumentation (instrumentation_fit.py): per-function and per-statement
+# latency histograms, row counts, connection-acquire time, a slow-query log and
+# a local Prometheus/text exporter
+INSTRUMENTATION_CONFIG = {
+    'enabled': True,
+    'slow_call_ms': 500.0,       # backend calls at least this slow go to the slow log
+    'slow_statement_ms': 100.0,  # SQL statements at least this slow go to the slow log
+    'slow_log_size': 200,        # entries kept in memory
+    'slow_log_file': None,       # also append slow-log entries (JSON lines) to this file
+    'exporter_port': None,       # serve /metrics and / on 127.0.0.1:<port> when the pool starts
+}
+
+# Storage engine (storage_fit.py): 'postgres' is this module; 'sqlite' serves the
+# same functions from an embedded SQLite file for local and test runs, with the
+# analytic reads optionally answered by DuckDB ('analytics': 'duckdb')
+STORAGE_CONFIG = {
+    'engine': 'postgres',
+    'sqlite_path': 'fitness_tracker.db',
+    'analytics': None,
+}
+
+# Write-behind workout ingestion (ingest_fit.py): when enabled, create_workout
+# appends the workout to a durable local queue and returns; a background worker
+# commits queued workouts in batches, so reads see them a moment later
+INGEST_CONFIG = {
+    'enabled': False,
+    'path': 'workout_ingest.log',
+    'batch_size': 200,    # workouts per transaction
+    'max_delay': 0.05,    # seconds the worker waits for a batch to fill before committing
+    'fsync': True,        # fsync every append, so acknowledged workouts survive a power loss
+}
+
+# Account deletion (deletion_fit.py): delete_user tombstones the user at once
+# and a background worker purges their rows in throttled batches
+DELETION_CONFIG = {
+    'background': True,    # purge in a worker thread of this process (else run deletion_fit.py run)
+    'batch_size': 1000,    # rows deleted per transaction
+    'pause': 0.05,         # minimum seconds between batches
+    'duty_cycle': 0.5,     # at most this share of time spent deleting
+    'poll_interval': 10.0, # seconds between checks for jobs queued by other processes
+}
+
+# Monthly partitions of workouts/exercises (partitions_fit.py): upcoming months
+# are created on pool startup and again by check_workout_date once a date is
+# past the newest partition; maintain_partitions (or partitions_fit.py maintain,
+# e.g. from cron) archives months older than keep_months to archive_dir
+PARTITION_CONFIG = {
+    'premake_months': 3,    # months of partitions created ahead of today (at least 1)
+    'keep_months': 24,      # months kept in the database; older ones are archived
+    'archive_dir': 'archive',
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+_leaderboard_cache = None
+_ingest_worker = None
+_deletion_worker = None
+_workout_partitions = []  # partitions_fit.Partition list as of the last _create_upcoming
+_partitions_lock = threading.Lock()
+read_cache = ReadThroughCache(READ_CACHE_CONFIG['maxsize'], READ_CACHE_CONFIG['ttl'])
+metrics.configure(**{k: v for k, v in INSTRUMENTATION_CONFIG.items() if k != 'exporter_port'})
+_exporter = None
+
 def get_connection():
-    """Establishes and returns a database connection."""
+    """Establishes and returns a new, unpooled database connection."""
     try:
         conn = psycopg2.connect(**DATABASE_CONFIG)
         return conn
     except psycopg2.OperationalError as e:
-        print(f"Error connecting to the database: {e}")
+        log_error("Error connecting to the database", e)
+        return None
+
+def get_pool():
+    """Returns the shared connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                latest_workout_date(premake=PARTITION_CONFIG['premake_months'])  # rejects premake_months < 1
+                pool = ConnectionPool(
+                    lambda: psycopg2.connect(**DATABASE_CONFIG, cursor_factory=InstrumentedCursor),
+                    **POOL_CONFIG
+                )
+                if MIGRATE_ON_STARTUP:
+                    try:
+                        with pool.connection() as conn:
+                            apply_migrations(conn)
+                    except Exception as e:
+                        log_error("Error applying schema migrations", e)
+                # The workout queries need the partitioned schema: fail every call
+                # until it is there rather than deep inside each statement.
+                try:
+                    with pool.connection() as conn:
+                        require_partitioned(conn.cursor())
+                except Exception:
+                    pool.close_all()
+                    raise
+                try:
+                    _create_upcoming(pool)
+                except Exception as e:
+                    log_error("Error creating workout partitions", e)
+                _pool = pool
+                if INSTRUMENTATION_CONFIG['exporter_port']:
+                    start_metrics_exporter(INSTRUMENTATION_CONFIG['exporter_port'])
+    return _pool
+
+def pooled_connection():
+    """Context manager that borrows a connection from the shared pool."""
+    return track_acquire(get_pool().connection())
+
+def pool_stats():
+    """Returns connection pool metrics (wait time, in-use count, checkout latency histogram)."""
+    return get_pool().stats()
+
+def close_pool():
+    """Closes the shared connection pool, first committing any queued workouts."""
+    global _pool, _ingest_worker, _deletion_worker
+    if _ingest_worker is not None:
+        _ingest_worker.stop(drain=True)
+        _ingest_worker = None
+    if _deletion_worker is not None:
+        _deletion_worker.stop()
+        _deletion_worker = None
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+            _pool = None
+
+def start_metrics_exporter(port, host='127.0.0.1'):
+    """Serves the instrumentation metrics on http://host:port/metrics (Prometheus) and / (text)."""
+    global _exporter
+    if _exporter is None:
+        try:
+            _exporter = serve(port, host, pool_stats=lambda: _pool.stats() if _pool else None)
+        except OSError as e:
+            log_error("Error starting metrics exporter", e)
+    return _exporter
+
+def run_query(fn, *args):
+    """Runs fn(cur, *args) on a pooled connection and returns its result."""
+    with pooled_connection() as conn:
+        return fn(conn.cursor(), *args)
+
+def get_leaderboard_cache():
+    """Returns the shared leaderboard cache, or None if it is disabled."""
+    global _leaderboard_cache
+    if not LEADERBOARD_CACHE_CONFIG['enabled']:
+        return None
+    if _leaderboard_cache is None:
+        with _pool_lock:
+            if _leaderboard_cache is None:
+                _leaderboard_cache = LeaderboardCache(
+                    make_store(LEADERBOARD_CACHE_CONFIG), run_query,
+                    board_ttl=LEADERBOARD_CACHE_CONFIG['board_ttl'],
+                    board_maxsize=LEADERBOARD_CACHE_CONFIG['board_maxsize'],
+                )
+    return _leaderboard_cache
+
+def get_ingest_worker():
+    """Returns the write-behind ingestion worker, or None if INGEST_CONFIG disables it."""
+    global _ingest_worker
+    if not INGEST_CONFIG['enabled']:
         return None
+    if _ingest_worker is None:
+        with _pool_lock:
+            if _ingest_worker is None:
+                _ingest_worker = IngestWorker(
+                    WorkoutQueue(INGEST_CONFIG['path'], fsync=INGEST_CONFIG['fsync']),
+                    _apply_ingest_batch,
+                    batch_size=INGEST_CONFIG['batch_size'],
+                    max_delay=INGEST_CONFIG['max_delay'],
+                ).start()
+    return _ingest_worker
+
+def ingest_stats():
+    """Returns write-behind queue statistics (pending, batches, average batch size, ...), or None."""
+    worker = get_ingest_worker()
+    return worker.stats() if worker is not None else None
+
+def _new_deletion_worker():
+    return DeletionWorker(
+        pooled_connection, _account_purged,
+        batch_size=DELETION_CONFIG['batch_size'],
+        pause=DELETION_CONFIG['pause'],
+        duty_cycle=DELETION_CONFIG['duty_cycle'],
+        poll_interval=DELETION_CONFIG['poll_interval'],
+    )
+
+def get_deletion_worker():
+    """Returns the account purge worker, started if DELETION_CONFIG['background'] is set."""
+    global _deletion_worker
+    if _deletion_worker is None:
+        with _pool_lock:
+            if _deletion_worker is None:
+                _deletion_worker = _new_deletion_worker()
+                if DELETION_CONFIG['background']:
+                    _deletion_worker.start()
+    return _deletion_worker
+
+def _update_leaderboard_cache(method, *args):
+    """Applies a committed change to the leaderboard cache; a failure only costs freshness."""
+    try:
+        cache = get_leaderboard_cache()
+        if cache is not None:
+            getattr(cache, method)(*args)
+    except Exception as e:
+        log_error("Error updating leaderboard cache", e)
+
+def cached_read(user_id, kind, args, loader):
+    """Serves a read from the read-through cache, or straight from loader() if it is disabled."""
+    if not READ_CACHE_CONFIG['enabled']:
+        return loader()
+    return read_cache.get_or_load(user_id, kind, args, loader)
+
+def invalidate_reads(user_id, *kinds):
+    """Drops cached reads of one user ('user', 'friends', 'goals', 'workouts', 'insights', 'progress'; default all)."""
+    read_cache.invalidate(user_id, *kinds)
+
+def read_cache_stats():
+    """Returns hit/miss statistics of the read-through cache."""
+    return read_cache.stats()
+
+def _followers(cur, user_id):
+    """Ids of the users who have this user in their friend list."""
+    cur.execute("SELECT user_id FROM friends WHERE friend_id = %s;", (user_id,))
+    return [row[0] for row in cur.fetchall()]
 
 # --- CRUD Operations for User Profile ---
 
+@instrumented
 def create_user(name, email, weight):
     """Creates a new user profile."""
-    conn = get_connection()
-    if not conn: return False
     try:
-        cur = conn.cursor()
-        cur.execute(
-            "INSERT INTO users (name, email, weight_kg) VALUES (%s, %s, %s) RETURNING id;",
-            (name, email, weight)
-        )
-        user_id = cur.fetchone()[0]
-        conn.commit()
-        return user_id
+        with pooled_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                "INSERT INTO users (name, email, weight_kg) VALUES (%s, %s, %s) RETURNING id;",
+                (name, email, weight)
+            )
+            user_id = cur.fetchone()[0]
+            conn.commit()
+            return user_id
     except psycopg2.IntegrityError:
         print("Error: A user with this email already exists.")
         return None
     except Exception as e:
-        print(f"Error creating user: {e}")
+        log_error("Error creating user", e)
         return None
-    finally:
-        if conn: conn.close()
 
+def _select_user(cur, user_id):
+    cur.execute(
+        "SELECT id, name, email, weight_kg FROM users WHERE id = %s AND deleted_at IS NULL;",
+        (user_id,)
+    )
+    return cur.fetchone()
+
+@instrumented
 def read_user(user_id):
     """Retrieves a user's profile."""
-    conn = get_connection()
-    if not conn: return None
     try:
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT id, name, email, weight_kg FROM users WHERE id = %s;",
-            (user_id,)
-        )
-        user_data = cur.fetchone()
-        return user_data
+        return cached_read(user_id, 'user', (), lambda: run_query(_select_user, user_id))
     except Exception as e:
-        print(f"Error reading user data: {e}")
+        log_error("Error reading user data", e)
         return None
-    finally:
-        if conn: conn.close()
 
+@instrumented
+def find_user_by_email(email):
+    """Looks up a user by email; returns (id, name) or None."""
+    try:
+        with pooled_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT id, name FROM users WHERE email = %s AND deleted_at IS NULL;", (email,))
+            return cur.fetchone()
+    except Exception as e:
+        log_error("Error looking up user", e)
+        return None
+
+@instrumented
 def update_user(user_id, name, email, weight):
     """Updates a user's profile."""
-    conn = get_connection()
-    if not conn: return False
     try:
-        cur = conn.cursor()
-        cur.execute(
-            "UPDATE users SET name = %s, email = %s, weight_kg = %s WHERE id = %s;",
-            (name, email, weight, user_id)
-        )
-        conn.commit()
-        return True
+        with pooled_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                "UPDATE users SET name = %s, email = %s, weight_kg = %s WHERE id = %s;",
+                (name, email, weight, user_id)
+            )
+            followers = _followers(cur, user_id)
+            conn.commit()
+            # The user's name and email also appear in their followers' friend lists.
+            invalidate_reads(user_id, 'user')
+            for follower_id in followers:
+                invalidate_reads(follower_id, 'friends')
+            return True
     except Exception as e:
-        print(f"Error updating user: {e}")
+        log_error("Error updating user", e)
         return False
-    finally:
-        if conn: conn.close()
 
+@instrumented
 def delete_user(user_id):
-    """Deletes a user's profile."""
-    conn = get_connection()
-    if not conn: return False
+    """
+    Deletes a user's profile. The user disappears at once (tombstoned, with
+    their friendships removed); their workouts, goals and other rows are
+    purged shortly after in the background (see deletion_fit).
+    """
     try:
-        cur = conn.cursor()
-        cur.execute("DELETE FROM users WHERE id = %s;", (user_id,))
-        conn.commit()
-        return True
+        with pooled_connection() as conn:
+            cur = conn.cursor()
+            followers = tombstone_user(cur, user_id)
+            conn.commit()
     except Exception as e:
-        print(f"Error deleting user: {e}")
+        log_error("Error deleting user", e)
         return False
-    finally:
-        if conn: conn.close()
+    if followers is None:
+        return True  # already deleted
+    invalidate_reads(user_id)
+    for follower_id in followers:
+        invalidate_reads(follower_id, 'friends')
+    _update_leaderboard_cache('remove_user', user_id)
+    get_deletion_worker().wake()
+    return True
+
+def _account_purged(user_id):
+    # A leaderboard reload between the tombstone and the purge of the rollups may have re-added the user.
+    invalidate_reads(user_id)
+    _update_leaderboard_cache('remove_user', user_id)
+
+@instrumented
+def run_deletion_jobs(max_batches=None):
+    """
+    Purges pending account deletions in this thread, without starting the
+    background worker, until none is left (jobs the worker is on included);
+    returns the number of rows deleted, or None on error.
+    """
+    try:
+        return _new_deletion_worker().drain(max_batches)
+    except Exception as e:
+        log_error("Error purging deleted accounts", e)
+        return None
+
+@instrumented
+def read_deletion_jobs(user_id=None):
+    """Recent account deletion jobs (deletion_fit.DeletionJob), or the job of one user."""
+    try:
+        return run_query(read_jobs, user_id)
+    except Exception as e:
+        log_error("Error reading deletion jobs", e)
+        return []
+
+@instrumented
+def maintain_partitions(archive=True):
+    """
+    Creates the upcoming monthly partitions of workouts and exercises and, with
+    `archive`, archives the months older than PARTITION_CONFIG['keep_months']
+    (see partitions_fit). Returns a partitions_fit.MaintenanceResult, or None on error.
+    """
+    try:
+        with pooled_connection() as conn:
+            return maintain(conn, premake=PARTITION_CONFIG['premake_months'],
+                            keep_months=PARTITION_CONFIG['keep_months'],
+                            archive_dir=PARTITION_CONFIG['archive_dir'], archive=archive)
+    except Exception as e:
+        log_error("Error maintaining workout partitions", e)
+        return None
 
 # --- CRUD Operations for Workouts and Exercises ---
 
-def create_workout(user_id, date, duration, exercises):
-    """Creates a new workout and its associated exercises."""
-    conn = get_connection()
-    if not conn: return False
+# Inserts a workout and all of its exercises in one statement; returns the
+# workout id and the id of the writing transaction (the leaderboard cache
+# tags the workout's deltas with it), or no row when the user already has a
+# workout with the same idempotency key (a retried or replayed request).
+CREATE_WORKOUT_QUERY = """
+    WITH new_workout AS (
+        INSERT INTO workouts (user_id, workout_date, duration_minutes, idempotency_key)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (user_id, idempotency_key, workout_date) WHERE idempotency_key IS NOT NULL DO NOTHING
+        RETURNING id, workout_date
+    ),
+    new_exercises AS (
+        INSERT INTO exercises (workout_id, workout_date, exercise_name, sets, reps, weight_kg)
+        SELECT w.id, w.workout_date, e.name, e.sets, e.reps, e.weight
+        FROM new_workout w,
+             unnest(%s::varchar[], %s::int[], %s::int[], %s::numeric[])
+                 WITH ORDINALITY AS e(name, sets, reps, weight, ord)
+        ORDER BY e.ord
+    )
+    SELECT id, pg_current_xact_id()::text::bigint FROM new_workout;
+"""
+
+def create_workout_params(user_id, date, duration, exercises, idempotency_key=None):
+    """Parameters of CREATE_WORKOUT_QUERY."""
+    return (user_id, date, duration, idempotency_key,
+            [exercise['name'] for exercise in exercises],
+            [exercise['sets'] for exercise in exercises],
+            [exercise['reps'] for exercise in exercises],
+            [exercise['weight'] for exercise in exercises])
+
+def _create_upcoming(pool):
+    """Creates the upcoming workout partitions and remembers which partitions exist."""
+    global _workout_partitions
+    with pool.connection() as conn:
+        create_upcoming(conn, premake=PARTITION_CONFIG['premake_months'])
+        _workout_partitions = list_partitions(conn.cursor())
+
+def check_workout_date(date):
+    """
+    Raises ValueError for a date after the premade workout partitions (see partitions_fit).
+    A date past the newest partition this process knows of creates the upcoming
+    partitions first, so a long-running process keeps accepting today's workouts.
+    """
+    latest = latest_workout_date(premake=PARTITION_CONFIG['premake_months'])
+    if date > latest:
+        raise ValueError(f"Workout date {date} is too far ahead; the latest accepted date is {latest}")
+    if partition_for(_workout_partitions, date) is not None:
+        return
+    with _partitions_lock:
+        if partition_for(_workout_partitions, date) is None:
+            try:
+                _create_upcoming(get_pool())
+            except Exception as e:
+                log_error("Error creating workout partitions", e)
+
+def _insert_workout(cur, user_id, date, duration, exercises, idempotency_key=None):
+    """
+    Inserts a workout, folds it into the rollups and the feed; returns its id
+    and transaction id, or None for a duplicate key.
+    """
+    cur.execute(CREATE_WORKOUT_QUERY, create_workout_params(user_id, date, duration, exercises, idempotency_key))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    apply_workout(cur, user_id, date, duration, exercises)
+    apply_progress(cur, user_id, row[0], date, exercises)
+    fanout_workout(cur, user_id, row[0], date, duration, exercises)
+    return row
+
+def _workout_committed(user_id, date, duration, exercises, xact=None):
+    invalidate_reads(user_id, 'workouts', 'insights', 'goals', 'progress')
+    volume = sum(v for v in map(exercise_volume, exercises) if v is not None)
+    _update_leaderboard_cache('record_workout', user_id, date, duration, volume, xact)
+
+@instrumented
+def create_workout(user_id, date, duration, exercises, idempotency_key=None):
+    """
+    Creates a new workout and its associated exercises.
+    A request retried with the same `idempotency_key` is recorded only once.
+    With INGEST_CONFIG enabled the workout is queued and committed shortly
+    after by the ingestion worker (see enqueue_workout).
+    """
+    if INGEST_CONFIG['enabled']:
+        return enqueue_workout(user_id, date, duration, exercises, idempotency_key) is not None
     try:
+        check_workout_date(date)
+        with pooled_connection() as conn:
+            cur = conn.cursor()
+            # Workout and all of its exercises go in as a single statement.
+            inserted = _insert_workout(cur, user_id, date, duration, exercises, idempotency_key)
+            if inserted is None:
+                return True
+            refresh_goal_progress(cur, user_id)
+            conn.commit()
+            _workout_committed(user_id, date, duration, exercises, inserted[1])
+            return True
+    except Exception as e:
+        log_error("Error creating workout", e)
+        return False
+
+@instrumented
+def enqueue_workout(user_id, date, duration, exercises, idempotency_key=None):
+    """
+    Queues a workout on the write-behind queue (fsynced before returning).
+    Returns its idempotency key, to pass again when retrying, or None on error.
+    """
+    try:
+        check_workout_date(date)
+        return get_ingest_worker().submit(workout_record(user_id, date, duration, exercises, idempotency_key))
+    except Exception as e:
+        log_error("Error queueing workout", e)
+        return None
+
+def _apply_ingest_batch(records):
+    """
+    Commits a batch of queued workouts in one transaction (the ingestion
+    worker's apply_batch). Each record runs under a savepoint, so a record
+    the database refuses is rejected alone instead of failing the batch.
+    """
+    committed = []
+    rejected = []
+    duplicates = 0
+    with pooled_connection() as conn:
         cur = conn.cursor()
-        cur.execute(
-            "INSERT INTO workouts (user_id, workout_date, duration_minutes) VALUES (%s, %s, %s) RETURNING id;",
-            (user_id, date, duration)
-        )
-        workout_id = cur.fetchone()[0]
-        for exercise in exercises:
-            cur.execute(
-                "INSERT INTO exercises (workout_id, exercise_name, sets, reps, weight_kg) VALUES (%s, %s, %s, %s, %s);",
-                (workout_id, exercise['name'], exercise['sets'], exercise['reps'], exercise['weight'])
-            )
+        for record in records:
+            user_id, date, duration, exercises, key = record_args(record)
+            cur.execute("SAVEPOINT ingest_record;")
+            try:
+                inserted = _insert_workout(cur, user_id, date, duration, exercises, key)
+            except (psycopg2.IntegrityError, psycopg2.DataError) as e:
+                cur.execute("ROLLBACK TO SAVEPOINT ingest_record;")
+                rejected.append((record, e))
+                continue
+            cur.execute("RELEASE SAVEPOINT ingest_record;")
+            if inserted is None:
+                duplicates += 1
+            else:
+                committed.append((user_id, date, duration, exercises, inserted[1]))
+        for user_id in dict.fromkeys(user_id for user_id, *_ in committed):
+            refresh_goal_progress(cur, user_id)
         conn.commit()
-        return True
+    for workout in committed:
+        _workout_committed(*workout)
+    return IngestResult(len(committed), duplicates, rejected)
+
+@instrumented
+def import_workouts(user_id, source, fmt=None):
+    """
+    Bulk imports workouts from a CSV/JSONL export (a path or an open text file).
+    Returns an import_fit.ImportResult whose errors list the rejected rows,
+    or None if the import failed as a whole.
+    """
+    if fmt is None:
+        fmt = detect_format(source if isinstance(source, str) else getattr(source, 'name', ''))
+    try:
+        fileobj = open(source, newline='', encoding='utf-8') if isinstance(source, str) else source
+    except OSError as e:
+        log_error("Error opening import file", e)
+        return None
+    try:
+        check_workout_date(latest_workout_date(premake=PARTITION_CONFIG['premake_months']))
+        with pooled_connection() as conn:
+            cur = conn.cursor()
+            result = import_records(cur, user_id, read_records(fileobj, fmt))
+            rebuild_progress(cur, user_id)
+            refresh_goal_progress(cur, user_id)
+            conn.commit()
+            invalidate_reads(user_id, 'workouts', 'insights', 'goals', 'progress')
+            if result.workouts_imported:
+                _update_leaderboard_cache('invalidate_user', user_id, result.first_date, result.last_date)
+            return result
     except Exception as e:
-        conn.rollback()
-        print(f"Error creating workout: {e}")
-        return False
+        log_error("Error importing workouts", e)
+        return None
     finally:
-        if conn: conn.close()
+        if fileobj is not source: fileobj.close()
 
-def read_workouts(user_id):
-    """Retrieves all workouts and exercises for a given user."""
-    conn = get_connection()
-    if not conn: return []
+@instrumented
+def export_data(out_dir, fmt='csv', user_id=None, tables=None, workers=WORKERS, chunk_size=CHUNK_SIZE):
+    """
+    Streams the users, workouts, exercises, goals and friends tables (or the
+    given `tables`) of one user, or of everyone when `user_id` is None, into
+    one CSV/JSONL/Parquet file per table under `out_dir` (see export_fit).
+    Returns an export_fit.ExportResult per table, or None on error.
+    """
     try:
-        cur = conn.cursor()
-        cur.execute(
-            """
-            SELECT
-                w.id, w.workout_date, w.duration_minutes,
-                e.exercise_name, e.sets, e.reps, e.weight_kg
-            FROM workouts w
-            JOIN exercises e ON w.id = e.workout_id
-            WHERE w.user_id = %s
-            ORDER BY w.workout_date DESC;
-            """,
-            (user_id,)
+        return export_tables(pooled_connection, out_dir, fmt, user_id, tables, workers, chunk_size)
+    except Exception as e:
+        log_error("Error exporting data", e)
+        return None
+
+def _workouts_query(user_id, limit=None, before=None, start_date=None, end_date=None, colocated=True):
+    """
+    Builds the workouts-with-exercises query, newest first.
+    Workouts are paged on (workout_date, id) before exercises are joined, so the
+    cost is bounded by the page size rather than by the length of the history.
+    Dates bound the page and the exercises join so that only the partitions of
+    the months read are scanned (`colocated=False` for the pre-partitioning layout).
+    """
+    conditions = ["user_id = %(user_id)s"]
+    params = {'user_id': user_id}
+    if start_date is not None:
+        conditions.append("workout_date >= %(start_date)s")
+        params['start_date'] = start_date
+    if end_date is not None:
+        conditions.append("workout_date <= %(end_date)s")
+        params['end_date'] = end_date
+    if before is not None:
+        conditions.append("workout_date <= %(before_date)s")
+        conditions.append("(workout_date, id) < (%(before_date)s, %(before_id)s)")
+        params['before_date'], params['before_id'] = before
+    limit_clause = ""
+    if limit is not None:
+        limit_clause = "LIMIT %(limit)s"
+        params['limit'] = limit
+    join = "p.id = e.workout_id"
+    if colocated:
+        join += " AND p.workout_date = e.workout_date"
+    query = f"""
+        WITH page AS (
+            SELECT id, workout_date, duration_minutes
+            FROM workouts
+            WHERE {' AND '.join(conditions)}
+            ORDER BY workout_date DESC, id DESC
+            {limit_clause}
         )
-        workout_data = cur.fetchall()
-        
-        workouts = {}
-        for row in workout_data:
-            workout_id, date, duration, name, sets, reps, weight = row
-            if workout_id not in workouts:
-                workouts[workout_id] = {
-                    'date': date,
-                    'duration': duration,
-                    'exercises': []
-                }
-            workouts[workout_id]['exercises'].append({
+        SELECT
+            p.id, p.workout_date, p.duration_minutes,
+            e.exercise_name, e.sets, e.reps, e.weight_kg
+        FROM page p
+        LEFT JOIN exercises e ON {join}
+        ORDER BY p.workout_date DESC, p.id DESC, e.id;
+    """
+    return query, params
+
+def _group_workout_rows(rows):
+    """Groups rows ordered by workout into workout dicts, yielding each one as soon as it is complete."""
+    current = None
+    for workout_id, date, duration, name, sets, reps, weight in rows:
+        if current is None or current['id'] != workout_id:
+            if current is not None:
+                yield current
+            current = {
+                'id': workout_id,
+                'date': date,
+                'duration': duration,
+                'exercises': []
+            }
+        if name is not None:
+            current['exercises'].append({
                 'name': name,
                 'sets': sets,
                 'reps': reps,
                 'weight': weight
             })
-        return list(workouts.values())
+    if current is not None:
+        yield current
+
+@instrumented
+def read_workouts(user_id, limit=None, before=None, start_date=None, end_date=None):
+    """
+    Retrieves workouts and their exercises for a given user, newest first.
+    `limit` caps the number of workouts; `before` is a (workout_date, id) key
+    from a previous page; `start_date`/`end_date` bound the dates (inclusive).
+    """
+    query, params = _workouts_query(user_id, limit, before, start_date, end_date)
+
+    def load():
+        with pooled_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(query, params)
+            return list(_group_workout_rows(cur.fetchall()))
+
+    try:
+        return cached_read(user_id, 'workouts', (limit, before, start_date, end_date), load)
     except Exception as e:
-        print(f"Error reading workouts: {e}")
+        log_error("Error reading workouts", e)
         return []
-    finally:
-        if conn: conn.close()
+
+@instrumented
+def read_workouts_page(user_id, page_size=20, before=None, start_date=None, end_date=None):
+    """
+    Retrieves one page of workouts.
+    Returns (workouts, next_before) where next_before is passed as `before`
+    to fetch the following page, or None when there are no more workouts.
+    """
+    workouts = read_workouts(user_id, page_size + 1, before, start_date, end_date)
+    if len(workouts) <= page_size:
+        return workouts, None
+    workouts = workouts[:page_size]
+    return workouts, (workouts[-1]['date'], workouts[-1]['id'])
+
+@instrumented
+def iter_workouts(user_id, start_date=None, end_date=None, batch_size=500):
+    """
+    Streams a user's workouts, newest first, through a server-side cursor.
+    Only `batch_size` rows are held in memory at a time; the pooled connection
+    is held until the generator is exhausted or closed.
+    """
+    query, params = _workouts_query(user_id, start_date=start_date, end_date=end_date)
+    try:
+        with pooled_connection() as conn:
+            cur = conn.cursor(name='iter_workouts')
+            cur.itersize = batch_size
+            cur.execute(query, params)
+            yield from _group_workout_rows(cur)
+            cur.close()
+    except Exception as e:
+        log_error("Error streaming workouts", e)
+
+@instrumented
+def read_workout_history(user_id, start_date=None, end_date=None, batch_size=5000):
+    """
+    Retrieves a user's workouts as a history_fit.WorkoutHistory: compact
+    column arrays built straight from a server-side cursor, oldest first,
+    for analytics over the whole history. Returns None on error.
+    """
+    def load():
+        with pooled_connection() as conn:
+            cur = conn.cursor(name='read_workout_history')
+            cur.itersize = batch_size
+            history = load_history(cur, user_id, start_date, end_date)
+            cur.close()
+            return history
+
+    try:
+        return cached_read(user_id, 'workouts', ('history', start_date, end_date), load)
+    except Exception as e:
+        log_error("Error reading workout history", e)
+        return None
 
 # --- CRUD Operations for Friends ---
 
+@instrumented
 def create_friendship(user_id, friend_email):
     """Adds a friend to a user's friend list."""
-    conn = get_connection()
-    if not conn: return False
-    try:
-        cur = conn.cursor()
-        cur.execute("SELECT id FROM users WHERE email = %s;", (friend_email,))
-        friend_id_data = cur.fetchone()
-        if not friend_id_data:
-            print("Friend not found.")
-            return False
-        friend_id = friend_id_data[0]
-
-        cur.execute(
-            "INSERT INTO friends (user_id, friend_id) VALUES (%s, %s);",
-            (user_id, friend_id)
-        )
-        conn.commit()
-        return True
-    except psycopg2.IntegrityError:
-        print("Friendship already exists.")
+    result = create_friendships(user_id, [friend_email])
+    if result is None:
         return False
-    except Exception as e:
-        print(f"Error adding friend: {e}")
+    if result['not_found']:
+        print("Friend not found.")
         return False
-    finally:
-        if conn: conn.close()
+    if result['already_friends']:
+        print("Friendship already exists.")
+        return False
+    return True
+
+def _select_friends(cur, user_id):
+    cur.execute(
+        "SELECT u.name, u.email FROM friends f JOIN users u ON f.friend_id = u.id WHERE f.user_id = %s;",
+        (user_id,)
+    )
+    return cur.fetchall()
 
+@instrumented
 def read_friends(user_id):
     """Retrieves a list of a user's friends."""
-    conn = get_connection()
-    if not conn: return []
     try:
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT u.name, u.email FROM friends f JOIN users u ON f.friend_id = u.id WHERE f.user_id = %s;",
-            (user_id,)
-        )
-        friends = cur.fetchall()
-        return friends
+        return cached_read(user_id, 'friends', (), lambda: run_query(_select_friends, user_id))
     except Exception as e:
-        print(f"Error reading friends: {e}")
+        log_error("Error reading friends", e)
         return []
-    finally:
-        if conn: conn.close()
 
+@instrumented
 def delete_friendship(user_id, friend_email):
     """Removes a friend from a user's friend list."""
-    conn = get_connection()
-    if not conn: return False
+    removed = delete_friendships(user_id, [friend_email])
+    if removed is None:
+        return False
+    if not removed:
+        print("Friend not found.")
+        return False
+    return True
+
+# --- Batch Friend Operations and Lookups ---
+
+FIND_USERS_QUERY = "SELECT email, id, name FROM users WHERE email = ANY(%s) AND deleted_at IS NULL;"
+
+ADD_FRIENDS_QUERY = """
+    WITH found AS (
+        SELECT id, name, email FROM users
+        WHERE email = ANY(%(emails)s) AND deleted_at IS NULL
+    ),
+    inserted AS (
+        INSERT INTO friends (user_id, friend_id)
+        SELECT %(user_id)s, id FROM found
+        ON CONFLICT DO NOTHING
+        RETURNING friend_id
+    )
+    SELECT f.email, f.id, f.name, i.friend_id IS NOT NULL
+    FROM found f
+    LEFT JOIN inserted i ON i.friend_id = f.id;
+"""
+
+REMOVE_FRIENDS_QUERY = """
+    DELETE FROM friends f
+    USING users u
+    WHERE f.user_id = %s AND f.friend_id = u.id AND u.email = ANY(%s)
+    RETURNING u.email, u.id;
+"""
+
+FRIENDS_OF_USERS_QUERY = """
+    SELECT f.user_id, u.id, u.name, u.email
+    FROM friends f
+    JOIN users u ON f.friend_id = u.id
+    WHERE f.user_id = ANY(%s)
+    ORDER BY f.user_id, u.name;
+"""
+
+def _friendships_added(user_id, emails, rows):
+    """Updates the caches for the rows of ADD_FRIENDS_QUERY and sorts the emails into the result dict."""
+    result = {'added': [], 'already_friends': [], 'not_found': []}
+    found = set()
+    for email, friend_id, friend_name, added in rows:
+        found.add(email)
+        result['added' if added else 'already_friends'].append(email)
+        if added:
+            _update_leaderboard_cache('add_friend', user_id, friend_id, friend_name)
+    result['not_found'] = [email for email in emails if email not in found]
+    if result['added']:
+        invalidate_reads(user_id, 'friends')
+    return result
+
+def _friendships_removed(user_id, removed):
+    """Updates the caches for the rows of REMOVE_FRIENDS_QUERY; returns the removed emails."""
+    for _, friend_id in removed:
+        _update_leaderboard_cache('remove_friend', user_id, friend_id)
+    if removed:
+        invalidate_reads(user_id, 'friends')
+    return [email for email, _ in removed]
+
+def _group_friends(user_ids, rows):
+    friends = {user_id: [] for user_id in user_ids}
+    for owner_id, friend_id, name, email in rows:
+        friends[owner_id].append((friend_id, name, email))
+    return friends
+
+@instrumented
+def find_users_by_email(emails):
+    """Looks up many users at once; returns {email: (id, name)} for the emails that exist."""
     try:
-        cur = conn.cursor()
-        cur.execute("SELECT id FROM users WHERE email = %s;", (friend_email,))
-        friend_id_data = cur.fetchone()
-        if not friend_id_data:
-            print("Friend not found.")
-            return False
-        friend_id = friend_id_data[0]
-
-        cur.execute(
-            "DELETE FROM friends WHERE user_id = %s AND friend_id = %s;",
-            (user_id, friend_id)
-        )
-        conn.commit()
-        return True
+        with pooled_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(FIND_USERS_QUERY, (list(emails),))
+            return {email: (user_id, name) for email, user_id, name in cur.fetchall()}
     except Exception as e:
-        print(f"Error deleting friend: {e}")
-        return False
-    finally:
-        if conn: conn.close()
+        log_error("Error looking up users", e)
+        return {}
+
+@instrumented
+def create_friendships(user_id, friend_emails):
+    """
+    Adds many friends by email in one statement.
+    Returns {'added': [...], 'already_friends': [...], 'not_found': [...]} lists
+    of emails, or None on error.
+    """
+    emails = list(dict.fromkeys(friend_emails))
+    try:
+        with pooled_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(ADD_FRIENDS_QUERY, {'user_id': user_id, 'emails': emails})
+            rows = cur.fetchall()
+            follow_backfill(cur, user_id, [friend_id for _, friend_id, _, added in rows if added])
+            conn.commit()
+    except Exception as e:
+        log_error("Error adding friends", e)
+        return None
+    return _friendships_added(user_id, emails, rows)
+
+@instrumented
+def delete_friendships(user_id, friend_emails):
+    """Removes many friends by email in one statement; returns the emails actually removed, or None on error."""
+    try:
+        with pooled_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(REMOVE_FRIENDS_QUERY, (user_id, list(friend_emails)))
+            removed = cur.fetchall()
+            unfollow_cleanup(cur, user_id, [friend_id for _, friend_id in removed])
+            conn.commit()
+    except Exception as e:
+        log_error("Error removing friends", e)
+        return None
+    return _friendships_removed(user_id, removed)
+
+@instrumented
+def read_friends_of_users(user_ids):
+    """Retrieves the friend lists of many users in one query; returns {user_id: [(friend_id, name, email), ...]}."""
+    user_ids = list(user_ids)
+    try:
+        with pooled_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(FRIENDS_OF_USERS_QUERY, (user_ids,))
+            rows = cur.fetchall()
+    except Exception as e:
+        log_error("Error reading friends", e)
+        return {}
+    return _group_friends(user_ids, rows)
+
+# --- Activity Feed ---
+
+@instrumented
+def read_feed(user_id, page_size=20, before=None):
+    """
+    Retrieves one page of a user's activity feed (their own and their friends'
+    workouts, newest first) as feed_fit.FeedItem tuples.
+    Returns (items, next_before) where next_before is passed as `before`
+    to fetch the following page, or None when there are no more items.
+    """
+    try:
+        return run_query(read_feed_page, user_id, page_size, before)
+    except Exception as e:
+        log_error("Error reading activity feed", e)
+        return [], None
 
 # --- CRUD Operations for Goals ---
 
-def create_goal(user_id, description, target_value):
-    """Creates a new fitness goal."""
-    conn = get_connection()
-    if not conn: return False
+@instrumented
+def create_goal(user_id, description, target_value, metric=None, period=None, exercise_name=None):
+    """
+    Creates a new fitness goal.
+    With a `metric` ('minutes', 'workouts', 'volume' or 'max_weight'), an
+    optional `period` ('week', 'month' or 'all_time') and, for max_weight, an
+    optional `exercise_name`, the goal tracks its progress from the user's
+    workouts; without one its current_value is entered by hand.
+    """
     try:
-        cur = conn.cursor()
-        cur.execute(
-            "INSERT INTO goals (user_id, description, target_value) VALUES (%s, %s, %s);",
-            (user_id, description, target_value)
-        )
-        conn.commit()
-        return True
+        validate_goal(metric, period, exercise_name)
+        with pooled_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                INSERT INTO goals (user_id, description, target_value, metric, period, exercise_name)
+                VALUES (%s, %s, %s, %s, %s, %s);
+                """,
+                (user_id, description, target_value, metric, period, exercise_name)
+            )
+            if metric is not None:
+                refresh_goal_progress(cur, user_id)
+            conn.commit()
+            invalidate_reads(user_id, 'goals')
+            return True
     except Exception as e:
-        print(f"Error creating goal: {e}")
+        log_error("Error creating goal", e)
         return False
-    finally:
-        if conn: conn.close()
 
+@instrumented
 def read_goals(user_id):
-    """Retrieves a user's goals."""
-    conn = get_connection()
-    if not conn: return []
+    """
+    Retrieves all of a user's goals with their progress in one query.
+    Returns goals_fit.GoalProgress tuples; tracked goals report their live
+    value for the current week/month, so no per-goal work is left to the caller.
+    """
     try:
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT id, description, target_value, current_value FROM goals WHERE user_id = %s;",
-            (user_id,)
-        )
-        goals = cur.fetchall()
-        return goals
+        return cached_read(user_id, 'goals', (), lambda: run_query(read_goal_progress, user_id))
     except Exception as e:
-        print(f"Error reading goals: {e}")
+        log_error("Error reading goals", e)
         return []
-    finally:
-        if conn: conn.close()
 
+@instrumented
 def update_goal(goal_id, description, target_value, current_value):
-    """Updates a fitness goal."""
-    conn = get_connection()
-    if not conn: return False
+    """Updates a fitness goal. current_value is ignored for goals tracked from workouts."""
     try:
-        cur = conn.cursor()
-        cur.execute(
-            "UPDATE goals SET description = %s, target_value = %s, current_value = %s WHERE id = %s;",
-            (description, target_value, current_value, goal_id)
-        )
-        conn.commit()
-        return True
+        with pooled_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                UPDATE goals
+                SET description = %s, target_value = %s,
+                    current_value = CASE WHEN metric IS NULL THEN %s ELSE current_value END
+                WHERE id = %s
+                RETURNING user_id;
+                """,
+                (description, target_value, current_value, goal_id)
+            )
+            owner = cur.fetchone()
+            conn.commit()
+            if owner:
+                invalidate_reads(owner[0], 'goals')
+            return True
     except Exception as e:
-        print(f"Error updating goal: {e}")
+        log_error("Error updating goal", e)
         return False
-    finally:
-        if conn: conn.close()
 
+@instrumented
 def delete_goal(goal_id):
     """Deletes a fitness goal."""
-    conn = get_connection()
-    if not conn: return False
     try:
-        cur = conn.cursor()
-        cur.execute("DELETE FROM goals WHERE id = %s;", (goal_id,))
-        conn.commit()
-        return True
+        with pooled_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("DELETE FROM goals WHERE id = %s RETURNING user_id;", (goal_id,))
+            owner = cur.fetchone()
+            conn.commit()
+            if owner:
+                invalidate_reads(owner[0], 'goals')
+            return True
     except Exception as e:
-        print(f"Error deleting goal: {e}")
+        log_error("Error deleting goal", e)
         return False
-    finally:
-        if conn: conn.close()
 
 # --- Business Insights and Leaderboard ---
 
+@instrumented
+def get_exercise_progress(user_id):
+    """
+    Per-exercise progression for the Progress page: records, estimated 1RM,
+    weekly volume trend and plateau flag (progression_fit.ExerciseProgress),
+    read from the precomputed progression tables in one query.
+    """
+    try:
+        return cached_read(user_id, 'progress', (), lambda: run_query(read_progress, user_id))
+    except Exception as e:
+        log_error("Error reading exercise progress", e)
+        return []
+
+@instrumented
 def get_business_insights(user_id):
     """
     Provides various business insights using aggregate functions.
-    The insights are for the current user.
+    The insights are for the current user and are read from the stats
+    rollups in a single round trip (or from the read cache); see
+    insights_fit.Insights for the available metrics.
     """
-    conn = get_connection()
-    if not conn: return None
     try:
-        cur = conn.cursor()
-        insights = {}
-        
-        # Total workouts COUNT
-        cur.execute("SELECT COUNT(*) FROM workouts WHERE user_id = %s;", (user_id,))
-        insights['total_workouts'] = cur.fetchone()[0]
-        
-        # Total workout duration SUM
-        cur.execute("SELECT SUM(duration_minutes) FROM workouts WHERE user_id = %s;", (user_id,))
-        insights['total_duration'] = cur.fetchone()[0] or 0
-        
-        # Average workout duration AVG
-        cur.execute("SELECT AVG(duration_minutes) FROM workouts WHERE user_id = %s;", (user_id,))
-        insights['avg_duration'] = cur.fetchone()[0] or 0
-        
-        # Max weight lifted (across all exercises) MAX
-        cur.execute("""
-            SELECT MAX(e.weight_kg) FROM exercises e
-            JOIN workouts w ON e.workout_id = w.id
-            WHERE w.user_id = %s;
-        """, (user_id,))
-        insights['max_weight_lifted'] = cur.fetchone()[0] or 0
-        
-        # Min duration MIN
-        cur.execute("SELECT MIN(duration_minutes) FROM workouts WHERE user_id = %s;", (user_id,))
-        insights['min_duration'] = cur.fetchone()[0] or 0
-        
-        return insights
+        return cached_read(user_id, 'insights', (), lambda: run_query(read_insights, user_id))
     except Exception as e:
-        print(f"Error getting business insights: {e}")
+        log_error("Error getting business insights", e)
         return None
-    finally:
-        if conn: conn.close()
 
-def get_leaderboard(user_id, metric='total_workout_minutes'):
+@instrumented
+def get_leaderboard(user_id, metric='total_workout_minutes', window='week', limit=None):
     """
-    Generates a leaderboard based on a selected metric.
-    Ranks the user and their friends.
+    Generates a leaderboard based on a selected metric ('minutes', 'workouts'
+    or 'volume') over a window ('week', 'month' or 'all_time').
+    Ranks the user and their friends and returns a leaderboard_fit.Leaderboard
+    whose `position` is the user's own row. Served from the leaderboard cache
+    when it is enabled.
     """
-    conn = get_connection()
-    if not conn: return []
     try:
-        cur = conn.cursor()
-        
-        # Get the user's friends' IDs and the user's own ID
-        cur.execute(
-            "SELECT friend_id FROM friends WHERE user_id = %s;",
-            (user_id,)
-        )
-        friend_ids = [row[0] for row in cur.fetchall()]
-        all_ids = friend_ids + [user_id]
-        
-        if not all_ids:
-            return []
-
-        # Get total workout minutes for each user (including the current user and friends)
-        placeholders = ','.join(['%s'] * len(all_ids))
-        query = f"""
-            SELECT u.name, SUM(w.duration_minutes) AS total_minutes
-            FROM users u
-            JOIN workouts w ON u.id = w.user_id
-            WHERE u.id IN ({placeholders})
-            GROUP BY u.name
-            ORDER BY total_minutes DESC;
-        """
-        cur.execute(query, tuple(all_ids))
-        
-        leaderboard = cur.fetchall()
-        return leaderboard
+        cache = get_leaderboard_cache()
+        if cache is not None:
+            return cache.friend_board(user_id, metric, window, limit)
+        with pooled_connection() as conn:
+            cur = conn.cursor()
+            return compute_leaderboard(cur, user_id, metric, window, limit)
+    except Exception as e:
+        log_error("Error getting leaderboard", e)
+        return None
+
+@instrumented
+def get_global_leaderboard(metric='minutes', window='week', limit=10):
+    """Ranks all users; returns a list of leaderboard_fit.LeaderboardRow."""
+    try:
+        cache = get_leaderboard_cache()
+        if cache is None:
+            cache = LeaderboardCache(make_store({'backend': 'local'}), run_query)
+        return cache.global_board(metric, window, limit)
     except Exception as e:
-        print(f"Error getting leaderboard: {e}")
+        log_error("Error getting global leaderboard", e)
         return []
-    finally:
-        if conn: conn.close()
\ No newline at end of file
+
+@instrumented
+def get_global_rank(user_id, metric='minutes', window='week'):
+    """Returns a user's rank among all users."""
+    try:
+        cache = get_leaderboard_cache()
+        if cache is None:
+            cache = LeaderboardCache(make_store({'backend': 'local'}), run_query)
+        return cache.global_rank(user_id, metric, window)
+    except Exception as e:
+        log_error("Error getting global rank", e)
+        return None
@@ -0,0 +1,441 @@
+import argparse
+import asyncio
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timezone
+
+import backend_fit as db
+from datagen_fit import DatasetSize, clean, generate
+from insights_fit import compute_insights, read_insights
+from instrumentation_fit import metrics
+from stats_fit import rebuild_user_stats
+
+# Benchmarks for backend_fit against a local Postgres (DATABASE_CONFIG).
+# Usage: python benchmark_fit.py insights --workouts 10000 --runs 50
+#        python benchmark_fit.py dashboard --workouts 10000 --runs 50
+#        python benchmark_fit.py history --workouts 10000 --runs 5
+#        python benchmark_fit.py suite --sizes 100,1000 --concurrency 1,4,16 --output results.json
+#        python benchmark_fit.py compare baseline.json results.json
+
+BENCH_EMAIL_PREFIX = 'bench+'
+
+
+class CountingCursor:
+    """Cursor wrapper that counts statements sent to the server."""
+
+    def __init__(self, cur):
+        self._cur = cur
+        self.round_trips = 0
+
+    def execute(self, query, params=None):
+        self.round_trips += 1
+        return self._cur.execute(query, params)
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+
+def legacy_business_insights(cur, user_id):
+    """The original five-query implementation of get_business_insights, kept for comparison."""
+    insights = {}
+    cur.execute("SELECT COUNT(*) FROM workouts WHERE user_id = %s;", (user_id,))
+    insights['total_workouts'] = cur.fetchone()[0]
+    cur.execute("SELECT SUM(duration_minutes) FROM workouts WHERE user_id = %s;", (user_id,))
+    insights['total_duration'] = cur.fetchone()[0] or 0
+    cur.execute("SELECT AVG(duration_minutes) FROM workouts WHERE user_id = %s;", (user_id,))
+    insights['avg_duration'] = cur.fetchone()[0] or 0
+    cur.execute("""
+        SELECT MAX(e.weight_kg) FROM exercises e
+        JOIN workouts w ON e.workout_id = w.id
+        WHERE w.user_id = %s;
+    """, (user_id,))
+    insights['max_weight_lifted'] = cur.fetchone()[0] or 0
+    cur.execute("SELECT MIN(duration_minutes) FROM workouts WHERE user_id = %s;", (user_id,))
+    insights['min_duration'] = cur.fetchone()[0] or 0
+    return insights
+
+
+def seed_user(cur, workouts, exercises_per_workout=3):
+    """Creates a throwaway user with the given number of workouts; returns the user id."""
+    cur.execute(
+        "INSERT INTO users (name, email, weight_kg) VALUES (%s, %s, %s) RETURNING id;",
+        ('Benchmark User', f"{BENCH_EMAIL_PREFIX}{time.time_ns()}@example.com", 80)
+    )
+    user_id = cur.fetchone()[0]
+    cur.execute(
+        """
+        INSERT INTO workouts (user_id, workout_date, duration_minutes)
+        SELECT %s, CURRENT_DATE - (g / 2), 20 + (g %% 70)
+        FROM generate_series(1, %s) AS g;
+        """,
+        (user_id, workouts)
+    )
+    cur.execute(
+        """
+        INSERT INTO exercises (workout_id, workout_date, exercise_name, sets, reps, weight_kg)
+        SELECT w.id, w.workout_date, (ARRAY['Squat', 'Bench Press', 'Deadlift', 'Row', 'Press'])[1 + (w.id + g) %% 5],
+               3 + (g %% 3), 5 + (w.id %% 8), 20 + ((w.id * 7 + g * 13) %% 150)
+        FROM workouts w, generate_series(1, %s) AS g
+        WHERE w.user_id = %s;
+        """,
+        (exercises_per_workout, user_id)
+    )
+    return user_id
+
+
+def time_runs(conn, fn, user_id, runs):
+    """Runs fn(cur, user_id) `runs` times; returns (latencies in ms, round trips per call)."""
+    latencies = []
+    round_trips = 0
+    for _ in range(runs):
+        cur = CountingCursor(conn.cursor())
+        started = time.perf_counter()
+        fn(cur, user_id)
+        latencies.append((time.perf_counter() - started) * 1000)
+        round_trips = cur.round_trips
+        conn.rollback()
+    return latencies, round_trips
+
+
+def report(label, latencies, round_trips):
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"{label:<12} round trips={round_trips:<3} "
+          f"median={statistics.median(latencies):8.2f} ms  p95={p95:8.2f} ms  "
+          f"min={latencies[0]:8.2f} ms")
+
+
+def bench_insights(workouts, runs):
+    """Compares the legacy five-query insights against the single-statement engine."""
+    with db.pooled_connection() as conn:
+        cur = conn.cursor()
+        user_id = seed_user(cur, workouts)
+        rebuild_user_stats(cur, user_id)
+        conn.commit()
+        try:
+            cur.execute("ANALYZE workouts; ANALYZE exercises;")
+            conn.commit()
+            # Warm the caches so both variants read from shared buffers.
+            legacy_business_insights(cur, user_id)
+            compute_insights(cur, user_id)
+            read_insights(cur, user_id)
+            conn.rollback()
+
+            print(f"get_business_insights, user with {workouts} workouts, {runs} runs each")
+            report('five-query', *time_runs(conn, legacy_business_insights, user_id, runs))
+            report('scan', *time_runs(conn, compute_insights, user_id, runs))
+            report('rollup', *time_runs(conn, read_insights, user_id, runs))
+        finally:
+            cur = conn.cursor()
+            cur.execute("DELETE FROM users WHERE id = %s;", (user_id,))
+            conn.commit()
+
+
+def bench_dashboard(workouts, runs):
+    """Compares loading the Dashboard sequentially (sync) against async_backend_fit.load_dashboard."""
+    import async_backend_fit
+
+    # Measure the database path, not the read cache.
+    db.READ_CACHE_CONFIG['enabled'] = False
+    with db.pooled_connection() as conn:
+        cur = conn.cursor()
+        user_id = seed_user(cur, workouts)
+        rebuild_user_stats(cur, user_id)
+        for target in (5, 10, 20):
+            cur.execute(
+                "INSERT INTO goals (user_id, description, target_value) VALUES (%s, %s, %s);",
+                (user_id, f"Benchmark goal {target}", target)
+            )
+        conn.commit()
+
+    def load_sync():
+        db.read_goals(user_id)
+        db.read_workouts(user_id, limit=3)
+        db.get_business_insights(user_id)
+
+    async def timed_async():
+        latencies = []
+        await async_backend_fit.load_dashboard(user_id)  # warm-up, opens the async pool
+        for _ in range(runs):
+            started = time.perf_counter()
+            await async_backend_fit.load_dashboard(user_id)
+            latencies.append((time.perf_counter() - started) * 1000)
+        await async_backend_fit.close_pool()
+        return latencies
+
+    try:
+        load_sync()  # warm-up
+        sync_latencies = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            load_sync()
+            sync_latencies.append((time.perf_counter() - started) * 1000)
+        async_latencies = asyncio.run(timed_async())
+
+        print(f"Dashboard load, user with {workouts} workouts, {runs} runs each")
+        report('sync', sync_latencies, 3)
+        report('async', async_latencies, 3)
+    finally:
+        with db.pooled_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("DELETE FROM users WHERE id = %s;", (user_id,))
+            conn.commit()
+
+
+def bench_history(workouts, runs):
+    """Compares read_workouts (dicts) with read_workout_history (column arrays) over a full history."""
+    db.READ_CACHE_CONFIG['enabled'] = False
+    with db.pooled_connection() as conn:
+        cur = conn.cursor()
+        user_id = seed_user(cur, workouts)
+        conn.commit()
+
+    def dict_prs(rows):
+        best = {}
+        for workout in rows:
+            for exercise in workout['exercises']:
+                if exercise['weight'] is not None and exercise['weight'] > best.get(exercise['name'], 0):
+                    best[exercise['name']] = exercise['weight']
+        return best
+
+    variants = [
+        ('dicts', lambda: db.read_workouts(user_id), dict_prs),
+        ('columnar', lambda: db.read_workout_history(user_id), lambda history: history.personal_records()),
+    ]
+    try:
+        print(f"Full history, user with {workouts} workouts, {runs} runs each")
+        for label, load, prs in variants:
+            tracemalloc.start()
+            result = load()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            load_latencies, pr_latencies = [], []
+            for _ in range(runs):
+                started = time.perf_counter()
+                result = load()
+                load_latencies.append((time.perf_counter() - started) * 1000)
+                started = time.perf_counter()
+                prs(result)
+                pr_latencies.append((time.perf_counter() - started) * 1000)
+            print(f"{label:<12} peak memory={peak / 2 ** 20:8.1f} MiB  "
+                  f"load median={statistics.median(load_latencies):8.2f} ms  "
+                  f"PRs median={statistics.median(pr_latencies):8.2f} ms")
+    finally:
+        with db.pooled_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("DELETE FROM users WHERE id = %s;", (user_id,))
+            conn.commit()
+
+
+# --- Benchmark suite ---
+# Times the backend entry points on generated datasets (datagen_fit) of several
+# sizes and at several concurrency levels, and writes the results as JSON so
+# runs can be compared with `compare`.
+
+SUITE_WORKOUT = [
+    {'name': 'Squat', 'sets': 5, 'reps': 5, 'weight': 100.0},
+    {'name': 'Bench Press', 'sets': 3, 'reps': 8, 'weight': 70.0},
+    {'name': 'Pull-up', 'sets': 3, 'reps': 10, 'weight': None},
+]
+
+# Entry point name (as reported by instrumentation_fit) -> fn(user_id, rng)
+SUITE_ENTRY_POINTS = {
+    'read_workouts': lambda user_id, rng: db.read_workouts(user_id, limit=20),
+    'get_leaderboard': lambda user_id, rng: db.get_leaderboard(user_id),
+    'get_business_insights': lambda user_id, rng: db.get_business_insights(user_id),
+    'create_workout': lambda user_id, rng: db.create_workout(user_id, date.today(), rng.randint(20, 90), SUITE_WORKOUT),
+}
+
+
+def percentiles(latencies):
+    """Nearest-rank p50/p95/p99 plus mean and max of a list of latencies."""
+    if not latencies:
+        return {'p50': None, 'p95': None, 'p99': None, 'mean': None, 'max': None}
+    ordered = sorted(latencies)
+
+    def rank(pct):
+        return ordered[min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))]
+
+    return {'p50': rank(50), 'p95': rank(95), 'p99': rank(99),
+            'mean': statistics.fmean(ordered), 'max': ordered[-1]}
+
+
+def _errors(function):
+    series = metrics.functions.get(function)
+    return series.errors if series else 0
+
+
+def run_load(name, call, user_ids, concurrency, calls, seed=1):
+    """Makes `calls` calls spread over `concurrency` threads; returns a result dict."""
+    per_worker = [calls // concurrency + (index < calls % concurrency) for index in range(concurrency)]
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        latencies = []
+        for _ in range(per_worker[index]):
+            user_id = rng.choice(user_ids)
+            started = time.perf_counter()
+            call(user_id, rng)
+            latencies.append((time.perf_counter() - started) * 1000)
+        return latencies
+
+    errors_before = _errors(name)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = [ms for result in executor.map(worker, range(concurrency)) for ms in result]
+    wall = time.perf_counter() - started
+    errors = _errors(name) - errors_before
+    return {
+        'entry_point': name,
+        'concurrency': concurrency,
+        'calls': len(latencies),
+        'errors': errors,
+        'error_rate': errors / len(latencies) if latencies else 0.0,
+        'throughput_per_s': len(latencies) / wall if wall else None,
+        'latency_ms': percentiles(latencies),
+    }
+
+
+def _run_metadata(args):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    with db.pooled_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SHOW server_version;")
+        server_version = cur.fetchone()[0]
+    return {
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'postgres': server_version,
+        'pool': dict(db.POOL_CONFIG),
+        'caches': args.with_caches,
+        'seed': args.seed,
+        'years': args.years,
+    }
+
+
+def bench_suite(args):
+    """Generates each dataset size, times every entry point at every concurrency level."""
+    if not args.with_caches:
+        db.READ_CACHE_CONFIG['enabled'] = False
+        db.LEADERBOARD_CACHE_CONFIG['enabled'] = False
+    db.POOL_CONFIG['maxconn'] = max(db.POOL_CONFIG['maxconn'], max(args.concurrency))
+    entry_points = {name: SUITE_ENTRY_POINTS[name] for name in args.entry_points}
+    report_data = {'meta': _run_metadata(args), 'results': []}
+
+    for users in args.sizes:
+        with db.pooled_connection() as conn:
+            clean(conn)
+            dataset = generate(conn, DatasetSize(users=users, years=args.years), args.seed)
+        print(f"Dataset: {users} users, {dataset.workouts} workouts, {dataset.exercises} exercises "
+              f"({dataset.seconds:.1f}s to generate)")
+        try:
+            for name, call in entry_points.items():
+                run_load(name, call, dataset.user_ids, 1, min(10, args.calls), args.seed)  # warm-up
+                for concurrency in args.concurrency:
+                    result = run_load(name, call, dataset.user_ids, concurrency, args.calls, args.seed)
+                    result.update(users=users, workouts=dataset.workouts, exercises=dataset.exercises)
+                    report_data['results'].append(result)
+                    latency = result['latency_ms']
+                    print(f"  {name:<24} c={concurrency:<3} {result['throughput_per_s']:8.1f} calls/s  "
+                          f"p50={latency['p50']:8.2f} ms  p95={latency['p95']:8.2f} ms  "
+                          f"p99={latency['p99']:8.2f} ms  errors={result['errors']}")
+        finally:
+            if not args.keep_data:
+                with db.pooled_connection() as conn:
+                    clean(conn)
+
+    if args.output == '-':
+        json.dump(report_data, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report_data, f, indent=2)
+        print(f"Results written to {args.output}")
+    return report_data
+
+
+def compare_results(baseline_path, current_path, threshold=0.10, metric='p95'):
+    """Prints per-case latency changes between two suite runs; returns the regressed cases."""
+    def load(path):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        return {(r['users'], r['entry_point'], r['concurrency']): r for r in data['results']}
+
+    baseline, current = load(baseline_path), load(current_path)
+    regressions = []
+    for key in sorted(baseline.keys() & current.keys()):
+        before = baseline[key]['latency_ms'][metric]
+        after = current[key]['latency_ms'][metric]
+        change = (after - before) / before if before else 0.0
+        flag = ''
+        if change > threshold or current[key]['error_rate'] > baseline[key]['error_rate']:
+            regressions.append(key)
+            flag = '  REGRESSION'
+        users, name, concurrency = key
+        print(f"{users:>7} users  {name:<24} c={concurrency:<3} {metric} {before:8.2f} -> {after:8.2f} ms "
+              f"({change:+.1%}){flag}")
+    for key in sorted(baseline.keys() ^ current.keys()):
+        print(f"Only in {'baseline' if key in baseline else 'current'}: {key}")
+    return regressions
+
+
+def _int_list(value):
+    return [int(part) for part in value.split(',') if part]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="backend_fit benchmarks")
+    sub = parser.add_subparsers(dest='command', required=True)
+    insights = sub.add_parser('insights', help="get_business_insights: five queries vs. single scan vs. rollup")
+    insights.add_argument('--workouts', type=int, default=10000)
+    insights.add_argument('--runs', type=int, default=50)
+    dashboard = sub.add_parser('dashboard', help="Dashboard reads: sequential sync vs. concurrent async")
+    dashboard.add_argument('--workouts', type=int, default=10000)
+    dashboard.add_argument('--runs', type=int, default=50)
+    history = sub.add_parser('history', help="Full history: dicts vs. column arrays")
+    history.add_argument('--workouts', type=int, default=10000)
+    history.add_argument('--runs', type=int, default=5)
+    suite = sub.add_parser('suite', help="Entry points x dataset sizes x concurrency, as JSON")
+    suite.add_argument('--sizes', type=_int_list, default=[100, 1000], help="Comma-separated user counts")
+    suite.add_argument('--concurrency', type=_int_list, default=[1, 4, 16])
+    suite.add_argument('--calls', type=int, default=200, help="Calls per entry point and concurrency level")
+    suite.add_argument('--entry-points', type=lambda v: v.split(','), default=list(SUITE_ENTRY_POINTS))
+    suite.add_argument('--years', type=float, default=2.0)
+    suite.add_argument('--seed', type=int, default=1)
+    suite.add_argument('--output', default='benchmark_results.json', help="JSON file, or - for stdout")
+    suite.add_argument('--keep-data', action='store_true', help="Keep the last generated dataset")
+    suite.add_argument('--with-caches', action='store_true', help="Measure with the read/leaderboard caches on")
+    compare = sub.add_parser('compare', help="Compare two suite result files")
+    compare.add_argument('baseline')
+    compare.add_argument('current')
+    compare.add_argument('--threshold', type=float, default=0.10, help="Allowed relative slowdown")
+    compare.add_argument('--metric', choices=('p50', 'p95', 'p99', 'mean'), default='p95')
+    args = parser.parse_args()
+
+    if args.command == 'insights':
+        bench_insights(args.workouts, args.runs)
+    elif args.command == 'dashboard':
+        bench_dashboard(args.workouts, args.runs)
+    elif args.command == 'history':
+        bench_history(args.workouts, args.runs)
+    elif args.command == 'suite':
+        bench_suite(args)
+    elif args.command == 'compare':
+        if compare_results(args.baseline, args.current, args.threshold, args.metric):
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Small in-process cache with LRU eviction and a per-entry time to live.
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize=1024, ttl=60.0, on_evict=None):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1.")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict  # called as on_evict(key, value) whenever an entry leaves the cache
+        self._data = OrderedDict()  # key -> (expires_at, value), least recently used first
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _expired(self, expires_at, now):
+        return expires_at is not None and now >= expires_at
+
+    def _drop(self, key):
+        _, value = self._data.pop(key)
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+
+    def get(self, key, default=None):
+        """Returns the cached value, or `default` if it is missing or expired."""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            if self._expired(entry[0], time.monotonic()):
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def peek(self, key, default=None):
+        """Like get, but neither refreshes recency nor counts as a hit or miss."""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING or self._expired(entry[0], time.monotonic()):
+                return default
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        """Stores a value, evicting the least recently used entries if the cache is full."""
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (time.monotonic() + ttl if ttl is not None else None, value)
+            while len(self._data) > self.maxsize:
+                oldest = next(iter(self._data))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        """Removes an entry and returns its value."""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            self._drop(key)
+            return entry[1]
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._data):
+                self._drop(key)
+
+    def keys(self):
+        """Returns a snapshot of the keys currently stored (expired ones included)."""
+        with self._lock:
+            return list(self._data)
+
+    def __contains__(self, key):
+        return self.peek(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """Returns hit/miss counters and the current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+class ReadThroughCache:
+    """Per-user read-through cache: entries are keyed by (user_id, kind, args) and can be
+    invalidated for one user and kind without touching anyone else's entries."""
+
+    def __init__(self, maxsize=5000, ttl=30.0):
+        self._lock = threading.RLock()
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl, on_evict=self._unindex)
+        self._by_user = {}  # user_id -> keys of that user's entries
+        # user_id -> [loads in flight, generation]; the generation is bumped by
+        # invalidations and the entry is dropped when the last load finishes.
+        self._loading = {}
+
+    def _unindex(self, key, value):
+        # Called by the entry cache whenever an entry leaves it.
+        keys = self._by_user.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[key[0]]
+
+    def get_or_load(self, user_id, kind, args, loader):
+        """Returns the cached value for (user_id, kind, args), calling loader() on a miss.
+
+        Values are shared between callers and must not be mutated.
+        """
+        key = (user_id, kind, args)
+        with self._lock:
+            value = self._entries.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+            loading = self._loading.setdefault(user_id, [0, 0])
+            loading[0] += 1
+            generation = loading[1]
+        try:
+            value = loader()
+            with self._lock:
+                # Skip storing if a write invalidated this user while we were loading.
+                if loading[1] == generation:
+                    self._entries.set(key, value)
+                    self._by_user.setdefault(user_id, set()).add(key)
+            return value
+        finally:
+            with self._lock:
+                loading[0] -= 1
+                if not loading[0]:
+                    del self._loading[user_id]
+
+    def invalidate(self, user_id, *kinds):
+        """Drops a user's entries of the given kinds (all of them if no kind is given)."""
+        with self._lock:
+            loading = self._loading.get(user_id)
+            if loading is not None:
+                loading[1] += 1
+            for key in list(self._by_user.get(user_id, ())):
+                if not kinds or key[1] in kinds:
+                    self._entries.pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Hit/miss statistics of the underlying cache."""
+        with self._lock:
+            return self._entries.stats()
@@ -0,0 +1,305 @@
+import argparse
+import os
+import tempfile
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+
+from progression_fit import estimated_1rm
+from storage_fit import open_backend
+
+# Conformance checks for the storage engines (storage_fit.py). Every check
+# drives the public backend functions and compares what they return, so each
+# engine must give the same answers as PostgreSQL for the same calls.
+# Embedded engines run on a fresh temporary file; the postgres engine uses the
+# DATABASE_CONFIG database and deletes the users it created afterwards.
+# Usage: python conformance_fit.py --engine sqlite --engine sqlite+duckdb
+#        python conformance_fit.py --engine postgres
+
+ENGINES = {
+    'postgres': {'engine': 'postgres'},
+    'sqlite': {'engine': 'sqlite'},
+    'sqlite+duckdb': {'engine': 'sqlite', 'analytics': 'duckdb'},
+}
+
+
+class ConformanceFailure(Exception):
+    """Raised by a check when a backend returns something unexpected."""
+
+
+def expect(actual, expected, what):
+    if actual != expected:
+        raise ConformanceFailure(f"{what}: expected {expected!r}, got {actual!r}")
+
+
+class Fixture:
+    """Creates uniquely named users on one backend and remembers them for cleanup."""
+
+    def __init__(self, db):
+        self.db = db
+        self.prefix = f"conformance+{uuid.uuid4().hex[:8]}"
+        self.user_ids = []
+
+    def email(self, name):
+        return f"{self.prefix}-{name.lower()}@example.com"
+
+    def user(self, name, weight=70):
+        user_id = self.db.create_user(name, self.email(name), weight)
+        if user_id is None:
+            raise ConformanceFailure(f"create_user({name!r}) failed")
+        self.user_ids.append(user_id)
+        return user_id
+
+    def workout(self, user_id, day, duration, *exercises):
+        ok = self.db.create_workout(user_id, day, duration, [
+            {'name': name, 'sets': sets, 'reps': reps, 'weight': weight}
+            for name, sets, reps, weight in exercises
+        ])
+        expect(ok, True, "create_workout")
+
+    def cleanup(self):
+        for user_id in self.user_ids:
+            self.db.delete_user(user_id)
+
+
+# --- Checks ---
+
+def check_users(fx):
+    db = fx.db
+    ana = fx.user('Ana', Decimal('70.5'))
+    expect(db.read_user(ana), (ana, 'Ana', fx.email('Ana'), Decimal('70.5')), "read_user")
+    expect(db.create_user('Other', fx.email('Ana'), 60), None, "create_user with a taken email")
+    expect(db.find_user_by_email(fx.email('Ana')), (ana, 'Ana'), "find_user_by_email")
+    expect(db.update_user(ana, 'Ana B', fx.email('Ana'), 71), True, "update_user")
+    expect(db.read_user(ana), (ana, 'Ana B', fx.email('Ana'), Decimal(71)), "read_user after update")
+    expect(db.find_user_by_email(fx.email('Nobody')), None, "find_user_by_email for an unknown email")
+
+
+def check_workouts(fx):
+    db = fx.db
+    ana = fx.user('Ana')
+    today = date.today()
+    fx.workout(ana, today - timedelta(days=2), 30, ('Squat', 3, 5, Decimal('100')))
+    fx.workout(ana, today - timedelta(days=1), 45, ('Bench Press', 3, 8, Decimal('62.5')), ('Pull-up', 3, 10, None))
+    fx.workout(ana, today, 60)
+    workouts = db.read_workouts(ana)
+    expect([(w['date'], w['duration']) for w in workouts],
+           [(today, 60), (today - timedelta(days=1), 45), (today - timedelta(days=2), 30)], "read_workouts order")
+    expect(workouts[1]['exercises'], [
+        {'name': 'Bench Press', 'sets': 3, 'reps': 8, 'weight': Decimal('62.5')},
+        {'name': 'Pull-up', 'sets': 3, 'reps': 10, 'weight': None},
+    ], "read_workouts exercises")
+    expect(workouts[0]['exercises'], [], "workout without exercises")
+
+    page, before = db.read_workouts_page(ana, page_size=2)
+    expect(page, workouts[:2], "first page")
+    page, before = db.read_workouts_page(ana, page_size=2, before=before)
+    expect((page, before), (workouts[2:], None), "last page")
+    expect(list(db.iter_workouts(ana, batch_size=1)), workouts, "iter_workouts")
+    expect(db.read_workouts(ana, start_date=today - timedelta(days=1), end_date=today - timedelta(days=1)),
+           workouts[1:2], "read_workouts date range")
+
+    history = db.read_workout_history(ana)
+    expect(list(history.workout_ids), [w['id'] for w in reversed(workouts)], "read_workout_history order")
+    expect(history.personal_records(), {'Squat': 100.0, 'Bench Press': 62.5}, "history personal records")
+
+
+def check_idempotency(fx):
+    db = fx.db
+    ana, ben = fx.user('Ana'), fx.user('Ben')
+    exercises = [{'name': 'Squat', 'sets': 3, 'reps': 5, 'weight': Decimal('100')}]
+    for _ in range(2):
+        expect(db.create_workout(ana, date.today(), 30, exercises, idempotency_key='retry-1'), True,
+               "create_workout with an idempotency key")
+    expect(db.create_workout(ben, date.today(), 30, exercises, idempotency_key='retry-1'), True,
+           "the same key for another user")
+    expect([len(db.read_workouts(ana)), len(db.read_workouts(ben))], [1, 1], "workouts after a retry")
+    expect(db.get_business_insights(ana).total_volume, Decimal('1500'), "rollups after a retry")
+
+
+def check_friends(fx):
+    db = fx.db
+    ana, ben, cas = fx.user('Ana'), fx.user('Ben'), fx.user('Cas')
+    result = db.create_friendships(ana, [fx.email('Ben'), fx.email('Cas'), fx.email('Nobody'), fx.email('Ben')])
+    expect(result, {'added': [fx.email('Ben'), fx.email('Cas')], 'already_friends': [],
+                    'not_found': [fx.email('Nobody')]}, "create_friendships")
+    expect(db.create_friendship(ana, fx.email('Ben')), False, "create_friendship for an existing friend")
+    expect(sorted(db.read_friends(ana)), [('Ben', fx.email('Ben')), ('Cas', fx.email('Cas'))], "read_friends")
+    expect(db.find_users_by_email([fx.email('Ben'), fx.email('Nobody')]), {fx.email('Ben'): (ben, 'Ben')},
+           "find_users_by_email")
+    expect(db.read_friends_of_users([ana, ben]),
+           {ana: [(ben, 'Ben', fx.email('Ben')), (cas, 'Cas', fx.email('Cas'))], ben: []}, "read_friends_of_users")
+    expect(db.delete_friendships(ana, [fx.email('Cas'), fx.email('Nobody')]), [fx.email('Cas')], "delete_friendships")
+    expect(db.delete_friendship(ana, fx.email('Cas')), False, "delete_friendship for a removed friend")
+    expect(db.read_friends(ana), [('Ben', fx.email('Ben'))], "read_friends after delete")
+
+
+def check_goals(fx):
+    db = fx.db
+    ana = fx.user('Ana')
+    today = date.today()
+    fx.workout(ana, today, 30, ('Squat', 3, 5, Decimal('100')))
+    fx.workout(ana, today, 45, ('Squat', 3, 5, Decimal('90')))
+    expect(db.create_goal(ana, "Read a book", 10), True, "create_goal")
+    expect(db.create_goal(ana, "150 minutes", 150, 'minutes', 'week'), True, "create_goal tracked")
+    expect(db.create_goal(ana, "Squat 120", 120, 'max_weight', 'all_time', 'Squat'), True, "create_goal exercise")
+    expect(db.create_goal(ana, "Bad", 1, 'steps', 'week'), False, "create_goal with an unknown metric")
+    manual, minutes, squat = db.read_goals(ana)
+    expect(db.update_goal(manual.id, "Read two books", 10, 4), True, "update_goal")
+    expect(db.update_goal(minutes.id, "150 minutes", 150, 999), True, "update_goal tracked")
+    manual, minutes, squat = db.read_goals(ana)
+    expect((manual.description, manual.current_value, manual.progress), ("Read two books", 4, 0.4), "manual goal")
+    expect((minutes.metric, minutes.period, minutes.current_value, minutes.progress),
+           ('minutes', 'week', 75, 0.5), "tracked minutes goal")
+    expect((squat.exercise_name, squat.current_value), ('Squat', 100), "tracked exercise goal")
+    expect(db.delete_goal(manual.id), True, "delete_goal")
+    expect([goal.id for goal in db.read_goals(ana)], [minutes.id, squat.id], "read_goals after delete")
+
+
+def check_insights(fx):
+    db = fx.db
+    ana, ben = fx.user('Ana'), fx.user('Ben')
+    today = date.today()
+    fx.workout(ana, today - timedelta(days=14), 40, ('Squat', 3, 5, Decimal('100')), ('Bench Press', 3, 8, Decimal('60')))
+    fx.workout(ana, today, 60, ('Squat', 5, 5, Decimal('110')), ('Pull-up', 3, 10, None))
+    insights = db.get_business_insights(ana)
+    expect((insights.total_workouts, insights.total_duration, insights.min_duration, insights.max_duration),
+           (2, 100, 40, 60), "workout totals")
+    expect(round(float(insights.avg_duration), 6), 50.0, "avg_duration")
+    expect(insights.max_weight_lifted, Decimal('110'), "max_weight_lifted")
+    expect(insights.total_volume, Decimal('5690'), "total_volume")
+    expect(insights.exercise_prs, {'Bench Press': Decimal('60'), 'Squat': Decimal('110')}, "exercise_prs")
+    expect((insights.first_workout_date, insights.last_workout_date),
+           (today - timedelta(days=14), today), "first and last workout")
+    expect(insights.weekly_frequency, 2 / 3, "weekly_frequency")
+    expect(db.get_business_insights(ben).total_workouts, 0, "insights of a user without workouts")
+
+
+def check_leaderboard(fx):
+    db = fx.db
+    ana, ben, cas = fx.user('Ana'), fx.user('Ben'), fx.user('Cas')
+    db.create_friendships(ana, [fx.email('Ben'), fx.email('Cas')])
+    today = date.today()
+    fx.workout(ana, today, 60, ('Squat', 3, 5, Decimal('100')))
+    fx.workout(ben, today, 90)
+    board = db.get_leaderboard(ana, 'minutes', 'week')
+    expect([(row.rank, row.user_id, row.value) for row in board.rows],
+           [(1, ben, 90), (2, ana, 60), (3, cas, 0)], "friend leaderboard")
+    board = db.get_leaderboard(ana, 'volume', 'all_time', limit=1)
+    expect(([row.user_id for row in board.rows], board.position.rank, board.position.value),
+           ([ana], 1, Decimal('1500')), "limited volume leaderboard")
+    fx.workout(cas, today, 120)
+    board = db.get_leaderboard(ana, 'minutes', 'week')
+    expect([row.user_id for row in board.rows], [cas, ben, ana], "friend leaderboard after a new workout")
+    expect(db.get_global_rank(cas, 'minutes', 'week') < db.get_global_rank(ana, 'minutes', 'week'), True,
+           "global ranks")
+    top = db.get_global_leaderboard('minutes', 'week', limit=5)
+    expect([row.value for row in top], sorted((row.value for row in top), reverse=True), "global leaderboard order")
+
+
+def check_progress(fx):
+    db = fx.db
+    ana = fx.user('Ana')
+    today = date.today()
+    fx.workout(ana, today - timedelta(days=30), 45, ('Squat', 3, 5, Decimal('100')))
+    fx.workout(ana, today - timedelta(days=20), 45, ('Squat', 3, 5, Decimal('105')))
+    fx.workout(ana, today - timedelta(days=10), 45, ('Squat', 3, 5, Decimal('100')), ('Pull-up', 3, 10, None))
+    squat, pullup = sorted(db.get_exercise_progress(ana), key=lambda p: p.exercise != 'Squat')
+    expect((squat.best_weight, squat.best_e1rm, squat.sessions, squat.sessions_since_pr),
+           (Decimal('105'), estimated_1rm(105, 5), 3, 1), "Squat records")
+    expect((squat.last_pr_date, squat.pr_dates), (today - timedelta(days=20),
+           [today - timedelta(days=30), today - timedelta(days=20)]), "Squat PR dates")
+    expect(sum(squat.weekly_volume), Decimal('4575'), "Squat weekly volume")
+    expect((pullup.best_weight, pullup.last_pr_date, pullup.plateau), (None, None, False), "body-weight exercise")
+
+
+def check_feed(fx):
+    db = fx.db
+    ana, ben, cas = fx.user('Ana'), fx.user('Ben'), fx.user('Cas')
+    today = date.today()
+    fx.workout(ben, today - timedelta(days=1), 10)
+    db.create_friendships(ana, [fx.email('Ben')])
+    fx.workout(ben, today, 20)
+    fx.workout(cas, today, 30)
+    fx.workout(ana, today, 40, ('Squat', 3, 5, Decimal('100')))
+    items, before = db.read_feed(ana, page_size=2)
+    expect([(item.actor_id, item.duration) for item in items], [(ana, 40), (ben, 20)], "first feed page")
+    expect((items[0].actor_name, items[0].workout_date, items[0].exercise_count, items[0].volume),
+           ('Ana', today, 1, Decimal('1500')), "feed item")
+    items, before = db.read_feed(ana, page_size=2, before=before)
+    expect(([(item.actor_id, item.duration) for item in items], before), ([(ben, 10)], None), "last feed page")
+    expect([item.actor_id for item in db.read_feed(ben)[0]], [ben, ben], "feed without friends")
+    db.delete_friendships(ana, [fx.email('Ben')])
+    expect([item.actor_id for item in db.read_feed(ana)[0]], [ana], "feed after unfollowing")
+
+
+def check_cascade(fx):
+    db = fx.db
+    ana, ben = fx.user('Ana'), fx.user('Ben')
+    db.create_friendships(ben, [fx.email('Ana')])
+    fx.workout(ana, date.today(), 30, ('Squat', 3, 5, Decimal('100')))
+    db.create_goal(ana, "Goal", 10)
+    expect(db.delete_user(ana), True, "delete_user")
+    expect((db.read_user(ana), db.find_user_by_email(fx.email('Ana')), db.read_friends(ben)),
+           (None, None, []), "a deleted user")
+    expect(db.run_deletion_jobs() is not None, True, "run_deletion_jobs")
+    expect((db.read_workouts(ana), db.read_goals(ana)), ([], []), "data of a deleted user")
+
+
+CHECKS = [check_users, check_workouts, check_idempotency, check_friends, check_goals, check_insights,
+          check_leaderboard, check_progress, check_feed, check_cascade]
+
+
+def run_checks(db, checks=CHECKS):
+    """Runs the checks against one backend; returns [(name, error message or None)]."""
+    results = []
+    for check in checks:
+        fx = Fixture(db)
+        try:
+            check(fx)
+            results.append((check.__name__, None))
+        except Exception as e:
+            message = str(e) if isinstance(e, ConformanceFailure) else f"{type(e).__name__}: {e}"
+            results.append((check.__name__, message))
+        finally:
+            fx.cleanup()
+    return results
+
+
+def run_engine(name, checks=CHECKS):
+    """Runs the checks against a fresh instance of a named engine (see ENGINES)."""
+    config = dict(ENGINES[name])
+    if config['engine'] == 'postgres':
+        return run_checks(open_backend(config), checks)
+    with tempfile.TemporaryDirectory() as directory:
+        config['sqlite_path'] = os.path.join(directory, 'conformance.db')
+        db = open_backend(config)
+        try:
+            return run_checks(db, checks)
+        finally:
+            db.close_pool()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the storage conformance checks against each engine.")
+    parser.add_argument('--engine', action='append', choices=sorted(ENGINES),
+                        help="Engine to check (repeatable; default: sqlite)")
+    parser.add_argument('--check', action='append', choices=[check.__name__ for check in CHECKS],
+                        help="Only run these checks (repeatable)")
+    args = parser.parse_args()
+
+    checks = [check for check in CHECKS if not args.check or check.__name__ in args.check]
+    failed = 0
+    for name in args.engine or ['sqlite']:
+        print(f"{name}:")
+        for check, error in run_engine(name, checks):
+            print(f"  {'FAIL' if error else 'ok  '} {check}" + (f": {error}" if error else ""))
+            failed += error is not None
+    if failed:
+        print(f"{failed} check(s) failed.")
+        raise SystemExit(1)
+    print("All checks passed.")
+
+
+if __name__ == '__main__':
+    main()
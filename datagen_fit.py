@@ -0,0 +1,212 @@
+import argparse
+import io
+import math
+import random
+import time
+from datetime import date, timedelta
+from typing import NamedTuple
+
+from feed_fit import rebuild_feed
+from goals_fit import GOAL_METRICS, GOAL_PERIODS, refresh_goal_progress
+from partitions_fit import ensure_partitions
+from progression_fit import rebuild_progress
+from stats_fit import rebuild_user_stats
+
+# Synthetic data for the Database_Tracker schema, for benchmarks and load tests.
+# Generates users, a power-law friend graph (preferential attachment: most
+# users follow a few people, a few users are followed by very many) and years
+# of workouts with progressively heavier exercises, then rebuilds the rollups.
+# The same seed and end date always produce the same data. Rows are COPYed
+# in batches, so millions of exercises load in minutes.
+# Generated users have emails starting with GEN_EMAIL_PREFIX; `clean` deletes
+# them (and, through ON DELETE CASCADE, everything they own).
+# Usage: python datagen_fit.py generate --users 1000 --years 3 --seed 1
+#        python datagen_fit.py clean
+
+GEN_EMAIL_PREFIX = 'gen+'
+BATCH_USERS = 200
+
+# Exercise name -> working weight as a fraction of body weight (None: body weight only).
+EXERCISE_CATALOGUE = {
+    'Squat': 1.0, 'Bench Press': 0.75, 'Deadlift': 1.25, 'Overhead Press': 0.45,
+    'Barbell Row': 0.65, 'Pull-up': None, 'Lunge': 0.4, 'Bicep Curl': 0.2,
+}
+
+
+class DatasetSize(NamedTuple):
+    users: int = 1000
+    avg_friends: int = 5
+    years: float = 2.0
+    workouts_per_week: float = 3.0
+    exercises_per_workout: int = 4
+    goals_per_user: int = 2
+
+
+class Dataset(NamedTuple):
+    user_ids: list
+    friendships: int
+    workouts: int
+    exercises: int
+    seconds: float
+
+
+def _reserve_ids(cur, table, count):
+    """Takes `count` ids from a table's serial sequence."""
+    cur.execute(
+        "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s);",
+        (table, count)
+    )
+    return [row[0] for row in cur.fetchall()]
+
+
+def _copy(cur, table, columns, rows):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(r'\N' if value is None else str(value) for value in row))
+        buffer.write('\n')
+    buffer.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN;", buffer)
+
+
+def friend_graph(count, avg_friends, rng):
+    """Preferential-attachment edges (follower, followed) over user indexes 0..count-1."""
+    edges = []
+    weighted = []  # every user appears once, plus once per follower: attachment ~ popularity
+    for user in range(count):
+        wanted = min(avg_friends, user)
+        chosen = set()
+        while len(chosen) < wanted:
+            chosen.add(rng.choice(weighted))
+        for followed in chosen:
+            edges.append((user, followed))
+            weighted.append(followed)
+        weighted.append(user)
+    return edges
+
+
+def user_history(rng, body_weight, start, end, size):
+    """Workouts of one user as (date, duration, [(name, sets, reps, weight), ...]), oldest first."""
+    # Activity varies a lot between users; keep the requested mean.
+    rate = min(7.0, size.workouts_per_week * rng.lognormvariate(-0.125, 0.5)) / 7
+    favourites = rng.sample(list(EXERCISE_CATALOGUE), min(len(EXERCISE_CATALOGUE), size.exercises_per_workout + 2))
+    strength = {name: rng.uniform(0.7, 1.3) for name in favourites}
+    days = (end - start).days
+    history = []
+    for offset in range(days + 1):
+        if rng.random() >= rate:
+            continue
+        progress = offset / days if days else 1.0
+        exercises = []
+        for name in rng.sample(favourites, min(len(favourites), size.exercises_per_workout)):
+            ratio = EXERCISE_CATALOGUE[name]
+            weight = None
+            if ratio is not None:
+                # Fast early gains that flatten out, plus day-to-day noise; 2.5 kg plates.
+                kg = body_weight * ratio * strength[name] * (1 + 0.35 * math.sqrt(progress)) * rng.uniform(0.9, 1.05)
+                weight = round(kg / 2.5) * 2.5
+            exercises.append((name, rng.randint(3, 5), rng.choice((5, 6, 8, 10, 12)), weight))
+        history.append((start + timedelta(days=offset), rng.randint(20, 90), exercises))
+    return history
+
+
+def generate(conn, size=DatasetSize(), seed=1, end_date=None):
+    """Inserts a synthetic dataset and rebuilds the rollups; returns a Dataset."""
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    end = end_date or date.today()
+    start = end - timedelta(days=int(size.years * 365))
+    cur = conn.cursor()
+
+    user_ids = _reserve_ids(cur, 'users', size.users)
+    users = []
+    for index, user_id in enumerate(user_ids):
+        users.append((user_id, f"Generated User {index}", f"{GEN_EMAIL_PREFIX}{seed}-{index}@example.com",
+                      round(rng.uniform(50, 110), 1)))
+    _copy(cur, 'users', ('id', 'name', 'email', 'weight_kg'), users)
+    edges = friend_graph(size.users, size.avg_friends, rng)
+    _copy(cur, 'friends', ('user_id', 'friend_id'),
+          ((user_ids[a], user_ids[b]) for a, b in edges))
+    # Partitions up to the end date, which may be in the future (see partitions_fit).
+    ensure_partitions(cur, end)
+    conn.commit()
+
+    workouts = exercises = 0
+    goal_choices = [('minutes', 'week', 150), ('workouts', 'month', 12), ('volume', 'week', 20000),
+                    ('max_weight', 'all_time', 100)]
+    for batch_start in range(0, size.users, BATCH_USERS):
+        batch = users[batch_start:batch_start + BATCH_USERS]
+        histories = [user_history(rng, weight, start, end, size) for _, _, _, weight in batch]
+        ids = iter(_reserve_ids(cur, 'workouts', sum(map(len, histories))))
+        workout_rows, exercise_rows, goal_rows = [], [], []
+        for (user_id, _, _, _), history in zip(batch, histories):
+            for workout_date, duration, items in history:
+                workout_id = next(ids)
+                workout_rows.append((workout_id, user_id, workout_date.isoformat(), duration))
+                for name, sets, reps, weight in items:
+                    exercise_rows.append((workout_id, workout_date.isoformat(), name, sets, reps, weight))
+            for metric, period, target in rng.sample(goal_choices, min(size.goals_per_user, len(goal_choices))):
+                description = f"{GOAL_METRICS[metric]}: {target} ({GOAL_PERIODS[period].lower()})"
+                goal_rows.append((user_id, description, target, metric, period))
+        _copy(cur, 'workouts', ('id', 'user_id', 'workout_date', 'duration_minutes'), workout_rows)
+        _copy(cur, 'exercises', ('workout_id', 'workout_date', 'exercise_name', 'sets', 'reps', 'weight_kg'),
+              exercise_rows)
+        _copy(cur, 'goals', ('user_id', 'description', 'target_value', 'metric', 'period'), goal_rows)
+        conn.commit()
+        workouts += len(workout_rows)
+        exercises += len(exercise_rows)
+
+    # The rebuilds recompute the rollups from raw workouts, for every user.
+    rebuild_user_stats(cur)
+    rebuild_progress(cur)
+    rebuild_feed(cur)
+    for user_id in user_ids:
+        refresh_goal_progress(cur, user_id)
+    conn.commit()
+    conn.autocommit = True
+    try:
+        cur.execute("ANALYZE;")
+    finally:
+        conn.autocommit = False
+    return Dataset(user_ids, len(edges), workouts, exercises, time.perf_counter() - started)
+
+
+def clean(conn, email_prefix=GEN_EMAIL_PREFIX):
+    """Deletes every generated user; returns how many were removed."""
+    cur = conn.cursor()
+    cur.execute("DELETE FROM users WHERE email LIKE %s;", (email_prefix.replace('_', r'\_') + '%',))
+    deleted = cur.rowcount
+    conn.commit()
+    return deleted
+
+
+def main():
+    import backend_fit as db
+
+    parser = argparse.ArgumentParser(description="Fill the tracker database with synthetic data.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    defaults = DatasetSize()
+    gen = sub.add_parser('generate', help="Insert users, friendships, workouts and goals")
+    gen.add_argument('--users', type=int, default=defaults.users)
+    gen.add_argument('--avg-friends', type=int, default=defaults.avg_friends)
+    gen.add_argument('--years', type=float, default=defaults.years)
+    gen.add_argument('--workouts-per-week', type=float, default=defaults.workouts_per_week)
+    gen.add_argument('--exercises-per-workout', type=int, default=defaults.exercises_per_workout)
+    gen.add_argument('--seed', type=int, default=1)
+    gen.add_argument('--end-date', type=date.fromisoformat, help="Last day of generated history (default: today)")
+    sub.add_parser('clean', help="Delete all generated users and their data")
+    args = parser.parse_args()
+
+    with db.pooled_connection() as conn:
+        if args.command == 'generate':
+            size = DatasetSize(args.users, args.avg_friends, args.years,
+                               args.workouts_per_week, args.exercises_per_workout)
+            dataset = generate(conn, size, args.seed, args.end_date)
+            print(f"Generated {len(dataset.user_ids)} users, {dataset.friendships} friendships, "
+                  f"{dataset.workouts} workouts and {dataset.exercises} exercises "
+                  f"in {dataset.seconds:.1f}s.")
+        elif args.command == 'clean':
+            print(f"Deleted {clean(conn)} generated users.")
+
+
+if __name__ == '__main__':
+    main()
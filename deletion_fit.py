@@ -0,0 +1,334 @@
+import argparse
+import threading
+import time
+from typing import NamedTuple
+
+from instrumentation_fit import log_error
+
+# Account deletion in two phases, so deleting a long-time user never holds
+# locks on the hot tables for one long cascading transaction.
+#  1. tombstone_user (inside delete_user): one short transaction marks the user
+#     deleted, scrubs their name and email (the address can be registered
+#     again at once), removes their friendships in both directions and queues
+#     a row in deletion_jobs.
+#  2. Purge: DeletionWorker (or `python deletion_fit.py run`) deletes the
+#     user's dependent rows PURGE_STEPS in order, at most batch_size rows per
+#     transaction, recording the step and row counts in deletion_jobs. Rollups
+#     go first so tombstoned users drop out of leaderboard reloads quickly,
+#     then the feed, then the raw workouts. The last step deletes the users row
+#     itself; by then the ON DELETE CASCADE chains have nothing left to do.
+# Batches are throttled: after each one the worker sleeps at least `pause`
+# seconds, and longer when batches are slow, so deletion uses at most
+# `duty_cycle` of a connection's time. Jobs are claimed with FOR UPDATE SKIP
+# LOCKED and every batch is idempotent, so several processes can purge at once.
+# Usage: python deletion_fit.py run [--batch-size 1000]
+#        python deletion_fit.py status [--user-id N]
+
+BATCH_SIZE = 1000
+
+DELETION_DDL = """
+    ALTER TABLE users ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMPTZ;
+
+    -- One row per deletion request, kept after completion as a record.
+    -- No foreign key: the user row is gone once the job finishes.
+    CREATE TABLE IF NOT EXISTS deletion_jobs (
+        user_id INT PRIMARY KEY,
+        requested_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        finished_at TIMESTAMPTZ,
+        step VARCHAR(32) NOT NULL,
+        batches INT NOT NULL DEFAULT 0,
+        rows_deleted BIGINT NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS deletion_jobs_pending_idx
+        ON deletion_jobs (requested_at) WHERE finished_at IS NULL;
+"""
+
+# Deletes at most %(batch)s of a user's rows from one table. Rows are picked by
+# ctid so every step is a TID scan, whatever the table's key. ctids are only
+# unique within one table, so the partitioned workouts and exercises go by id.
+_BY_USER = """
+    DELETE FROM {table} WHERE ctid = ANY(ARRAY(
+        SELECT ctid FROM {table} WHERE {column} = %(user_id)s LIMIT %(batch)s
+    ));
+"""
+
+PURGE_STEPS = (
+    ('user_stats', _BY_USER.format(table='user_stats', column='user_id')),
+    ('user_stats_buckets', _BY_USER.format(table='user_stats_buckets', column='user_id')),
+    ('user_exercise_stats', _BY_USER.format(table='user_exercise_stats', column='user_id')),
+    # The user's events in their followers' timelines, then the events.
+    ('feed_deliveries', """
+        DELETE FROM feed_timelines WHERE ctid = ANY(ARRAY(
+            SELECT t.ctid
+            FROM feed_events e
+            JOIN feed_timelines t ON t.event_id = e.id
+            WHERE e.actor_id = %(user_id)s
+            LIMIT %(batch)s
+        ));
+    """),
+    ('feed_events', _BY_USER.format(table='feed_events', column='actor_id')),
+    ('feed_timelines', _BY_USER.format(table='feed_timelines', column='user_id')),
+    ('exercise_pr_history', _BY_USER.format(table='exercise_pr_history', column='user_id')),
+    ('exercise_weekly', _BY_USER.format(table='exercise_weekly', column='user_id')),
+    ('exercise_progress', _BY_USER.format(table='exercise_progress', column='user_id')),
+    ('archived_exercise_months', _BY_USER.format(table='archived_exercise_months', column='user_id')),
+    ('archived_workout_months', _BY_USER.format(table='archived_workout_months', column='user_id')),
+    ('goals', _BY_USER.format(table='goals', column='user_id')),
+    ('exercises', """
+        DELETE FROM exercises WHERE id IN (
+            SELECT e.id
+            FROM workouts w
+            JOIN exercises e ON e.workout_id = w.id
+            WHERE w.user_id = %(user_id)s
+            LIMIT %(batch)s
+        );
+    """),
+    ('workouts', """
+        DELETE FROM workouts WHERE id IN (
+            SELECT id FROM workouts WHERE user_id = %(user_id)s LIMIT %(batch)s
+        );
+    """),
+    ('user', "DELETE FROM users WHERE id = %(user_id)s;"),
+)
+STEP_NAMES = [step for step, _ in PURGE_STEPS]
+STEP_QUERIES = dict(PURGE_STEPS)
+
+# Marks a user deleted and queues their purge; returns whether a live user was
+# tombstoned and the ids of their former followers.
+TOMBSTONE_QUERY = """
+    WITH tomb AS (
+        UPDATE users
+        SET deleted_at = now(),
+            name = 'Deleted user',
+            email = 'deleted-' || id || '@deleted.invalid'
+        WHERE id = %(user_id)s AND deleted_at IS NULL
+        RETURNING id
+    ),
+    edges AS (
+        DELETE FROM friends
+        WHERE (user_id = %(user_id)s OR friend_id = %(user_id)s)
+          AND EXISTS (SELECT 1 FROM tomb)
+        RETURNING user_id, friend_id
+    ),
+    job AS (
+        INSERT INTO deletion_jobs (user_id, step)
+        SELECT id, %(first_step)s FROM tomb
+        ON CONFLICT (user_id) DO NOTHING
+    )
+    SELECT EXISTS (SELECT 1 FROM tomb),
+           ARRAY(SELECT user_id FROM edges WHERE friend_id = %(user_id)s);
+"""
+
+# The oldest unfinished job no other purger is working on right now
+# ({lock} SKIP LOCKED), or the oldest one, waiting for whoever holds it (empty).
+CLAIM_JOB_QUERY = """
+    SELECT user_id, step
+    FROM deletion_jobs
+    WHERE finished_at IS NULL
+    ORDER BY requested_at
+    LIMIT 1
+    FOR UPDATE {lock};
+"""
+
+
+class DeletionJob(NamedTuple):
+    user_id: int
+    requested_at: object
+    finished_at: object
+    step: str
+    batches: int
+    rows_deleted: int
+
+
+JOB_COLUMNS = ', '.join(DeletionJob._fields)
+
+
+class PurgeBatch(NamedTuple):
+    """Outcome of one purge transaction."""
+    user_id: int
+    step: str
+    rows: int
+    finished: bool
+
+
+def tombstone_user(cur, user_id):
+    """Tombstones a user and queues their purge; returns their former followers, or None if there was no live user."""
+    cur.execute(TOMBSTONE_QUERY, {'user_id': user_id, 'first_step': STEP_NAMES[0]})
+    tombstoned, followers = cur.fetchone()
+    return followers if tombstoned else None
+
+
+def purge_batch(cur, user_id, step, batch_size=BATCH_SIZE):
+    """Deletes one batch of the current step and records progress; returns a PurgeBatch."""
+    cur.execute(STEP_QUERIES[step], {'user_id': user_id, 'batch': batch_size})
+    rows = max(cur.rowcount, 0)
+    next_step = step
+    finished = False
+    if rows < batch_size:
+        # A short batch means the step is done (the final step always is).
+        index = STEP_NAMES.index(step) + 1
+        finished = index == len(STEP_NAMES)
+        next_step = step if finished else STEP_NAMES[index]
+    cur.execute(
+        """
+        UPDATE deletion_jobs
+        SET step = %(step)s,
+            batches = batches + 1,
+            rows_deleted = rows_deleted + %(rows)s,
+            finished_at = CASE WHEN %(finished)s THEN now() END
+        WHERE user_id = %(user_id)s;
+        """,
+        {'user_id': user_id, 'step': next_step, 'rows': rows, 'finished': finished}
+    )
+    return PurgeBatch(user_id, step, rows, finished)
+
+
+def run_batch(conn, batch_size=BATCH_SIZE, wait=False):
+    """
+    Claims a pending job and purges one batch of it in its own transaction;
+    None when idle. With `wait`, a job another purger holds is waited for
+    instead of skipped (None may then also mean that job just finished).
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute(CLAIM_JOB_QUERY.format(lock="" if wait else "SKIP LOCKED"))
+        row = cur.fetchone()
+        if row is None:
+            conn.rollback()
+            return None
+        batch = purge_batch(cur, row[0], row[1], batch_size)
+        conn.commit()
+        return batch
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def read_jobs(cur, user_id=None, limit=50):
+    """Deletion jobs, newest first (or the job of one user)."""
+    if user_id is None:
+        cur.execute(f"SELECT {JOB_COLUMNS} FROM deletion_jobs ORDER BY requested_at DESC LIMIT %s;", (limit,))
+    else:
+        cur.execute(f"SELECT {JOB_COLUMNS} FROM deletion_jobs WHERE user_id = %s;", (user_id,))
+    return [DeletionJob(*row) for row in cur.fetchall()]
+
+
+class DeletionWorker:
+    """Background thread that purges tombstoned users in throttled batches."""
+
+    def __init__(self, connect, on_finished=None, batch_size=BATCH_SIZE, pause=0.05, duty_cycle=0.5,
+                 poll_interval=10.0):
+        self.connect = connect
+        self.on_finished = on_finished
+        self.batch_size = batch_size
+        self.pause = pause
+        self.duty_cycle = duty_cycle
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self.batches = 0
+        self.rows_deleted = 0
+        self.jobs_finished = 0
+        self.failures = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='account-deletion', daemon=True)
+            self._thread.start()
+        return self
+
+    def wake(self):
+        """Starts purging now instead of at the next poll."""
+        self._wake.set()
+
+    def step(self, wait=False):
+        """Purges one batch; returns the PurgeBatch, or None when no job is pending (see run_batch)."""
+        with self.connect() as conn:
+            batch = run_batch(conn, self.batch_size, wait)
+        if batch is not None:
+            self.batches += 1
+            self.rows_deleted += batch.rows
+            if batch.finished:
+                self.jobs_finished += 1
+                if self.on_finished is not None:
+                    self.on_finished(batch.user_id)
+        return batch
+
+    def drain(self, max_batches=None):
+        """
+        Purges in the calling thread, without throttling, until no job is
+        left, also finishing jobs other purgers are on; returns the rows deleted.
+        """
+        rows = batches = 0
+        while max_batches is None or batches < max_batches:
+            batch = self.step(wait=True)
+            if batch is None:
+                with self.connect() as conn:
+                    cur = conn.cursor()
+                    cur.execute("SELECT EXISTS (SELECT 1 FROM deletion_jobs WHERE finished_at IS NULL);")
+                    if not cur.fetchone()[0]:
+                        break
+                continue
+            rows += batch.rows
+            batches += 1
+        return rows
+
+    def _throttle(self, elapsed):
+        time.sleep(max(self.pause, elapsed * (1 - self.duty_cycle) / self.duty_cycle))
+
+    def _run(self):
+        while not self._stopping:
+            started = time.perf_counter()
+            try:
+                batch = self.step()
+            except Exception as e:
+                self.failures += 1
+                log_error("Error purging deleted account", e)
+                batch = None
+            if batch is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+            else:
+                self._throttle(time.perf_counter() - started)
+
+    def stop(self, timeout=30.0):
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'rows_deleted': self.rows_deleted,
+            'jobs_finished': self.jobs_finished,
+            'failures': self.failures,
+        }
+
+
+def main():
+    import backend_fit as db
+
+    parser = argparse.ArgumentParser(description="Purge deleted accounts or show deletion progress.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    run = sub.add_parser('run', help="Purge every pending deletion job, then exit")
+    run.add_argument('--batch-size', type=int, default=db.DELETION_CONFIG['batch_size'])
+    status = sub.add_parser('status', help="Show recent deletion jobs")
+    status.add_argument('--user-id', type=int)
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        db.DELETION_CONFIG['batch_size'] = args.batch_size
+        rows = db.run_deletion_jobs()
+        print(f"Purged {rows} rows.")
+    elif args.command == 'status':
+        for job in db.read_deletion_jobs(args.user_id):
+            state = f"done {job.finished_at:%Y-%m-%d %H:%M}" if job.finished_at else f"at {job.step}"
+            print(f"user {job.user_id}: requested {job.requested_at:%Y-%m-%d %H:%M}, {state}, "
+                  f"{job.rows_deleted} rows in {job.batches} batches")
+    db.close_pool()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+# Streaming bulk export of the tracker tables, for one user or the whole
+# database, as CSV, JSONL or Parquet (one file per table).
+#   csv     - COPY (SELECT ...) TO STDOUT, streamed by the server straight into the file
+#   jsonl   - row_to_json on the server, read through a server-side cursor
+#   parquet - typed rows read through a server-side cursor, one row group per chunk
+#             (needs pyarrow)
+# Nothing is held in memory beyond one chunk, however large the tables are.
+# Tables are exported in parallel on separate pooled connections that share one
+# exported snapshot (pg_export_snapshot), so the files are consistent with each
+# other, like pg_dump -j. Each file is written as <name>.part and renamed when
+# complete.
+# Usage: python export_fit.py --out export/ --format csv
+#        python export_fit.py --out export/ --format parquet --user-id 1 --tables workouts exercises
+
+FORMATS = ('csv', 'jsonl', 'parquet')
+CHUNK_SIZE = 10000
+WORKERS = 3
+
+
+class TableSpec(NamedTuple):
+    columns: tuple       # (column, type) with type 'int', 'text', 'date' or 'decimal'
+    user_filter: str     # WHERE clause selecting one user's rows
+    order: str           # ORDER BY of a per-user export
+    live_filter: str     # WHERE clause leaving out the rows of tombstoned users (deletion_fit)
+
+
+class ExportResult(NamedTuple):
+    table: str
+    path: str
+    rows: int
+    seconds: float
+
+
+# Tombstoned users are few (only those still being purged), so the live
+# filters are anti-joins against a small set whatever the table size.
+_TOMBSTONED = "(SELECT id FROM users WHERE deleted_at IS NOT NULL)"
+
+EXPORT_TABLES = {
+    'users': TableSpec(
+        (('id', 'int'), ('name', 'text'), ('email', 'text'), ('weight_kg', 'decimal')),
+        "id = %(user_id)s", "id", "deleted_at IS NULL"),
+    'workouts': TableSpec(
+        (('id', 'int'), ('user_id', 'int'), ('workout_date', 'date'), ('duration_minutes', 'int')),
+        "user_id = %(user_id)s", "workout_date, id", f"user_id NOT IN {_TOMBSTONED}"),
+    'exercises': TableSpec(
+        (('id', 'int'), ('workout_id', 'int'), ('exercise_name', 'text'), ('sets', 'int'), ('reps', 'int'),
+         ('weight_kg', 'decimal')),
+        "workout_id IN (SELECT id FROM workouts WHERE user_id = %(user_id)s)", "workout_id, id",
+        f"workout_id NOT IN (SELECT id FROM workouts WHERE user_id IN {_TOMBSTONED})"),
+    'goals': TableSpec(
+        (('id', 'int'), ('user_id', 'int'), ('description', 'text'), ('target_value', 'int'),
+         ('current_value', 'int'), ('metric', 'text'), ('period', 'text'), ('exercise_name', 'text')),
+        "user_id = %(user_id)s", "id", f"user_id NOT IN {_TOMBSTONED}"),
+    'friends': TableSpec(
+        (('user_id', 'int'), ('friend_id', 'int')),
+        "user_id = %(user_id)s", "friend_id", f"user_id NOT IN {_TOMBSTONED}"),
+}
+
+EXTENSIONS = {'csv': '.csv', 'jsonl': '.jsonl', 'parquet': '.parquet'}
+
+
+def export_query(table, user_id=None):
+    """(sql, params) selecting the exported columns of a table, optionally for one user."""
+    spec = EXPORT_TABLES[table]
+    sql = f"SELECT {', '.join(column for column, _ in spec.columns)} FROM {table} WHERE {spec.live_filter}"
+    if user_id is None:
+        # Whole-database exports stay unordered so the server never has to sort a full table.
+        return sql, {}
+    return f"{sql} AND {spec.user_filter} ORDER BY {spec.order}", {'user_id': user_id}
+
+
+def _parquet_schema(table):
+    import pyarrow as pa
+
+    types = {'int': pa.int64(), 'text': pa.string(), 'date': pa.date32(), 'decimal': pa.decimal128(38, 9)}
+    return pa.schema([(column, types[kind]) for column, kind in EXPORT_TABLES[table].columns])
+
+
+def _write_csv(cur, sql, params, path, chunk_size):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        cur.copy_expert(f"COPY ({cur.mogrify(sql, params).decode()}) TO STDOUT WITH (FORMAT csv, HEADER)",
+                        f, size=chunk_size * 64)
+    return cur.rowcount
+
+
+def _write_jsonl(cur, sql, params, path, chunk_size):
+    rows = 0
+    cur.itersize = chunk_size
+    cur.execute(f"SELECT row_to_json(t)::text FROM ({sql}) t", params)
+    with open(path, 'w', encoding='utf-8') as f:
+        while True:
+            chunk = cur.fetchmany(chunk_size)
+            if not chunk:
+                break
+            f.writelines(line + '\n' for line, in chunk)
+            rows += len(chunk)
+    return rows
+
+
+def _write_parquet(cur, sql, params, path, chunk_size, table):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _parquet_schema(table)
+    rows = 0
+    cur.itersize = chunk_size
+    cur.execute(sql, params)
+    with pq.ParquetWriter(path, schema) as writer:
+        while True:
+            chunk = cur.fetchmany(chunk_size)
+            if not chunk:
+                break
+            writer.write_table(pa.Table.from_pydict(dict(zip(schema.names, zip(*chunk))), schema=schema))
+            rows += len(chunk)
+    return rows
+
+
+def export_table(conn, table, out_dir, fmt, user_id=None, snapshot=None, chunk_size=CHUNK_SIZE):
+    """Streams one table into <out_dir>/<table>.<fmt>; returns an ExportResult."""
+    started = time.perf_counter()
+    path = os.path.join(out_dir, table + EXTENSIONS[fmt])
+    sql, params = export_query(table, user_id)
+    cur = conn.cursor()
+    cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY;")
+    if snapshot is not None:
+        cur.execute("SET TRANSACTION SNAPSHOT %s;", (snapshot,))
+    try:
+        if fmt == 'csv':
+            rows = _write_csv(cur, sql, params, path + '.part', chunk_size)
+        else:
+            # Named cursors live on the server and hand rows over a chunk at a time.
+            stream = conn.cursor(name=f"export_{table}")
+            if fmt == 'jsonl':
+                rows = _write_jsonl(stream, sql, params, path + '.part', chunk_size)
+            else:
+                rows = _write_parquet(stream, sql, params, path + '.part', chunk_size, table)
+            stream.close()
+    except Exception:
+        if os.path.exists(path + '.part'):
+            os.remove(path + '.part')
+        raise
+    finally:
+        conn.rollback()
+    os.replace(path + '.part', path)
+    return ExportResult(table, path, rows, time.perf_counter() - started)
+
+
+def export_tables(connect, out_dir, fmt='csv', user_id=None, tables=None, workers=WORKERS,
+                  chunk_size=CHUNK_SIZE):
+    """
+    Exports several tables in parallel; `connect` is a context manager factory
+    such as backend_fit.pooled_connection. Returns an ExportResult per table.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    tables = list(tables or EXPORT_TABLES)
+    unknown = [table for table in tables if table not in EXPORT_TABLES]
+    if unknown:
+        raise ValueError(f"Unknown export tables: {', '.join(unknown)}")
+    if fmt == 'parquet':
+        import pyarrow  # noqa: F401 - fail before any file is written
+    os.makedirs(out_dir, exist_ok=True)
+
+    def run(table, snapshot):
+        with connect() as conn:
+            return export_table(conn, table, out_dir, fmt, user_id, snapshot, chunk_size)
+
+    with connect() as conn:
+        # This transaction only holds the snapshot the workers import.
+        cur = conn.cursor()
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY;")
+        cur.execute("SELECT pg_export_snapshot();")
+        snapshot = cur.fetchone()[0]
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, min(workers, len(tables)))) as pool:
+                return list(pool.map(lambda table: run(table, snapshot), tables))
+        finally:
+            conn.rollback()
+
+
+def main():
+    import backend_fit as db
+
+    parser = argparse.ArgumentParser(description="Export tracker tables to CSV, JSONL or Parquet.")
+    parser.add_argument('--out', required=True, help="Directory the files are written to")
+    parser.add_argument('--format', choices=FORMATS, default='csv')
+    parser.add_argument('--user-id', type=int, help="Export only this user's data")
+    parser.add_argument('--tables', nargs='+', choices=list(EXPORT_TABLES))
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    results = db.export_data(args.out, args.format, args.user_id, args.tables, args.workers, args.chunk_size)
+    if results is None:
+        raise SystemExit(1)
+    for result in results:
+        print(f"{result.table}: {result.rows} rows in {result.seconds:.1f}s -> {result.path}")
+
+
+if __name__ == '__main__':
+    main()
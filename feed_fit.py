@@ -0,0 +1,361 @@
+import argparse
+import datetime
+from decimal import Decimal
+from typing import NamedTuple, Optional
+
+from stats_fit import exercise_volume
+
+# Friend activity feed, fanned out on write into bounded per-user timelines:
+#   feed_events          - one row per logged workout (the feed item)
+#   feed_timelines       - (user_id, event_id) for every event a user should see
+#   feed_timeline_sizes  - entries per timeline, so trimming is amortised
+#   feed_pull_actors     - users with too many followers to fan out to
+# create_workout calls fanout_workout in its transaction: one statement adds
+# the event and pushes it to the actor's own timeline and, unless the actor is
+# a pull actor, to every follower's. A timeline keeps the newest
+# TIMELINE_LIMIT events; it is trimmed once it grows TIMELINE_SLACK past that.
+# Actors with more than FANOUT_MAX_FOLLOWERS followers switch to pull: their
+# events are merged into their followers' pages on read, from the actor's own
+# event index. Pages are keyset-paginated on the event id, so a page costs one
+# timeline index range plus one short range per followed pull actor, however
+# many friends the reader has.
+# Usage: python feed_fit.py rebuild [--days 30]
+
+TIMELINE_LIMIT = 500
+TIMELINE_SLACK = 50
+FANOUT_MAX_FOLLOWERS = 1000
+# Recent events of a newly followed user copied into the follower's timeline.
+BACKFILL_EVENTS = 20
+# Days of existing workouts turned into events by rebuild_feed.
+REBUILD_DAYS = 30
+# Keyset value before the first page (larger than any BIGSERIAL id).
+FEED_TOP = 2 ** 63 - 1
+
+FEED_DDL = """
+    CREATE TABLE IF NOT EXISTS feed_events (
+        id BIGSERIAL PRIMARY KEY,
+        actor_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        workout_id INT REFERENCES workouts(id) ON DELETE CASCADE,
+        event_date DATE NOT NULL,
+        duration_minutes INT,
+        exercise_count INT NOT NULL DEFAULT 0,
+        volume DECIMAL NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS feed_events_actor_idx ON feed_events (actor_id, id);
+    CREATE INDEX IF NOT EXISTS feed_events_workout_idx ON feed_events (workout_id);
+
+    CREATE TABLE IF NOT EXISTS feed_timelines (
+        user_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        event_id BIGINT NOT NULL REFERENCES feed_events(id) ON DELETE CASCADE,
+        PRIMARY KEY (user_id, event_id)
+    );
+    CREATE INDEX IF NOT EXISTS feed_timelines_event_idx ON feed_timelines (event_id);
+
+    CREATE TABLE IF NOT EXISTS feed_timeline_sizes (
+        user_id INT PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+        entries INT NOT NULL DEFAULT 0
+    );
+
+    CREATE TABLE IF NOT EXISTS feed_pull_actors (
+        user_id INT PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE
+    );
+"""
+
+FEED_TABLES = ('feed_timeline_sizes', 'feed_timelines', 'feed_events', 'feed_pull_actors')
+
+# Adds one workout event and pushes it to the timelines in one statement;
+# returns (user_id, entries) of every timeline it was pushed to. Followers are
+# read with a LIMIT, so deciding between push and pull never scans more than
+# FANOUT_MAX_FOLLOWERS + 1 of them.
+FANOUT_QUERY = """
+    WITH followers AS (
+        SELECT user_id FROM friends
+        WHERE friend_id = %(actor_id)s
+        LIMIT %(max_followers)s + 1
+    ),
+    mode AS (
+        SELECT EXISTS (SELECT 1 FROM feed_pull_actors WHERE user_id = %(actor_id)s)
+               OR (SELECT COUNT(*) FROM followers) > %(max_followers)s AS pull
+    ),
+    marked AS (
+        INSERT INTO feed_pull_actors (user_id)
+        SELECT %(actor_id)s FROM mode WHERE pull
+        ON CONFLICT DO NOTHING
+    ),
+    event AS (
+        INSERT INTO feed_events (actor_id, workout_id, event_date, duration_minutes, exercise_count, volume)
+        VALUES (%(actor_id)s, %(workout_id)s, %(date)s, %(duration)s, %(exercise_count)s, %(volume)s)
+        RETURNING id
+    ),
+    audience AS (
+        SELECT %(actor_id)s AS user_id
+        UNION
+        SELECT f.user_id FROM followers f, mode WHERE NOT mode.pull
+    ),
+    delivered AS (
+        INSERT INTO feed_timelines (user_id, event_id)
+        SELECT a.user_id, e.id FROM audience a, event e
+        RETURNING user_id
+    )
+    INSERT INTO feed_timeline_sizes AS s (user_id, entries)
+    SELECT user_id, 1 FROM delivered
+    ON CONFLICT (user_id) DO UPDATE SET entries = s.entries + 1
+    RETURNING user_id, entries;
+"""
+
+# Cuts the given timelines back to their newest %(limit)s events.
+TRIM_QUERY = """
+    WITH cutoffs AS (
+        SELECT u.user_id,
+               (SELECT event_id FROM feed_timelines x
+                WHERE x.user_id = u.user_id
+                ORDER BY event_id DESC
+                OFFSET %(limit)s LIMIT 1) AS cutoff
+        FROM unnest(%(user_ids)s::int[]) AS u(user_id)
+    ),
+    trimmed AS (
+        DELETE FROM feed_timelines t
+        USING cutoffs c
+        WHERE t.user_id = c.user_id AND t.event_id <= c.cutoff
+    )
+    UPDATE feed_timeline_sizes s
+    SET entries = LEAST((SELECT COUNT(*) FROM feed_timelines x WHERE x.user_id = s.user_id), %(limit)s)
+    WHERE s.user_id = ANY(%(user_ids)s);
+"""
+
+# One page of a user's feed: their timeline merged with the events of the pull
+# actors they follow, newest first, strictly before %(before)s.
+FEED_QUERY = """
+    WITH page AS (
+        (SELECT event_id AS id
+         FROM feed_timelines
+         WHERE user_id = %(user_id)s AND event_id < %(before)s
+         ORDER BY event_id DESC
+         LIMIT %(limit)s)
+        UNION
+        (SELECT e.id
+         FROM feed_pull_actors p
+         JOIN friends f ON f.user_id = %(user_id)s AND f.friend_id = p.user_id
+         CROSS JOIN LATERAL (
+             SELECT id FROM feed_events
+             WHERE actor_id = p.user_id AND id < %(before)s
+             ORDER BY id DESC
+             LIMIT %(limit)s
+         ) e)
+    )
+    SELECT e.id, e.actor_id, u.name, e.workout_id, e.event_date,
+           e.duration_minutes, e.exercise_count, e.volume
+    FROM page
+    JOIN feed_events e ON e.id = page.id
+    JOIN users u ON u.id = e.actor_id
+    ORDER BY e.id DESC
+    LIMIT %(limit)s;
+"""
+
+# Copies the newest events of newly followed users into a follower's timeline.
+BACKFILL_QUERY = """
+    WITH copied AS (
+        INSERT INTO feed_timelines (user_id, event_id)
+        SELECT %(user_id)s, e.id
+        FROM unnest(%(friend_ids)s::int[]) AS a(actor_id)
+        CROSS JOIN LATERAL (
+            SELECT id FROM feed_events
+            WHERE actor_id = a.actor_id
+            ORDER BY id DESC
+            LIMIT %(events)s
+        ) e
+        ON CONFLICT DO NOTHING
+        RETURNING 1
+    )
+    INSERT INTO feed_timeline_sizes AS s (user_id, entries)
+    SELECT %(user_id)s, COUNT(*) FROM copied
+    HAVING COUNT(*) > 0
+    ON CONFLICT (user_id) DO UPDATE SET entries = s.entries + EXCLUDED.entries;
+"""
+
+# Removes unfollowed users' events from a follower's timeline (at most one
+# timeline's worth of rows) and takes them off its size.
+UNFOLLOW_QUERY = """
+    WITH removed AS (
+        DELETE FROM feed_timelines t
+        USING feed_events e
+        WHERE t.user_id = %(user_id)s
+          AND e.id = t.event_id
+          AND e.actor_id = ANY(%(friend_ids)s)
+        RETURNING 1
+    )
+    UPDATE feed_timeline_sizes s
+    SET entries = s.entries - (SELECT COUNT(*) FROM removed)
+    WHERE s.user_id = %(user_id)s AND EXISTS (SELECT 1 FROM removed);
+"""
+
+# Drops the events of workouts about to be archived from the {workouts}
+# partition, with their timeline entries. Partitioning dropped the
+# feed_events.workout_id foreign key (and its ON DELETE CASCADE), so
+# partitions_fit runs this before it drops a partition.
+ARCHIVED_EVENTS_QUERY = """
+    WITH events AS (
+        SELECT id FROM feed_events
+        WHERE workout_id IN (SELECT id FROM {workouts} WHERE workout_date < %(before)s)
+    ),
+    removed AS (
+        DELETE FROM feed_timelines t
+        USING events e
+        WHERE t.event_id = e.id
+        RETURNING t.user_id
+    ),
+    dropped AS (
+        DELETE FROM feed_events WHERE id IN (SELECT id FROM events)
+    )
+    UPDATE feed_timeline_sizes s
+    SET entries = s.entries - r.entries
+    FROM (SELECT user_id, COUNT(*) AS entries FROM removed GROUP BY user_id) r
+    WHERE s.user_id = r.user_id;
+"""
+
+# Recreates the feed tables from the last %(days)s days of workouts.
+REBUILD_FEED_QUERIES = (
+    """
+    INSERT INTO feed_pull_actors (user_id)
+    SELECT friend_id FROM friends GROUP BY friend_id HAVING COUNT(*) > %(max_followers)s;
+    """,
+    """
+    INSERT INTO feed_events (actor_id, workout_id, event_date, duration_minutes, exercise_count, volume)
+    SELECT w.user_id, w.id, w.workout_date, w.duration_minutes,
+           COUNT(e.id), COALESCE(SUM(e.sets * e.reps * e.weight_kg), 0)
+    FROM workouts w
+    LEFT JOIN exercises e ON e.workout_id = w.id
+    WHERE w.workout_date >= CURRENT_DATE - %(days)s
+    GROUP BY w.id, w.workout_date
+    ORDER BY w.workout_date, w.id;
+    """,
+    """
+    INSERT INTO feed_timelines (user_id, event_id)
+    SELECT user_id, event_id
+    FROM (
+        SELECT a.user_id, ev.id AS event_id,
+               ROW_NUMBER() OVER (PARTITION BY a.user_id ORDER BY ev.id DESC) AS n
+        FROM feed_events ev
+        CROSS JOIN LATERAL (
+            SELECT ev.actor_id AS user_id
+            UNION
+            SELECT f.user_id FROM friends f
+            WHERE f.friend_id = ev.actor_id
+              AND NOT EXISTS (SELECT 1 FROM feed_pull_actors p WHERE p.user_id = ev.actor_id)
+        ) a
+    ) ranked
+    WHERE n <= %(limit)s;
+    """,
+    """
+    INSERT INTO feed_timeline_sizes (user_id, entries)
+    SELECT user_id, COUNT(*) FROM feed_timelines GROUP BY user_id;
+    """,
+)
+
+
+class FeedItem(NamedTuple):
+    event_id: int
+    actor_id: int
+    actor_name: str
+    workout_id: Optional[int]
+    workout_date: datetime.date
+    duration: Optional[int]
+    exercise_count: int
+    volume: Decimal
+
+
+def fanout_params(actor_id, workout_id, workout_date, duration, exercises):
+    """Parameters of FANOUT_QUERY for one workout."""
+    volume = sum((v for v in map(exercise_volume, exercises) if v is not None), Decimal(0))
+    return {
+        'actor_id': actor_id,
+        'workout_id': workout_id,
+        'date': workout_date,
+        'duration': duration,
+        'exercise_count': len(exercises),
+        'volume': volume,
+        'max_followers': FANOUT_MAX_FOLLOWERS,
+    }
+
+
+def timelines_to_trim(rows):
+    """User ids among FANOUT_QUERY's (user_id, entries) rows whose timeline is past its slack."""
+    return [user_id for user_id, entries in rows if entries > TIMELINE_LIMIT + TIMELINE_SLACK]
+
+
+def trim_params(user_ids):
+    return {'user_ids': list(user_ids), 'limit': TIMELINE_LIMIT}
+
+
+def fanout_workout(cur, actor_id, workout_id, workout_date, duration, exercises):
+    """Publishes a new workout to the feed (in the caller's transaction), trimming full timelines."""
+    cur.execute(FANOUT_QUERY, fanout_params(actor_id, workout_id, workout_date, duration, exercises))
+    full = timelines_to_trim(cur.fetchall())
+    if full:
+        cur.execute(TRIM_QUERY, trim_params(full))
+
+
+def feed_params(user_id, page_size=20, before=None):
+    """Parameters of FEED_QUERY; one extra row tells whether another page follows."""
+    return {'user_id': user_id, 'before': FEED_TOP if before is None else before, 'limit': page_size + 1}
+
+
+def feed_page(rows, page_size):
+    """(items, next_before) from the FEED_QUERY rows; next_before is None on the last page."""
+    items = [FeedItem(*row) for row in rows]
+    if len(items) <= page_size:
+        return items, None
+    items = items[:page_size]
+    return items, items[-1].event_id
+
+
+def read_feed_page(cur, user_id, page_size=20, before=None):
+    """One page of a user's feed; returns (items, next_before)."""
+    cur.execute(FEED_QUERY, feed_params(user_id, page_size, before))
+    return feed_page(cur.fetchall(), page_size)
+
+
+def backfill_params(user_id, friend_ids):
+    return {'user_id': user_id, 'friend_ids': list(friend_ids), 'events': BACKFILL_EVENTS}
+
+
+def follow_backfill(cur, user_id, friend_ids):
+    """Gives a new follower the recent events of the users they just followed."""
+    if friend_ids:
+        cur.execute(BACKFILL_QUERY, backfill_params(user_id, friend_ids))
+
+
+def unfollow_cleanup(cur, user_id, friend_ids):
+    """Removes the events of unfollowed users from a follower's timeline."""
+    if friend_ids:
+        cur.execute(UNFOLLOW_QUERY, {'user_id': user_id, 'friend_ids': list(friend_ids)})
+
+
+def rebuild_feed(cur, days=REBUILD_DAYS):
+    """Recreates all feed tables from the last `days` days of workouts."""
+    for table in FEED_TABLES:
+        cur.execute(f"DELETE FROM {table};")
+    params = {'days': days, 'limit': TIMELINE_LIMIT, 'max_followers': FANOUT_MAX_FOLLOWERS}
+    for query in REBUILD_FEED_QUERIES:
+        cur.execute(query, params)
+
+
+def main():
+    import backend_fit as db
+
+    parser = argparse.ArgumentParser(description="Maintain the friend activity feed.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    rebuild = sub.add_parser('rebuild', help="Recreate the feed from recent workouts")
+    rebuild.add_argument('--days', type=int, default=REBUILD_DAYS)
+    args = parser.parse_args()
+
+    if args.command == 'rebuild':
+        with db.pooled_connection() as conn:
+            cur = conn.cursor()
+            rebuild_feed(cur, args.days)
+            conn.commit()
+        print(f"Rebuilt the activity feed from the last {args.days} days of workouts.")
+
+
+if __name__ == '__main__':
+    main()
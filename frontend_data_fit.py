@@ -0,0 +1,187 @@
+import threading
+
+import streamlit as st
+
+from storage_fit import get_backend
+
+# Data-access layer for frontend_fit.py.
+# Streamlit reruns the whole script on every widget interaction, so every read
+# here goes through st.cache_data, keyed on the user and a per-user data
+# version. Successful writes bump the versions they affect, so the next rerun
+# misses the cache exactly once; unchanged data is served without touching
+# the database. The backend connection pool is a st.cache_resource, shared by
+# every session in the process; frontend_fit.py creates it on startup.
+
+# Seconds a cached read may live even if its version never changes. This bounds
+# staleness for data changed by other users (e.g. friends logging workouts).
+READ_TTL = 300
+LEADERBOARD_TTL = 30
+MAX_ENTRIES = 10000
+
+# backend_fit, or the embedded engine selected by backend_fit.STORAGE_CONFIG.
+db = get_backend()
+
+
+@st.cache_resource
+def connection_pool():
+    """The backend connection pool, created once per process and shared across sessions."""
+    return db.get_pool()
+
+
+@st.cache_resource
+def _data_versions():
+    return {'lock': threading.Lock(), 'versions': {}}
+
+
+def data_version(user_id, kind):
+    """Current version of one kind of data ('goals', 'workouts', ...) for a user."""
+    return _data_versions()['versions'].get((user_id, kind), 0)
+
+
+def bump(user_id, *kinds):
+    """Marks a user's data of the given kinds as changed."""
+    state = _data_versions()
+    with state['lock']:
+        for kind in kinds:
+            key = (user_id, kind)
+            state['versions'][key] = state['versions'].get(key, 0) + 1
+
+
+# --- Cached reads ---
+# `version` is unused in the bodies; it is part of the cache key.
+
+@st.cache_data(ttl=READ_TTL, max_entries=MAX_ENTRIES, show_spinner=False)
+def _read_goals(user_id, version):
+    return db.read_goals(user_id)
+
+
+@st.cache_data(ttl=READ_TTL, max_entries=MAX_ENTRIES, show_spinner=False)
+def _read_workouts(user_id, limit, version):
+    return db.read_workouts(user_id, limit=limit)
+
+
+@st.cache_data(ttl=READ_TTL, max_entries=MAX_ENTRIES, show_spinner=False)
+def _read_friends(user_id, version):
+    return db.read_friends(user_id)
+
+
+@st.cache_data(ttl=READ_TTL, max_entries=MAX_ENTRIES, show_spinner=False)
+def _get_business_insights(user_id, version):
+    return db.get_business_insights(user_id)
+
+
+@st.cache_data(ttl=READ_TTL, max_entries=MAX_ENTRIES, show_spinner=False)
+def _get_exercise_progress(user_id, version):
+    return db.get_exercise_progress(user_id)
+
+
+@st.cache_data(ttl=LEADERBOARD_TTL, max_entries=MAX_ENTRIES, show_spinner=False)
+def _get_leaderboard(user_id, metric, window, limit, version):
+    return db.get_leaderboard(user_id, metric, window, limit)
+
+
+@st.cache_data(ttl=LEADERBOARD_TTL, max_entries=MAX_ENTRIES, show_spinner=False)
+def _get_global_rank(user_id, metric, window, version):
+    return db.get_global_rank(user_id, metric, window)
+
+
+@st.cache_data(ttl=LEADERBOARD_TTL, max_entries=MAX_ENTRIES, show_spinner=False)
+def _read_feed(user_id, page_size, before, version):
+    return db.read_feed(user_id, page_size, before)
+
+
+def read_goals(user_id):
+    # Tracked goals move with the user's workouts.
+    version = (data_version(user_id, 'goals'), data_version(user_id, 'workouts'))
+    return _read_goals(user_id, version)
+
+
+def read_workouts(user_id, limit=None):
+    return _read_workouts(user_id, limit, data_version(user_id, 'workouts'))
+
+
+def read_friends(user_id):
+    return _read_friends(user_id, data_version(user_id, 'friends'))
+
+
+def get_business_insights(user_id):
+    return _get_business_insights(user_id, data_version(user_id, 'workouts'))
+
+
+def get_exercise_progress(user_id):
+    return _get_exercise_progress(user_id, data_version(user_id, 'workouts'))
+
+
+def get_leaderboard(user_id, metric, window, limit=None):
+    version = (data_version(user_id, 'workouts'), data_version(user_id, 'friends'))
+    return _get_leaderboard(user_id, metric, window, limit, version)
+
+
+def read_feed(user_id, page_size=20, before=None):
+    # Friends' workouts show up within LEADERBOARD_TTL; the user's own at once.
+    version = (data_version(user_id, 'workouts'), data_version(user_id, 'friends'))
+    return _read_feed(user_id, page_size, before, version)
+
+
+def get_global_rank(user_id, metric, window):
+    return _get_global_rank(user_id, metric, window, data_version(user_id, 'workouts'))
+
+
+# --- Writes ---
+# Each write bumps the versions it affects only when it succeeded.
+
+def find_user_by_email(email):
+    return db.find_user_by_email(email)
+
+
+def create_user(name, email, weight):
+    return db.create_user(name, email, weight)
+
+
+def create_workout(user_id, workout_date, duration, exercises):
+    success = db.create_workout(user_id, workout_date, duration, exercises)
+    if success:
+        bump(user_id, 'workouts')
+    return success
+
+
+def create_friendship(user_id, friend_email):
+    success = db.create_friendship(user_id, friend_email)
+    if success:
+        bump(user_id, 'friends')
+    return success
+
+
+def create_friendships(user_id, friend_emails):
+    result = db.create_friendships(user_id, friend_emails)
+    if result and result['added']:
+        bump(user_id, 'friends')
+    return result
+
+
+def delete_friendship(user_id, friend_email):
+    success = db.delete_friendship(user_id, friend_email)
+    if success:
+        bump(user_id, 'friends')
+    return success
+
+
+def create_goal(user_id, description, target_value, metric=None, period=None, exercise_name=None):
+    success = db.create_goal(user_id, description, target_value, metric, period, exercise_name)
+    if success:
+        bump(user_id, 'goals')
+    return success
+
+
+def update_goal(user_id, goal_id, description, target_value, current_value):
+    success = db.update_goal(goal_id, description, target_value, current_value)
+    if success:
+        bump(user_id, 'goals')
+    return success
+
+
+def delete_goal(user_id, goal_id):
+    success = db.delete_goal(goal_id)
+    if success:
+        bump(user_id, 'goals')
+    return success
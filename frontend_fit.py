@@ -1,6 +1,9 @@
 import streamlit as st
 from datetime import date
-import backend_fit as db
+import frontend_data_fit as data
+from goals_fit import GOAL_METRICS, GOAL_PERIODS
+from leaderboard_fit import METRIC_LABELS, WINDOW_LABELS
+from partitions_fit import latest_workout_date
 
 # A simple user management system for a single user, using session state
 # In a real app, this would be a more robust login system.
@@ -8,6 +11,7 @@ if 'user_id' not in st.session_state:
     st.session_state.user_id = None
 
 st.set_page_config(layout="wide")
+data.connection_pool()
 st.title("💪 Personal Fitness Tracker")
 
 # Login/Profile Management
@@ -18,31 +22,26 @@ if st.session_state.user_id is None:
     email = st.text_input("Enter your email:")
     
     if st.button("Find/Create Profile"):
-        conn = db.get_connection()
-        if conn:
-            cur = conn.cursor()
-            cur.execute("SELECT id, name FROM users WHERE email = %s;", (email,))
-            user_data = cur.fetchone()
-            conn.close()
-
-            if user_data:
-                st.session_state.user_id = user_data[0]
-                st.session_state.user_name = user_data[1]
-                st.success(f"Welcome back, {st.session_state.user_name}!")
-                st.experimental_rerun()
-            else:
-                st.warning("Email not found. Let's create a new profile.")
-                name = st.text_input("Your Full Name:")
-                weight = st.number_input("Your Weight (kg):", min_value=1.0)
-                if st.button("Create New Profile"):
-                    new_user_id = db.create_user(name, email, weight)
-                    if new_user_id:
-                        st.session_state.user_id = new_user_id
-                        st.session_state.user_name = name
-                        st.success("Profile created successfully! Please log in again.")
-                        st.experimental_rerun()
-                    else:
-                        st.error("Failed to create profile. Please try again.")
+        user_data = data.find_user_by_email(email)
+
+        if user_data:
+            st.session_state.user_id = user_data[0]
+            st.session_state.user_name = user_data[1]
+            st.success(f"Welcome back, {st.session_state.user_name}!")
+            st.experimental_rerun()
+        else:
+            st.warning("Email not found. Let's create a new profile.")
+            name = st.text_input("Your Full Name:")
+            weight = st.number_input("Your Weight (kg):", min_value=1.0)
+            if st.button("Create New Profile"):
+                new_user_id = data.create_user(name, email, weight)
+                if new_user_id:
+                    st.session_state.user_id = new_user_id
+                    st.session_state.user_name = name
+                    st.success("Profile created successfully! Please log in again.")
+                    st.experimental_rerun()
+                else:
+                    st.error("Failed to create profile. Please try again.")
 else:
     # Main Application
     st.sidebar.title(f"Welcome, {st.session_state.user_name}!")
@@ -50,7 +49,7 @@ else:
 
     menu = st.sidebar.radio(
         "Navigation",
-        ["Dashboard", "Log Workout", "Friends & Leaderboard", "Goals", "Business Insights"]
+        ["Dashboard", "Log Workout", "Friends & Leaderboard", "Activity Feed", "Goals", "Progress", "Business Insights"]
     )
 
     # --- Dashboard Section ---
@@ -60,22 +59,20 @@ else:
         
         # Display goals
         st.subheader("Your Goals")
-        goals = db.read_goals(st.session_state.user_id)
+        goals = data.read_goals(st.session_state.user_id)
         if goals:
             for goal in goals:
-                goal_id, description, target, current = goal
-                progress = (current / target) if target > 0 else 0
-                st.write(f"**Goal:** {description}")
-                st.progress(progress)
-                st.write(f"Progress: {current} / {target}")
+                st.write(f"**Goal:** {goal.description}")
+                st.progress(goal.progress)
+                st.write(f"Progress: {goal.current_value} / {goal.target_value}")
         else:
             st.info("You haven't set any goals yet. Go to the 'Goals' section to add one!")
         
         # Display recent workouts
         st.subheader("Recent Workouts")
-        workouts = db.read_workouts(st.session_state.user_id)
+        workouts = data.read_workouts(st.session_state.user_id, limit=3) # Show last 3
         if workouts:
-            for i, workout in enumerate(workouts[:3]): # Show last 3
+            for workout in workouts:
                 st.markdown(f"**Workout on {workout['date'].strftime('%Y-%m-%d')}** - Duration: {workout['duration']} min")
                 for exercise in workout['exercises']:
                     st.write(f"- {exercise['name']}: {exercise['sets']} sets, {exercise['reps']} reps, {exercise['weight']} kg")
@@ -87,7 +84,7 @@ else:
         st.header("Log a New Workout")
 
         with st.form("new_workout_form"):
-            workout_date = st.date_input("Date", date.today())
+            workout_date = st.date_input("Date", date.today(), max_value=latest_workout_date())
             duration = st.number_input("Duration (minutes)", min_value=1, value=30)
             
             st.subheader("Add Exercises")
@@ -121,7 +118,7 @@ else:
 
             submitted = st.form_submit_button("Log Workout")
             if submitted and st.session_state.exercises:
-                success = db.create_workout(st.session_state.user_id, workout_date, duration, st.session_state.exercises)
+                success = data.create_workout(st.session_state.user_id, workout_date, duration, st.session_state.exercises)
                 if success:
                     st.success("Workout logged successfully!")
                     st.session_state.exercises = [] # Clear exercises for new workout
@@ -135,22 +132,29 @@ else:
         col1, col2 = st.columns(2)
 
         with col1:
-            st.subheader("Add a Friend")
-            friend_email = st.text_input("Enter friend's email:")
+            st.subheader("Add Friends")
+            friend_input = st.text_input("Enter one or more friends' emails (comma separated):")
             if st.button("Add Friend"):
-                if db.create_friendship(st.session_state.user_id, friend_email):
-                    st.success(f"Friend added!")
+                friend_emails = [e.strip() for e in friend_input.split(',') if e.strip()]
+                result = data.create_friendships(st.session_state.user_id, friend_emails)
+                if result is None:
+                    st.error("Failed to add friends. Please try again.")
                 else:
-                    st.error("Failed to add friend. Check the email or if they are already your friend.")
+                    if result['added']:
+                        st.success(f"Added {', '.join(result['added'])}!")
+                    if result['already_friends']:
+                        st.info(f"Already your friends: {', '.join(result['already_friends'])}")
+                    if result['not_found']:
+                        st.error(f"No profile found for: {', '.join(result['not_found'])}")
 
         with col2:
             st.subheader("Remove a Friend")
-            friends_list = db.read_friends(st.session_state.user_id)
+            friends_list = data.read_friends(st.session_state.user_id)
             if friends_list:
                 friend_emails = [f[1] for f in friends_list]
                 friend_to_remove = st.selectbox("Select friend to remove:", friend_emails)
                 if st.button("Remove Friend"):
-                    if db.delete_friendship(st.session_state.user_id, friend_to_remove):
+                    if data.delete_friendship(st.session_state.user_id, friend_to_remove):
                         st.success(f"Removed {friend_to_remove}.")
                     else:
                         st.error("Failed to remove friend.")
@@ -158,15 +162,53 @@ else:
                 st.info("You have no friends yet.")
 
         st.subheader("Leadership Board")
-        
-        leaderboard_data = db.get_leaderboard(st.session_state.user_id)
-        if leaderboard_data:
-            st.write("Ranking based on total workout minutes this week:")
-            # In a real app, you would filter by week. This is a simplified version.
-            st.table(leaderboard_data)
+
+        col_metric, col_window = st.columns(2)
+        with col_metric:
+            metric = st.selectbox("Rank by:", list(METRIC_LABELS), format_func=METRIC_LABELS.get)
+        with col_window:
+            window = st.selectbox("Period:", list(WINDOW_LABELS), format_func=WINDOW_LABELS.get)
+
+        leaderboard = data.get_leaderboard(st.session_state.user_id, metric, window, limit=25)
+        if leaderboard and leaderboard.rows:
+            st.write(f"Ranking based on {METRIC_LABELS[metric]} {WINDOW_LABELS[window]}:")
+            st.table([{'Rank': row.rank, 'Name': row.name, METRIC_LABELS[metric].capitalize(): row.value}
+                      for row in leaderboard.rows])
+            if leaderboard.position:
+                st.write(f"Your position: #{leaderboard.position.rank} with {leaderboard.position.value} {METRIC_LABELS[metric]}.")
+            global_rank = data.get_global_rank(st.session_state.user_id, metric, window)
+            if global_rank:
+                st.caption(f"Among all users you are #{global_rank}.")
         else:
             st.info("No leaderboard data available. Log a workout or add friends!")
 
+    # --- Activity Feed Section ---
+    elif menu == "Activity Feed":
+        st.header("Activity Feed")
+        st.write("Your latest workouts and your friends'.")
+
+        if 'feed_pages' not in st.session_state:
+            st.session_state.feed_pages = 1
+        before = None
+        shown = 0
+        for _ in range(st.session_state.feed_pages):
+            items, before = data.read_feed(st.session_state.user_id, page_size=20, before=before)
+            for item in items:
+                who = "You" if item.actor_id == st.session_state.user_id else item.actor_name
+                details = f"{item.duration} minutes" if item.duration is not None else "a workout"
+                if item.exercise_count:
+                    details += f", {item.exercise_count} exercises, {item.volume} kg volume"
+                st.write(f"**{who}** logged {details} on {item.workout_date}.")
+            shown += len(items)
+            if before is None:
+                break
+
+        if not shown:
+            st.info("Nothing here yet. Log a workout or add friends!")
+        elif before is not None and st.button("Load more"):
+            st.session_state.feed_pages += 1
+            st.experimental_rerun()
+
     # --- Goals Section (Create, Read, Update, Delete) ---
     elif menu == "Goals":
         st.header("Set Your Goals")
@@ -175,56 +217,111 @@ else:
             st.subheader("Add a New Goal")
             goal_description = st.text_area("Goal Description (e.g., 'Workout 5 times a week')")
             target_value = st.number_input("Target Value (e.g., 5)", min_value=1)
+            metric = st.selectbox(
+                "Track Progress From",
+                [None] + list(GOAL_METRICS),
+                format_func=lambda m: "Manual updates" if m is None else GOAL_METRICS[m]
+            )
+            period = st.selectbox("Period", list(GOAL_PERIODS), format_func=GOAL_PERIODS.get)
+            exercise_name = st.text_input("Exercise (optional, heaviest lift goals only)")
             
             add_goal_button = st.form_submit_button("Add Goal")
             if add_goal_button and goal_description:
-                if db.create_goal(st.session_state.user_id, goal_description, target_value):
+                if metric is None:
+                    period = exercise_name = None
+                elif metric != 'max_weight' or not exercise_name:
+                    exercise_name = None
+                if data.create_goal(st.session_state.user_id, goal_description, target_value,
+                                    metric, period, exercise_name):
                     st.success("Goal added successfully!")
                 else:
                     st.error("Failed to add goal.")
         
         st.subheader("Your Current Goals")
-        goals = db.read_goals(st.session_state.user_id)
+        goals = data.read_goals(st.session_state.user_id)
         if goals:
             for goal in goals:
-                goal_id, description, target, current = goal
+                goal_id, description, target, current = goal[:4]
                 with st.expander(f"**{description}**"):
                     st.write(f"Target: {target}")
                     st.write(f"Current: {current}")
-                    
-                    new_current = st.number_input("Update Current Value:", min_value=0, value=current, key=f"update_val_{goal_id}")
+                    if goal.metric is not None:
+                        tracked = GOAL_METRICS[goal.metric]
+                        if goal.exercise_name:
+                            tracked += f" ({goal.exercise_name})"
+                        st.caption(f"Tracked automatically: {tracked}, {GOAL_PERIODS[goal.period or 'all_time'].lower()}")
+                    else:
+                        new_current = st.number_input("Update Current Value:", min_value=0, value=current, key=f"update_val_{goal_id}")
                     col_update, col_delete = st.columns(2)
                     with col_update:
-                        if st.button("Update Progress", key=f"update_btn_{goal_id}"):
-                            if db.update_goal(goal_id, description, target, new_current):
+                        if goal.metric is None and st.button("Update Progress", key=f"update_btn_{goal_id}"):
+                            if data.update_goal(st.session_state.user_id, goal_id, description, target, new_current):
                                 st.success("Goal updated!")
                             else:
                                 st.error("Failed to update goal.")
                     with col_delete:
                         if st.button("Delete Goal", key=f"delete_btn_{goal_id}"):
-                            if db.delete_goal(goal_id):
+                            if data.delete_goal(st.session_state.user_id, goal_id):
                                 st.success("Goal deleted.")
                             else:
                                 st.error("Failed to delete goal.")
         else:
             st.info("You have no goals set yet.")
             
+    # --- Progress Section (Read) ---
+    elif menu == "Progress":
+        st.header("Your Progress")
+        st.write("Records, estimated one-rep max and weekly volume per exercise.")
+
+        progress = data.get_exercise_progress(st.session_state.user_id)
+        if progress:
+            for exercise in progress:
+                title = f"**{exercise.exercise}**"
+                if exercise.plateau:
+                    title += " (plateau)"
+                with st.expander(title):
+                    col1, col2, col3 = st.columns(3)
+                    with col1:
+                        st.metric(label="Best Weight (kg)", value=exercise.best_weight)
+                    with col2:
+                        st.metric(label="Estimated 1RM (kg)", value=exercise.best_e1rm)
+                    with col3:
+                        st.metric(label="Sessions Since Last PR", value=exercise.sessions_since_pr)
+                    if exercise.last_pr_date:
+                        st.write(f"Last PR: {exercise.last_pr_date}")
+                    if exercise.plateau:
+                        st.warning("No new record in a while. Consider changing sets, reps or load.")
+                    if exercise.weeks:
+                        st.line_chart(
+                            {'Week': exercise.weeks, 'Volume (kg)': [float(v) for v in exercise.weekly_volume]},
+                            x='Week', y='Volume (kg)'
+                        )
+        else:
+            st.info("No exercise history yet. Log a workout to start tracking progress!")
+
     # --- Business Insights Section (Read) ---
     elif menu == "Business Insights":
         st.header("Your Fitness Insights")
         st.write("A summary of your fitness data.")
         
-        insights = db.get_business_insights(st.session_state.user_id)
+        insights = data.get_business_insights(st.session_state.user_id)
         
-        if insights:
+        if insights and insights.total_workouts:
             col1, col2, col3 = st.columns(3)
             with col1:
-                st.metric(label="Total Workouts", value=insights.get('total_workouts', 0))
-                st.metric(label="Total Duration (min)", value=insights.get('total_duration', 0))
+                st.metric(label="Total Workouts", value=insights.total_workouts)
+                st.metric(label="Total Duration (min)", value=insights.total_duration)
+                st.metric(label="Workouts per Week", value=f"{insights.weekly_frequency:.1f}")
             with col2:
-                st.metric(label="Avg Duration (min)", value=f"{insights.get('avg_duration', 0):.2f}")
-                st.metric(label="Min Workout Duration (min)", value=insights.get('min_duration', 0))
+                st.metric(label="Avg Duration (min)", value=f"{insights.avg_duration:.2f}")
+                st.metric(label="Min Workout Duration (min)", value=insights.min_duration)
+                st.metric(label="Max Workout Duration (min)", value=insights.max_duration)
             with col3:
-                st.metric(label="Max Weight Lifted (kg)", value=insights.get('max_weight_lifted', 0))
+                st.metric(label="Max Weight Lifted (kg)", value=insights.max_weight_lifted)
+                st.metric(label="Total Volume (kg)", value=insights.total_volume)
+
+            if insights.exercise_prs:
+                st.subheader("Personal Records")
+                st.table([{'Exercise': name, 'Best (kg)': weight} for name, weight in insights.exercise_prs.items()])
         else:
             st.info("No data available to generate insights. Log a workout first!")
\ No newline at end of file
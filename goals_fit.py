@@ -0,0 +1,128 @@
+from typing import NamedTuple, Optional
+
+# Structured goals: a goal may name a metric, a period and optionally an
+# exercise, e.g. "120 workout minutes this week" or "100 kg on Squat". Their
+# progress is computed in the database from the stats rollups (one
+# user_stats row, a handful of bucket rows and per-exercise rows), never from
+# raw workouts, and never per goal on the client. Goals without a metric keep
+# the manually entered current_value.
+
+GOAL_METRICS = {
+    'minutes': 'Workout minutes',
+    'workouts': 'Workouts',
+    'volume': 'Total volume (kg)',
+    'max_weight': 'Heaviest lift (kg)',
+}
+GOAL_PERIODS = {'week': 'This week', 'month': 'This month', 'all_time': 'All time'}
+
+GOALS_DDL = """
+    ALTER TABLE goals
+        ADD COLUMN IF NOT EXISTS metric VARCHAR(16)
+            CHECK (metric IN ('minutes', 'workouts', 'volume', 'max_weight')),
+        ADD COLUMN IF NOT EXISTS period VARCHAR(16)
+            CHECK (period IN ('week', 'month', 'all_time')),
+        ADD COLUMN IF NOT EXISTS exercise_name VARCHAR(255);
+
+    -- Keep read_goals index-only with the new columns.
+    DROP INDEX IF EXISTS goals_user_idx;
+    CREATE INDEX goals_user_idx ON goals (user_id)
+        INCLUDE (description, target_value, current_value, metric, period, exercise_name);
+"""
+
+# Live progress of every goal of %(user_id)s. The `windows` CTE reads at most
+# one week bucket, the current month's day buckets and the lifetime row.
+_PROGRESS_CTE = """
+    windows AS (
+        SELECT 'week' AS period, duration, workouts, volume, max_weight_kg
+        FROM user_stats_buckets
+        WHERE user_id = %(user_id)s AND period = 'week'
+          AND bucket_start = date_trunc('week', CURRENT_DATE)::date
+        UNION ALL
+        SELECT 'month', SUM(duration), SUM(workouts), SUM(volume), MAX(max_weight_kg)
+        FROM user_stats_buckets
+        WHERE user_id = %(user_id)s AND period = 'day'
+          AND bucket_start >= date_trunc('month', CURRENT_DATE)::date
+        UNION ALL
+        SELECT 'all_time', total_duration, total_workouts, total_volume, max_weight_kg
+        FROM user_stats
+        WHERE user_id = %(user_id)s
+    ),
+    progress AS (
+        SELECT
+            g.id, g.description, g.target_value, g.metric, g.period, g.exercise_name,
+            CASE
+                WHEN g.metric IS NULL THEN g.current_value
+                ELSE FLOOR(COALESCE(CASE g.metric
+                    WHEN 'minutes' THEN w.duration
+                    WHEN 'workouts' THEN w.workouts
+                    WHEN 'volume' THEN w.volume
+                    WHEN 'max_weight' THEN
+                        CASE WHEN g.exercise_name IS NULL THEN w.max_weight_kg ELSE x.max_weight_kg END
+                END, 0))::int
+            END AS current_value
+        FROM goals g
+        LEFT JOIN windows w ON w.period = COALESCE(g.period, 'all_time')
+        LEFT JOIN user_exercise_stats x
+            ON x.user_id = g.user_id AND x.exercise_name = g.exercise_name
+        WHERE g.user_id = %(user_id)s
+    )
+"""
+
+# Stores the live progress of a user's structured goals (run by create_workout).
+REFRESH_GOALS_QUERY = """
+    WITH """ + _PROGRESS_CTE + """
+    UPDATE goals g
+    SET current_value = p.current_value
+    FROM progress p
+    WHERE g.id = p.id
+      AND p.metric IS NOT NULL
+      AND g.current_value IS DISTINCT FROM p.current_value;
+"""
+
+GOAL_PROGRESS_QUERY = """
+    WITH """ + _PROGRESS_CTE + """
+    SELECT
+        id, description, target_value, current_value, metric, period, exercise_name,
+        CASE WHEN COALESCE(target_value, 0) > 0
+             THEN LEAST(current_value::float / target_value, 1.0)
+             ELSE 0.0
+        END AS progress
+    FROM progress
+    ORDER BY id;
+"""
+
+
+class GoalProgress(NamedTuple):
+    id: int
+    description: str
+    target_value: Optional[int]
+    current_value: int
+    metric: Optional[str]
+    period: Optional[str]
+    exercise_name: Optional[str]
+    progress: float  # 0.0 - 1.0, ready for st.progress
+
+
+def validate_goal(metric, period, exercise_name):
+    """Checks a structured goal definition; raises ValueError if it is invalid."""
+    if metric is None:
+        if period is not None or exercise_name is not None:
+            raise ValueError("A goal period or exercise needs a metric.")
+        return
+    if metric not in GOAL_METRICS:
+        raise ValueError(f"Unknown goal metric: {metric}")
+    if period is not None and period not in GOAL_PERIODS:
+        raise ValueError(f"Unknown goal period: {period}")
+    if exercise_name is not None and metric != 'max_weight':
+        raise ValueError("Only max_weight goals can target a single exercise.")
+
+
+def refresh_goal_progress(cur, user_id):
+    """Recomputes current_value for all of a user's structured goals in one statement."""
+    cur.execute(REFRESH_GOALS_QUERY, {'user_id': user_id})
+
+
+def read_goal_progress(cur, user_id):
+    """All of a user's goals with their live progress, in one query."""
+    cur.execute(GOAL_PROGRESS_QUERY, {'user_id': user_id})
+    return [GoalProgress(*row) for row in cur.fetchall()]
@@ -0,0 +1,250 @@
+import math
+from array import array
+from datetime import date
+from typing import NamedTuple
+
+try:
+    import numpy as np
+except ImportError:  # optional; the helpers fall back to plain Python over the arrays
+    np = None
+
+# Compact columnar workout history for analytics.
+# read_workouts returns dicts of dicts with Decimal weights, which is fine for
+# a page of workouts but costs hundreds of bytes per exercise for a full
+# history. WorkoutHistory keeps one typed array per column instead (about 40
+# bytes per exercise), with exercise names dictionary-encoded and each
+# workout's exercises located through an offsets array, and is filled straight
+# from the cursor. Dates are stored as proleptic ordinals (date.toordinal()).
+# The analytics helpers use NumPy when it is installed.
+
+# Chronological, so trends and rolling averages need no sorting. Dates and
+# weights are converted to plain numbers in SQL, so no date or Decimal objects
+# are created per row.
+HISTORY_QUERY = """
+    SELECT
+        w.id,
+        w.workout_date - DATE '0001-01-01' + 1,
+        w.duration_minutes,
+        e.exercise_name, e.sets, e.reps, e.weight_kg::float8
+    FROM workouts w
+    LEFT JOIN exercises e ON e.workout_id = w.id
+    WHERE {conditions}
+    ORDER BY w.workout_date, w.id, e.id;
+"""
+
+
+def history_query(user_id, start_date=None, end_date=None):
+    """Builds HISTORY_QUERY for one user and an optional (inclusive) date range."""
+    conditions = ["w.user_id = %(user_id)s"]
+    params = {'user_id': user_id}
+    if start_date is not None:
+        conditions.append("w.workout_date >= %(start_date)s")
+        params['start_date'] = start_date
+    if end_date is not None:
+        conditions.append("w.workout_date <= %(end_date)s")
+        params['end_date'] = end_date
+    return HISTORY_QUERY.format(conditions=' AND '.join(conditions)), params
+
+
+class ExerciseTrend(NamedTuple):
+    exercise: str
+    days: list             # date ordinal of every workout containing the exercise
+    best_weights: list     # heaviest set of the exercise in that workout (kg)
+    volumes: list          # sets * reps * weight of the exercise in that workout
+    kg_per_week: float     # least-squares slope of best_weights over time
+
+
+class WorkoutHistory:
+    """A user's workouts as parallel typed arrays, oldest first.
+
+    Workout columns (one entry per workout): workout_ids, days, durations.
+    Exercise columns (one entry per exercise): codes, sets, reps, weights.
+    Exercises of workout i are rows offsets[i]:offsets[i + 1]; codes index
+    into exercise_names; missing weights are NaN.
+    """
+
+    def __init__(self):
+        self.workout_ids = array('q')
+        self.days = array('l')
+        self.durations = array('l')
+        self.offsets = array('q', [0])
+        self.codes = array('l')
+        self.sets = array('l')
+        self.reps = array('l')
+        self.weights = array('d')
+        self.exercise_names = []
+        self._code_of = {}
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Builds a history from HISTORY_QUERY rows (any iterable, e.g. a cursor)."""
+        history = cls()
+        append_workout = history._append_workout
+        append_exercise = history._append_exercise
+        last_id = None
+        for workout_id, day, duration, name, sets, reps, weight in rows:
+            if workout_id != last_id:
+                append_workout(workout_id, day, duration)
+                last_id = workout_id
+            if name is not None:
+                append_exercise(name, sets, reps, weight)
+        return history
+
+    def _append_workout(self, workout_id, day, duration):
+        self.workout_ids.append(workout_id)
+        self.days.append(day)
+        self.durations.append(duration or 0)
+        self.offsets.append(len(self.codes))
+
+    def _append_exercise(self, name, sets, reps, weight):
+        code = self._code_of.get(name)
+        if code is None:
+            code = self._code_of[name] = len(self.exercise_names)
+            self.exercise_names.append(name)
+        self.codes.append(code)
+        self.sets.append(sets or 0)
+        self.reps.append(reps or 0)
+        self.weights.append(math.nan if weight is None else weight)
+        self.offsets[-1] = len(self.codes)
+
+    def __len__(self):
+        return len(self.workout_ids)
+
+    @property
+    def exercise_count(self):
+        return len(self.codes)
+
+    @property
+    def nbytes(self):
+        """Bytes held by the column arrays."""
+        return sum(column.itemsize * len(column) for column in self._columns().values())
+
+    def _columns(self):
+        return {
+            'workout_ids': self.workout_ids, 'days': self.days, 'durations': self.durations,
+            'offsets': self.offsets, 'codes': self.codes, 'sets': self.sets,
+            'reps': self.reps, 'weights': self.weights,
+        }
+
+    def dates(self):
+        """Workout dates as datetime.date objects."""
+        return [date.fromordinal(day) for day in self.days]
+
+    def workout_index(self):
+        """For every exercise row, the index of the workout it belongs to."""
+        if np is not None:
+            return np.repeat(np.arange(len(self)), np.diff(self.as_numpy()['offsets']))
+        index = array('q')
+        for i in range(len(self)):
+            index.extend([i] * (self.offsets[i + 1] - self.offsets[i]))
+        return index
+
+    def as_numpy(self):
+        """The columns as NumPy arrays sharing memory with the underlying arrays (requires NumPy)."""
+        if np is None:
+            raise RuntimeError("NumPy is not installed.")
+        return {name: np.frombuffer(column, dtype=column.typecode) if len(column)
+                else np.zeros(0, dtype=column.typecode)
+                for name, column in self._columns().items()}
+
+    # --- Analytics ---
+
+    def exercise_volumes(self):
+        """sets * reps * weight of every exercise row (0 where the weight is missing)."""
+        if np is not None:
+            cols = self.as_numpy()
+            return np.nan_to_num(cols['sets'] * cols['reps'] * cols['weights'])
+        return array('d', (0.0 if math.isnan(w) else s * r * w
+                           for s, r, w in zip(self.sets, self.reps, self.weights)))
+
+    def workout_volumes(self):
+        """Total volume of every workout."""
+        volumes = self.exercise_volumes()
+        if np is not None:
+            totals = np.concatenate(([0.0], np.cumsum(volumes)))
+            offsets = self.as_numpy()['offsets']
+            return totals[offsets[1:]] - totals[offsets[:-1]]
+        return array('d', (math.fsum(volumes[self.offsets[i]:self.offsets[i + 1]])
+                           for i in range(len(self))))
+
+    def personal_records(self):
+        """Heaviest weight per exercise: {exercise_name: kg}, exercises without weights omitted."""
+        if np is not None:
+            best = np.full(len(self.exercise_names), np.nan)
+            cols = self.as_numpy()
+            np.fmax.at(best, cols['codes'], cols['weights'])
+            return {name: float(kg) for name, kg in zip(self.exercise_names, best) if not np.isnan(kg)}
+        best = {}
+        for code, weight in zip(self.codes, self.weights):
+            if not math.isnan(weight) and weight > best.get(code, -math.inf):
+                best[code] = weight
+        return {self.exercise_names[code]: kg for code, kg in best.items()}
+
+    def exercise_trend(self, exercise_name):
+        """Per-workout best weight and volume of one exercise, with its progression slope."""
+        code = self._code_of.get(exercise_name)
+        if code is None:
+            return ExerciseTrend(exercise_name, [], [], [], 0.0)
+        volumes = self.exercise_volumes()
+        index = self.workout_index()
+        if np is not None:
+            cols = self.as_numpy()
+            rows = np.flatnonzero(cols['codes'] == code)
+            workouts, starts = np.unique(index[rows], return_index=True)
+            weights = cols['weights'][rows]
+            best = np.fmax.reduceat(weights, starts) if len(rows) else weights
+            volume = np.add.reduceat(volumes[rows], starts) if len(rows) else volumes[rows]
+            days = cols['days'][workouts].tolist()
+            best, volume = best.tolist(), volume.tolist()
+        else:
+            per_workout = {}
+            for row, row_code in enumerate(self.codes):
+                if row_code == code:
+                    entry = per_workout.setdefault(index[row], [math.nan, 0.0])
+                    weight = self.weights[row]
+                    if not math.isnan(weight) and not weight <= entry[0]:
+                        entry[0] = weight
+                    entry[1] += volumes[row]
+            days = [self.days[i] for i in per_workout]
+            best = [entry[0] for entry in per_workout.values()]
+            volume = [entry[1] for entry in per_workout.values()]
+        return ExerciseTrend(exercise_name, days, best, volume, _slope_per_week(days, best))
+
+
+def rolling_average(values, window):
+    """Trailing mean over the last `window` values (fewer at the start); returns a list."""
+    if window < 1:
+        raise ValueError("window must be at least 1.")
+    if np is not None:
+        values = np.asarray(values, dtype=float)
+        sums = np.concatenate(([0.0], np.cumsum(values)))
+        ends = np.arange(1, len(values) + 1)
+        starts = np.maximum(ends - window, 0)
+        return ((sums[ends] - sums[starts]) / (ends - starts)).tolist()
+    averages, total = [], 0.0
+    for i, value in enumerate(values):
+        total += value
+        if i >= window:
+            total -= values[i - window]
+        averages.append(total / min(i + 1, window))
+    return averages
+
+
+def _slope_per_week(days, weights):
+    points = [(d, w) for d, w in zip(days, weights) if not math.isnan(w)]
+    if len(points) < 2:
+        return 0.0
+    mean_day = math.fsum(d for d, _ in points) / len(points)
+    mean_weight = math.fsum(w for _, w in points) / len(points)
+    spread = math.fsum((d - mean_day) ** 2 for d, _ in points)
+    if spread == 0:
+        return 0.0
+    slope = math.fsum((d - mean_day) * (w - mean_weight) for d, w in points) / spread
+    return slope * 7
+
+
+def load_history(cur, user_id, start_date=None, end_date=None):
+    """Runs HISTORY_QUERY on `cur` and builds the WorkoutHistory as the rows arrive."""
+    query, params = history_query(user_id, start_date, end_date)
+    cur.execute(query, params)
+    return WorkoutHistory.from_rows(cur)
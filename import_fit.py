@@ -0,0 +1,250 @@
+import argparse
+import csv
+import io
+import json
+import os
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from typing import NamedTuple, Optional
+
+from partitions_fit import latest_workout_date
+from stats_fit import rebuild_user_stats
+
+# Bulk import of workout history exported from wearables and other apps.
+# Rows are validated in Python (bad rows are reported, not fatal), COPYed into
+# temporary staging tables and moved into workouts/exercises with two
+# set-based INSERTs, so the cost no longer grows with one round trip per row.
+#
+# Accepted input, one exercise per row (CSV header or JSONL keys):
+#   workout_ref, workout_date, duration_minutes, exercise_name, sets, reps, weight_kg
+# JSONL lines may instead hold a whole workout:
+#   {"workout_ref": ..., "workout_date": ..., "duration_minutes": ..., "exercises": [{"name", "sets", "reps", "weight"}]}
+# workout_ref is the source app's workout id; rows sharing it form one workout.
+# Usage: python import_fit.py --user-id 1 history.csv
+
+REQUIRED_FIELDS = ('workout_ref', 'workout_date', 'duration_minutes')
+
+
+class RowValidationError(Exception):
+    """Raised for a row that cannot be imported."""
+
+
+class RowError(NamedTuple):
+    line: int
+    message: str
+
+
+class ImportResult(NamedTuple):
+    workouts_imported: int
+    exercises_imported: int
+    errors: list
+    first_date: Optional[date] = None   # dates of the oldest and newest imported workouts
+    last_date: Optional[date] = None
+
+
+STAGING_DDL = """
+    CREATE TEMP TABLE import_workouts (
+        ref TEXT PRIMARY KEY,
+        id INT,
+        workout_date DATE NOT NULL,
+        duration_minutes INT NOT NULL
+    ) ON COMMIT DROP;
+    CREATE TEMP TABLE import_exercises (
+        ref TEXT NOT NULL,
+        ord INT NOT NULL,
+        exercise_name VARCHAR(255) NOT NULL,
+        sets INT,
+        reps INT,
+        weight_kg DECIMAL
+    ) ON COMMIT DROP;
+"""
+
+
+def _optional_int(value, field):
+    if value is None or value == '':
+        return None
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise RowValidationError(f"{field} must be an integer, got {value!r}")
+    if number < 0:
+        raise RowValidationError(f"{field} must not be negative")
+    return number
+
+
+def _optional_decimal(value, field):
+    if value is None or value == '':
+        return None
+    try:
+        number = Decimal(str(value))
+    except InvalidOperation:
+        raise RowValidationError(f"{field} must be a number, got {value!r}")
+    if not number.is_finite() or number < 0:
+        raise RowValidationError(f"{field} must be a non-negative number")
+    return number
+
+
+def _parse_workout(record):
+    for field in REQUIRED_FIELDS:
+        if record.get(field) in (None, ''):
+            raise RowValidationError(f"missing {field}")
+    try:
+        workout_date = date.fromisoformat(str(record['workout_date'])[:10])
+    except ValueError:
+        raise RowValidationError(f"workout_date must be YYYY-MM-DD, got {record['workout_date']!r}")
+    if workout_date > latest_workout_date():
+        raise RowValidationError(f"workout_date {workout_date} is after {latest_workout_date()}")
+    duration = _optional_int(record['duration_minutes'], 'duration_minutes')
+    if not duration:
+        raise RowValidationError("duration_minutes must be positive")
+    return str(record['workout_ref']), workout_date, duration
+
+
+def _parse_exercise(record, name_key='exercise_name', weight_key='weight_kg'):
+    if not isinstance(record, dict):
+        raise RowValidationError(f"exercise must be an object, got {record!r}")
+    name = record.get(name_key) or ''
+    if not isinstance(name, str):
+        raise RowValidationError(f"{name_key} must be a string, got {name!r}")
+    name = name.strip()
+    if not name:
+        return None
+    if len(name) > 255:
+        raise RowValidationError("exercise name is longer than 255 characters")
+    return (name,
+            _optional_int(record.get('sets'), 'sets'),
+            _optional_int(record.get('reps'), 'reps'),
+            _optional_decimal(record.get(weight_key), weight_key))
+
+
+def read_records(fileobj, fmt):
+    """Yields (line number, record dict) pairs from a CSV or JSONL file object."""
+    if fmt == 'csv':
+        reader = csv.DictReader(fileobj)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == 'jsonl':
+        for line_no, line in enumerate(fileobj, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_no, e
+                continue
+            yield line_no, record
+    else:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+
+def collect_rows(records):
+    """Validates records; returns (workouts, exercises, errors) ready for staging."""
+    workouts = {}    # ref -> (workout_date, duration)
+    exercises = []   # (ref, ord, name, sets, reps, weight)
+    errors = []
+    for line_no, record in records:
+        try:
+            if not isinstance(record, dict):
+                raise RowValidationError(f"invalid JSON: {record}")
+            ref, workout_date, duration = _parse_workout(record)
+            if 'exercises' in record:
+                items = record['exercises'] or []
+                if not isinstance(items, list):
+                    raise RowValidationError(f"exercises must be a list, got {items!r}")
+                parsed = [_parse_exercise(e, 'name', 'weight') for e in items]
+            else:
+                parsed = [_parse_exercise(record)]
+            known = workouts.get(ref)
+            if known is None:
+                workouts[ref] = (workout_date, duration)
+            elif known != (workout_date, duration):
+                raise RowValidationError(f"workout {ref} has conflicting date or duration")
+            for exercise in parsed:
+                if exercise is not None:
+                    exercises.append((ref, len(exercises)) + exercise)
+        except RowValidationError as e:
+            errors.append(RowError(line_no, str(e)))
+    return workouts, exercises, errors
+
+
+def _csv_buffer(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(['' if value is None else value for value in row])
+    buffer.seek(0)
+    return buffer
+
+
+def date_range(workouts):
+    """(oldest, newest) workout date of collect_rows' workouts, or (None, None)."""
+    dates = [workout_date for workout_date, _ in workouts.values()]
+    return (min(dates), max(dates)) if dates else (None, None)
+
+
+def import_records(cur, user_id, records):
+    """Imports validated records for a user in the caller's transaction; returns an ImportResult."""
+    workouts, exercises, errors = collect_rows(records)
+    if not workouts:
+        return ImportResult(0, 0, errors)
+
+    cur.execute(STAGING_DDL)
+    cur.copy_expert(
+        "COPY import_workouts (ref, workout_date, duration_minutes) FROM STDIN WITH (FORMAT csv);",
+        _csv_buffer((ref, d.isoformat(), duration) for ref, (d, duration) in workouts.items())
+    )
+    cur.copy_expert(
+        "COPY import_exercises (ref, ord, exercise_name, sets, reps, weight_kg) FROM STDIN WITH (FORMAT csv);",
+        _csv_buffer(exercises)
+    )
+    # Reserve workout ids up front so exercises can be linked without a per-row RETURNING.
+    cur.execute("""
+        UPDATE import_workouts
+        SET id = nextval(pg_get_serial_sequence('workouts', 'id'));
+    """)
+    cur.execute("""
+        INSERT INTO workouts (id, user_id, workout_date, duration_minutes)
+        SELECT id, %s, workout_date, duration_minutes
+        FROM import_workouts
+        ORDER BY id;
+    """, (user_id,))
+    workouts_imported = cur.rowcount
+    cur.execute("""
+        INSERT INTO exercises (workout_id, workout_date, exercise_name, sets, reps, weight_kg)
+        SELECT w.id, w.workout_date, e.exercise_name, e.sets, e.reps, e.weight_kg
+        FROM import_exercises e
+        JOIN import_workouts w ON w.ref = e.ref
+        ORDER BY w.id, e.ord;
+    """)
+    exercises_imported = cur.rowcount
+    rebuild_user_stats(cur, user_id)
+    return ImportResult(workouts_imported, exercises_imported, errors, *date_range(workouts))
+
+
+def detect_format(path):
+    """Guesses the import format from a file name."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.jsonl', '.ndjson', '.json'):
+        return 'jsonl'
+    return 'csv'
+
+
+def main():
+    import backend_fit as db
+
+    parser = argparse.ArgumentParser(description="Bulk import workouts from CSV or JSONL exports.")
+    parser.add_argument('--user-id', type=int, required=True)
+    parser.add_argument('--format', choices=('csv', 'jsonl'))
+    parser.add_argument('path')
+    args = parser.parse_args()
+
+    result = db.import_workouts(args.user_id, args.path, args.format)
+    if result is None:
+        raise SystemExit(1)
+    print(f"Imported {result.workouts_imported} workouts and {result.exercises_imported} exercises.")
+    for error in result.errors:
+        print(f"  line {error.line}: {error.message}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,294 @@
+import argparse
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import date
+from decimal import Decimal
+from typing import NamedTuple
+
+from instrumentation_fit import log_error
+
+# Write-behind ingestion of workouts for peak hours, when one connection and
+# one commit per create_workout makes the database commit-bound.
+# WorkoutQueue is a durable local queue: an append-only file of JSON lines
+# (fsynced on every append) plus a checkpoint file holding the byte offset up
+# to which records are committed to the database. IngestWorker is a single
+# background thread that reads records in file order and hands them to
+# apply_batch, which writes a whole batch in one transaction (group commit),
+# and only then advances the checkpoint. A crash between the commit and the
+# checkpoint replays the batch; every record carries an idempotency key that
+# the database enforces, so replays and client retries never create duplicate
+# workouts. Records the database rejects (e.g. a deleted user) go to
+# <path>.rejected so they cannot block the queue.
+# backend_fit.create_workout uses this path when INGEST_CONFIG['enabled'] is set.
+# Usage: python ingest_fit.py status
+#        python ingest_fit.py drain
+
+# The queue file is truncated once everything in it is committed and it is larger than this.
+COMPACT_BYTES = 16 * 1024 * 1024
+
+
+class IngestResult(NamedTuple):
+    """Outcome of one apply_batch call."""
+    applied: int
+    duplicates: int
+    rejected: list   # (record, error) pairs the database refused
+
+
+def new_idempotency_key():
+    return uuid.uuid4().hex
+
+
+def workout_record(user_id, workout_date, duration, exercises, idempotency_key=None):
+    """A queue record for one create_workout call."""
+    return {
+        'key': idempotency_key or new_idempotency_key(),
+        'user_id': user_id,
+        'date': workout_date.isoformat(),
+        'duration': duration,
+        'exercises': [{'name': e['name'], 'sets': e.get('sets'), 'reps': e.get('reps'),
+                       'weight': None if e.get('weight') is None else str(e['weight'])}
+                      for e in exercises],
+        'queued_at': time.time(),
+    }
+
+
+def record_args(record):
+    """(user_id, date, duration, exercises, idempotency_key) of a queue record."""
+    exercises = [{'name': e['name'], 'sets': e['sets'], 'reps': e['reps'],
+                  'weight': None if e['weight'] is None else Decimal(e['weight'])}
+                 for e in record['exercises']]
+    return record['user_id'], date.fromisoformat(record['date']), record['duration'], exercises, record['key']
+
+
+class WorkoutQueue:
+    """Append-only file of pending workout records with a committed-offset checkpoint."""
+
+    def __init__(self, path, fsync=True):
+        self.path = path
+        self.checkpoint_path = path + '.checkpoint'
+        self.rejected_path = path + '.rejected'
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._file = open(path, 'ab')
+        self._drop_torn_tail()
+        self.committed = min(self._read_checkpoint(), self._file.tell())
+
+    def _drop_torn_tail(self):
+        # A crash in the middle of an append leaves a partial last line; it was
+        # never acknowledged, so it is dropped before anything is appended after it.
+        size = self._file.tell()
+        with open(self.path, 'rb') as f:
+            f.seek(max(size - 1, 0))
+            if size == 0 or f.read(1) == b'\n':
+                return
+            f.seek(0)
+            end = f.read().rfind(b'\n') + 1
+        if end != size:
+            self._file.truncate(end)
+            self._file.seek(end)
+
+    def _read_checkpoint(self):
+        try:
+            with open(self.checkpoint_path, encoding='utf-8') as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _write_checkpoint(self, offset):
+        tmp = self.checkpoint_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(str(offset))
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp, self.checkpoint_path)
+
+    def append(self, record):
+        """Durably appends a record; returns the file offset just after it."""
+        line = json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            return self._file.tell()
+
+    def end(self):
+        """Offset just after the last appended record."""
+        with self._lock:
+            return self._file.tell()
+
+    def read_batch(self, max_records):
+        """Up to max_records records after the checkpoint, oldest first; returns (records, end offset)."""
+        records = []
+        with open(self.path, 'rb') as f:
+            f.seek(self.committed)
+            offset = self.committed
+            while len(records) < max_records:
+                line = f.readline()
+                if not line.endswith(b'\n'):
+                    break  # nothing more, or an append still in progress
+                records.append(json.loads(line))
+                offset += len(line)
+        return records, offset
+
+    def commit(self, offset):
+        """Marks everything before `offset` as committed to the database."""
+        self._write_checkpoint(offset)
+        self.committed = offset
+        with self._lock:
+            if offset == self._file.tell() and offset > COMPACT_BYTES:
+                # Checkpoint first: a crash before the truncate only replays
+                # committed records, which their idempotency keys make harmless.
+                self._write_checkpoint(0)
+                self._file.truncate(0)
+                self._file.seek(0)
+                self.committed = 0
+
+    def pending(self):
+        """Number of records not yet committed to the database."""
+        with open(self.path, 'rb') as f:
+            f.seek(self.committed)
+            return sum(1 for line in f if line.endswith(b'\n'))
+
+    def reject(self, record, error):
+        """Sets aside a record the database refused, with the reason."""
+        with open(self.rejected_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'error': str(error), 'record': record}) + '\n')
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class IngestWorker:
+    """Background thread that group-commits queued workouts through apply_batch(records)."""
+
+    def __init__(self, queue, apply_batch, batch_size=200, max_delay=0.05, retry_delay=1.0):
+        self.queue = queue
+        self.apply_batch = apply_batch
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.retry_delay = retry_delay
+        self._wake = threading.Event()
+        self._stopping = False
+        self._cond = threading.Condition()
+        self._thread = None
+        self.batches = 0
+        self.applied = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.failures = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='workout-ingest', daemon=True)
+            self._thread.start()
+            self._wake.set()  # records left over from a previous run
+        return self
+
+    def submit(self, record):
+        """Queues a record durably and wakes the worker; returns its idempotency key."""
+        self.queue.append(record)
+        self._wake.set()
+        return record['key']
+
+    def _run(self):
+        while not self._stopping:
+            if not self._wake.wait(timeout=1.0):
+                continue
+            # Let concurrent submitters add to the batch before committing it.
+            time.sleep(self.max_delay)
+            self._wake.clear()
+            self._drain()
+
+    def _drain(self):
+        while True:
+            records, offset = self.queue.read_batch(self.batch_size)
+            if not records:
+                break
+            try:
+                result = self.apply_batch(records)
+            except Exception as e:
+                self.failures += 1
+                log_error("Error committing queued workouts", e)
+                time.sleep(self.retry_delay)
+                self._wake.set()
+                break
+            for record, error in result.rejected:
+                log_error("Rejected queued workout", error)
+                self.queue.reject(record, error)
+            self.queue.commit(offset)
+            self.batches += 1
+            self.applied += result.applied
+            self.duplicates += result.duplicates
+            self.rejected += len(result.rejected)
+        with self._cond:
+            self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """Waits until every queued record is committed; returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self._wake.set()
+        with self._cond:
+            while self.queue.committed < self.queue.end():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining if remaining is not None else 1.0)
+        return True
+
+    def stop(self, drain=True, timeout=30.0):
+        """Stops the worker, first committing what is queued if `drain` is set."""
+        if drain and self._thread is not None:
+            self.flush(timeout)
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.queue.close()
+
+    def stats(self):
+        return {
+            'pending': self.queue.pending(),
+            'batches': self.batches,
+            'applied': self.applied,
+            'duplicates': self.duplicates,
+            'rejected': self.rejected,
+            'failures': self.failures,
+            'avg_batch': (self.applied + self.duplicates + self.rejected) / self.batches if self.batches else 0.0,
+        }
+
+
+def main():
+    import backend_fit as db
+
+    parser = argparse.ArgumentParser(description="Inspect or drain the write-behind workout queue.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('status', help="Show pending and rejected records")
+    sub.add_parser('drain', help="Commit every pending record to the database")
+    args = parser.parse_args()
+
+    if args.command == 'status':
+        queue = WorkoutQueue(db.INGEST_CONFIG['path'], fsync=False)
+        rejected = 0
+        if os.path.exists(queue.rejected_path):
+            with open(queue.rejected_path, encoding='utf-8') as f:
+                rejected = sum(1 for _ in f)
+        print(f"{queue.pending()} pending, {rejected} rejected ({queue.path}).")
+        queue.close()
+    elif args.command == 'drain':
+        db.INGEST_CONFIG['enabled'] = True
+        worker = db.get_ingest_worker()
+        worker.flush()
+        stats = worker.stats()
+        db.close_pool()
+        print(f"Committed {stats['applied']} workouts in {stats['batches']} batches "
+              f"({stats['duplicates']} duplicates, {stats['rejected']} rejected).")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+from datetime import date
+from decimal import Decimal
+from typing import NamedTuple, Optional
+
+# Single-round-trip insights engine used by backend_fit.get_business_insights.
+# read_insights serves every metric from the stats rollups (one user_stats row
+# plus the user's per-exercise rows); compute_insights derives the same result
+# from one scan of the raw workouts and is kept for verification and benchmarks.
+
+
+class Insights(NamedTuple):
+    """Aggregate workout metrics for one user."""
+    total_workouts: int
+    total_duration: int
+    avg_duration: Decimal
+    min_duration: int
+    max_duration: int
+    max_weight_lifted: Decimal
+    total_volume: Decimal          # SUM(sets * reps * weight_kg)
+    weekly_frequency: float        # workouts per week between first and last workout
+    first_workout_date: Optional[date]
+    last_workout_date: Optional[date]
+    exercise_prs: dict             # exercise name -> heaviest weight_kg
+
+
+INSIGHTS_QUERY = """
+    WITH w AS (
+        SELECT id, workout_date, duration_minutes
+        FROM workouts
+        WHERE user_id = %s
+    ),
+    workout_totals AS (
+        SELECT
+            COUNT(*) AS total_workouts,
+            COALESCE(SUM(duration_minutes), 0) AS total_duration,
+            COALESCE(AVG(duration_minutes), 0) AS avg_duration,
+            COALESCE(MIN(duration_minutes), 0) AS min_duration,
+            COALESCE(MAX(duration_minutes), 0) AS max_duration,
+            MIN(workout_date) AS first_workout_date,
+            MAX(workout_date) AS last_workout_date
+        FROM w
+    ),
+    exercise_totals AS (
+        SELECT
+            e.exercise_name,
+            MAX(e.weight_kg) AS pr,
+            SUM(e.sets * e.reps * e.weight_kg) AS volume
+        FROM exercises e
+        JOIN w ON e.workout_id = w.id
+        GROUP BY e.exercise_name
+    )
+    SELECT
+        t.total_workouts, t.total_duration, t.avg_duration,
+        t.min_duration, t.max_duration,
+        t.first_workout_date, t.last_workout_date,
+        (SELECT COALESCE(MAX(pr), 0) FROM exercise_totals),
+        (SELECT COALESCE(SUM(volume), 0) FROM exercise_totals),
+        (SELECT array_agg(exercise_name ORDER BY exercise_name) FROM exercise_totals WHERE pr IS NOT NULL),
+        (SELECT array_agg(pr ORDER BY exercise_name) FROM exercise_totals WHERE pr IS NOT NULL)
+    FROM workout_totals t;
+"""
+
+
+ROLLUP_INSIGHTS_QUERY = """
+    SELECT
+        s.total_workouts, s.total_duration,
+        COALESCE(s.total_duration::numeric / NULLIF(s.total_workouts, 0), 0),
+        COALESCE(s.min_duration, 0), COALESCE(s.max_duration, 0),
+        s.first_workout_date, s.last_workout_date,
+        COALESCE(s.max_weight_kg, 0), s.total_volume,
+        x.names, x.prs
+    FROM user_stats s
+    LEFT JOIN LATERAL (
+        SELECT array_agg(exercise_name ORDER BY exercise_name) AS names,
+               array_agg(max_weight_kg ORDER BY exercise_name) AS prs
+        FROM user_exercise_stats
+        WHERE user_id = s.user_id AND max_weight_kg IS NOT NULL
+    ) x ON TRUE
+    WHERE s.user_id = %s;
+"""
+
+
+def weekly_frequency(total_workouts, first_date, last_date):
+    """Average workouts per week over the span between the first and last workout."""
+    if not total_workouts or first_date is None or last_date is None:
+        return 0.0
+    weeks = (last_date - first_date).days // 7 + 1
+    return total_workouts / weeks
+
+
+def empty_insights():
+    """Insights for a user who has not logged any workouts."""
+    return Insights(0, 0, Decimal(0), 0, 0, Decimal(0), Decimal(0), 0.0, None, None, {})
+
+
+def insights_from_row(row):
+    """Builds Insights from a row of INSIGHTS_QUERY or ROLLUP_INSIGHTS_QUERY."""
+    (total_workouts, total_duration, avg_duration, min_duration, max_duration,
+     first_date, last_date, max_weight, total_volume, pr_names, pr_weights) = row
+    return Insights(
+        total_workouts=total_workouts,
+        total_duration=total_duration,
+        avg_duration=avg_duration,
+        min_duration=min_duration,
+        max_duration=max_duration,
+        max_weight_lifted=max_weight,
+        total_volume=total_volume,
+        weekly_frequency=weekly_frequency(total_workouts, first_date, last_date),
+        first_workout_date=first_date,
+        last_workout_date=last_date,
+        exercise_prs=dict(zip(pr_names or [], pr_weights or [])),
+    )
+
+
+def compute_insights(cur, user_id):
+    """Computes all insights for a user by scanning their raw workouts in one statement."""
+    cur.execute(INSIGHTS_QUERY, (user_id,))
+    return insights_from_row(cur.fetchone())
+
+
+def read_insights(cur, user_id):
+    """Reads all insights for a user from the stats rollups in one statement."""
+    cur.execute(ROLLUP_INSIGHTS_QUERY, (user_id,))
+    row = cur.fetchone()
+    return insights_from_row(row) if row else empty_insights()
@@ -0,0 +1,377 @@
+import functools
+import inspect
+import json
+import logging
+import threading
+import time
+import zlib
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import psycopg2.extensions
+
+from pool_fit import LatencyHistogram
+
+# Instrumentation for backend_fit.
+#  - @instrumented backend functions record call latency and row counts.
+#  - InstrumentedCursor (the cursor_factory of pooled connections) records
+#    every statement, attributed to the backend function that issued it.
+#  - track_acquire records how long each function waited for a connection.
+#  - log_error keeps the printed error messages and also counts the error and
+#    emits a structured (JSON) record on the 'fitness_tracker.backend' logger.
+# Calls and statements over the configured thresholds go to a bounded
+# in-memory slow log and the 'fitness_tracker.slow_queries' logger.
+# render_prometheus / render_text export everything; serve() exposes both
+# over HTTP for local scraping (/metrics and /).
+
+logger = logging.getLogger('fitness_tracker.backend')
+slow_logger = logging.getLogger('fitness_tracker.slow_queries')
+logger.addHandler(logging.NullHandler())
+slow_logger.addHandler(logging.NullHandler())
+
+_local = threading.local()
+
+
+def _call_stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def current_function():
+    """Name of the innermost instrumented function running on this thread, if any."""
+    stack = _call_stack()
+    return stack[-1] if stack else None
+
+
+def normalize_sql(query):
+    """Collapses whitespace so the same statement always maps to the same series."""
+    return ' '.join(query.split())
+
+
+class Series:
+    """Latency histogram plus counters for one function or statement."""
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.errors = 0
+        self.rows = 0
+
+
+class Metrics:
+    """Registry of function, statement and connection-acquire metrics."""
+
+    def __init__(self, slow_call_ms=500.0, slow_statement_ms=100.0, slow_log_size=200):
+        self.enabled = True
+        self.slow_call_ms = slow_call_ms
+        self.slow_statement_ms = slow_statement_ms
+        self.slow_log = deque(maxlen=slow_log_size)
+        self.functions = {}    # function name -> Series
+        self.statements = {}   # (function name, normalized SQL) -> Series
+        self.acquire = {}      # function name -> LatencyHistogram
+        self._lock = threading.Lock()
+
+    def configure(self, enabled=None, slow_call_ms=None, slow_statement_ms=None,
+                  slow_log_size=None, slow_log_file=None):
+        """Updates settings; keys mirror backend_fit.INSTRUMENTATION_CONFIG."""
+        if enabled is not None:
+            self.enabled = enabled
+        if slow_call_ms is not None:
+            self.slow_call_ms = slow_call_ms
+        if slow_statement_ms is not None:
+            self.slow_statement_ms = slow_statement_ms
+        if slow_log_size is not None:
+            with self._lock:
+                self.slow_log = deque(self.slow_log, maxlen=slow_log_size)
+        if slow_log_file and not any(getattr(h, 'baseFilename', None) == slow_log_file
+                                     for h in slow_logger.handlers):
+            slow_logger.addHandler(logging.FileHandler(slow_log_file, encoding='utf-8'))
+            slow_logger.setLevel(logging.INFO)
+
+    def _series(self, table, key):
+        series = table.get(key)
+        if series is None:
+            with self._lock:
+                series = table.setdefault(key, Series())
+        return series
+
+    def _slow(self, entry):
+        entry['at'] = time.time()
+        with self._lock:
+            self.slow_log.append(entry)
+        slow_logger.warning(json.dumps(entry, default=str))
+
+    def record_call(self, function, seconds):
+        self._series(self.functions, function).latency.observe(seconds)
+        if seconds * 1000 >= self.slow_call_ms:
+            self._slow({'type': 'call', 'function': function, 'ms': round(seconds * 1000, 3)})
+
+    def record_statement(self, query, seconds, rows, failed=False):
+        function = current_function() or '<none>'
+        sql = normalize_sql(query)
+        series = self._series(self.statements, (function, sql))
+        caller = self._series(self.functions, function)
+        series.latency.observe(seconds)
+        rows = max(rows or 0, 0)
+        with self._lock:
+            series.rows += rows
+            series.errors += failed
+            caller.rows += rows
+        if seconds * 1000 >= self.slow_statement_ms:
+            self._slow({'type': 'statement', 'function': function, 'ms': round(seconds * 1000, 3),
+                        'rows': rows, 'failed': failed, 'statement': sql})
+
+    def record_acquire(self, seconds):
+        function = current_function() or '<none>'
+        histogram = self.acquire.get(function)
+        if histogram is None:
+            with self._lock:
+                histogram = self.acquire.setdefault(function, LatencyHistogram())
+        histogram.observe(seconds)
+
+    def record_error(self, function):
+        series = self._series(self.functions, function or '<none>')
+        with self._lock:
+            series.errors += 1
+
+    def slow_queries(self, limit=None):
+        """The most recent slow calls and statements, newest first."""
+        with self._lock:
+            entries = list(self.slow_log)[::-1]
+        return entries[:limit] if limit is not None else entries
+
+    def reset(self):
+        with self._lock:
+            self.functions.clear()
+            self.statements.clear()
+            self.acquire.clear()
+            self.slow_log.clear()
+
+
+metrics = Metrics()
+
+
+# --- Hooks used by backend_fit ---
+
+def instrumented(fn):
+    """Decorator recording the latency of every call (for generators: of the whole iteration)."""
+    name = fn.__name__
+
+    if inspect.isgeneratorfunction(fn):
+        @functools.wraps(fn)
+        def generator_wrapper(*args, **kwargs):
+            gen = fn(*args, **kwargs)
+            if not metrics.enabled:
+                yield from gen
+                return
+            # The name is only on the stack while the generator body runs, not
+            # while the caller consumes what it yielded.
+            stack = _call_stack()
+            started = time.perf_counter()
+            try:
+                while True:
+                    stack.append(name)
+                    try:
+                        item = next(gen)
+                    except StopIteration:
+                        return
+                    finally:
+                        stack.pop()
+                    yield item
+            finally:
+                gen.close()
+                metrics.record_call(name, time.perf_counter() - started)
+        return generator_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not metrics.enabled:
+            return fn(*args, **kwargs)
+        stack = _call_stack()
+        stack.append(name)
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            metrics.record_call(name, time.perf_counter() - started)
+            stack.pop()
+    return wrapper
+
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    """psycopg2 cursor that times every statement and counts the rows it touched."""
+
+    def _timed(self, query, run):
+        if not metrics.enabled:
+            return run()
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = run()
+            failed = False
+            return result
+        finally:
+            if hasattr(query, 'as_string'):
+                query = query.as_string(self)
+            elif isinstance(query, bytes):
+                query = query.decode('utf-8', 'replace')
+            metrics.record_statement(query, time.perf_counter() - started,
+                                     0 if failed else self.rowcount, failed)
+
+    def execute(self, query, vars=None):
+        return self._timed(query, lambda: super(InstrumentedCursor, self).execute(query, vars))
+
+    def executemany(self, query, vars_list):
+        return self._timed(query, lambda: super(InstrumentedCursor, self).executemany(query, vars_list))
+
+    def copy_expert(self, sql, file, size=8192):
+        return self._timed(sql, lambda: super(InstrumentedCursor, self).copy_expert(sql, file, size))
+
+
+@contextmanager
+def track_acquire(connection_context):
+    """Wraps a pool's connection() context manager, recording the time spent acquiring."""
+    started = time.perf_counter()
+    with connection_context as conn:
+        if metrics.enabled:
+            metrics.record_acquire(time.perf_counter() - started)
+        yield conn
+
+
+def thread_error_count():
+    """Errors logged on the current thread so far (lets callers attribute swallowed errors)."""
+    return getattr(_local, 'errors', 0)
+
+
+def log_error(message, error):
+    """Prints `message: error` as before, counts it and logs a structured record."""
+    print(f"{message}: {error}")
+    _local.errors = thread_error_count() + 1
+    function = current_function()
+    if metrics.enabled:
+        metrics.record_error(function)
+    logger.error(json.dumps({
+        'event': 'backend_error',
+        'function': function,
+        'message': message,
+        'error_type': type(error).__name__,
+        'error': str(error),
+        'pgcode': getattr(error, 'pgcode', None),
+    }))
+
+
+# --- Exporters ---
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+
+def _statement_id(sql):
+    return f"{zlib.crc32(sql.encode('utf-8')):08x}"
+
+
+def _histogram_lines(name, labels, histogram):
+    snap = histogram.snapshot()
+    base = ','.join(f'{key}="{_label(value)}"' for key, value in labels.items())
+    sep = ',' if base else ''
+    for bound, count in snap['buckets']:
+        le = '+Inf' if bound == float('inf') else repr(bound)
+        yield f'{name}_bucket{{{base}{sep}le="{le}"}} {count}'
+    yield f'{name}_sum{{{base}}} {snap["sum"]}'
+    yield f'{name}_count{{{base}}} {snap["count"]}'
+
+
+def render_prometheus(pool_stats=None, statement_chars=120):
+    """Prometheus text exposition of all metrics; pool_stats is ConnectionPool.stats() output."""
+    lines = [
+        '# HELP fitness_function_duration_seconds Latency of backend_fit calls.',
+        '# TYPE fitness_function_duration_seconds histogram',
+    ]
+    functions = sorted(metrics.functions.items())
+    for function, series in functions:
+        lines.extend(_histogram_lines('fitness_function_duration_seconds', {'function': function}, series.latency))
+    lines += ['# HELP fitness_function_errors_total Errors logged by backend_fit calls.',
+              '# TYPE fitness_function_errors_total counter']
+    lines += [f'fitness_function_errors_total{{function="{_label(f)}"}} {s.errors}' for f, s in functions]
+    lines += ['# HELP fitness_function_rows_total Rows returned or affected by the statements of a call.',
+              '# TYPE fitness_function_rows_total counter']
+    lines += [f'fitness_function_rows_total{{function="{_label(f)}"}} {s.rows}' for f, s in functions]
+
+    statements = sorted(metrics.statements.items())
+    lines += ['# HELP fitness_statement_duration_seconds Latency of SQL statements by issuing function.',
+              '# TYPE fitness_statement_duration_seconds histogram']
+    for (function, sql), series in statements:
+        labels = {'function': function, 'statement_id': _statement_id(sql), 'statement': sql[:statement_chars]}
+        lines.extend(_histogram_lines('fitness_statement_duration_seconds', labels, series.latency))
+    lines += ['# HELP fitness_statement_rows_total Rows returned or affected by SQL statements.',
+              '# TYPE fitness_statement_rows_total counter']
+    for (function, sql), series in statements:
+        lines.append(f'fitness_statement_rows_total{{function="{_label(function)}",'
+                     f'statement_id="{_statement_id(sql)}"}} {series.rows}')
+
+    lines += ['# HELP fitness_connection_acquire_seconds Time spent waiting for a pooled connection.',
+              '# TYPE fitness_connection_acquire_seconds histogram']
+    for function, histogram in sorted(metrics.acquire.items()):
+        lines.extend(_histogram_lines('fitness_connection_acquire_seconds', {'function': function}, histogram))
+
+    if pool_stats:
+        for key in ('in_use', 'idle', 'maxconn'):
+            lines += [f'# TYPE fitness_pool_{key} gauge', f'fitness_pool_{key} {pool_stats[key]}']
+        for key in ('checkouts', 'timeouts', 'connections_opened', 'connections_discarded', 'connections_reaped'):
+            lines += [f'# TYPE fitness_pool_{key}_total counter', f'fitness_pool_{key}_total {pool_stats[key]}']
+    return '\n'.join(lines) + '\n'
+
+
+def _summary_row(label, series):
+    h = series.latency
+    # Percentiles are bucket bounds; never report them above the observed max.
+    p50, p95 = min(h.percentile(50), h.max), min(h.percentile(95), h.max)
+    return (f"{label:<60} {h.count:>8} {series.errors:>6} {series.rows:>10} "
+            f"{p50 * 1000:>9.1f} {p95 * 1000:>9.1f} {h.max * 1000:>9.1f}")
+
+
+def render_text(top=20):
+    """Human-readable report: calls and statements by total time, then the slow log."""
+    header = f"{'':<60} {'calls':>8} {'errors':>6} {'rows':>10} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}"
+    lines = ["Backend calls (by total time)", header]
+    for function, series in sorted(metrics.functions.items(), key=lambda item: -item[1].latency.total)[:top]:
+        lines.append(_summary_row(function, series))
+    lines += ["", "Statements (by total time)", header]
+    for (function, sql), series in sorted(metrics.statements.items(), key=lambda item: -item[1].latency.total)[:top]:
+        lines.append(_summary_row(f"{function}: {sql}"[:60], series))
+    lines += ["", f"Slow log (calls >= {metrics.slow_call_ms} ms, statements >= {metrics.slow_statement_ms} ms)"]
+    for entry in metrics.slow_queries(top):
+        detail = entry.get('statement', '')[:80]
+        lines.append(f"{time.strftime('%H:%M:%S', time.localtime(entry['at']))} "
+                     f"{entry['type']:<9} {entry['function']:<28} {entry['ms']:>9.1f} ms {detail}")
+    return '\n'.join(lines) + '\n'
+
+
+def serve(port, host='127.0.0.1', pool_stats=None):
+    """Serves /metrics (Prometheus) and / (text report) from a daemon thread; returns the server."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith('/metrics'):
+                body = render_prometheus(pool_stats() if pool_stats else None)
+                content_type = 'text/plain; version=0.0.4'
+            elif self.path in ('/', '/text'):
+                body = render_text()
+                content_type = 'text/plain; charset=utf-8'
+            else:
+                self.send_error(404)
+                return
+            data = body.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name='metrics-exporter', daemon=True).start()
+    return server
@@ -0,0 +1,624 @@
+import random
+import threading
+from datetime import date, timedelta
+from decimal import Decimal
+
+from cache_fit import TTLCache
+from leaderboard_fit import METRICS, WINDOW_SOURCES, Leaderboard, LeaderboardRow, normalize_metric
+
+# Precomputed leaderboards kept up to date by the write path.
+#
+# Global boards live in a sorted-set store, one set per (metric, window
+# bucket), e.g. "minutes:week:2026-10-12". The store is either in-process
+# (LocalSortedSetStore) or Redis (RedisSortedSetStore) so several app
+# processes can share it. Friend boards are small LocalSortedSets cached per
+# (user, metric, window bucket) with LRU/TTL eviction. create_workout,
+# delete_user and friendship changes patch both kinds of board in place
+# instead of dropping them. LocalSortedSet is an indexable skip list (the
+# structure behind Redis sorted sets), so updates and rank-of-user reads are
+# O(log n) and a top-N read is O(log n + N).
+# A workout delta carries the id of the transaction that wrote it and a global
+# board remembers the database snapshot it was loaded under, so a delta racing
+# a load is applied exactly once: deltas arriving during the load are held
+# back and replayed, and deltas the snapshot already saw are skipped. (With the
+# Redis store only the loads of this process are known.)
+
+# Rollup query for every user's score in one window, keyed by the window start.
+GLOBAL_SCORE_SOURCES = {
+    'week': """
+        SELECT user_id, {column}
+        FROM user_stats_buckets
+        WHERE period = 'week' AND bucket_start = %(start)s
+    """,
+    'month': """
+        SELECT user_id, SUM({column})
+        FROM user_stats_buckets
+        WHERE period = 'day' AND bucket_start >= %(start)s AND bucket_start < %(end)s
+        GROUP BY user_id
+    """,
+    'all_time': """
+        SELECT user_id, {column}
+        FROM user_stats
+    """,
+}
+ALL_TIME_COLUMNS = {'duration': 'total_duration', 'workouts': 'total_workouts', 'volume': 'total_volume'}
+
+
+def window_start(window, day):
+    """First day of the window bucket containing `day` (None for all time)."""
+    if window == 'week':
+        return day - timedelta(days=day.weekday())
+    if window == 'month':
+        return day.replace(day=1)
+    return None
+
+
+def window_key(metric, window, day=None):
+    """Sorted-set key of the bucket of `window` containing `day` (default: today)."""
+    start = window_start(window, day or date.today())
+    return f"{metric}:{window}" if start is None else f"{metric}:{window}:{start.isoformat()}"
+
+
+def key_overlaps(key, first_date, last_date):
+    """Whether the board of a window_key counts workouts dated first_date..last_date (None: any date)."""
+    _, window, *start = key.split(':')
+    if first_date is None or not start:
+        return True
+    start = date.fromisoformat(start[0])
+    return window_start(window, first_date) <= start <= window_start(window, last_date)
+
+
+def snapshot_includes(snapshot, xact):
+    """Whether transaction `xact` is visible in a pg_current_snapshot() text 'xmin:xmax:xip,...'."""
+    xmin, xmax, in_progress = snapshot.split(':')
+    if xact < int(xmin):
+        return True
+    return xact < int(xmax) and str(xact) not in in_progress.split(',')
+
+
+def board_score(score):
+    """
+    A store score as the int or Decimal the rollups and workout deltas use.
+    Redis hands scores back as floats, and a float friend-board score would
+    not add up with a Decimal volume delta.
+    """
+    if score is None:
+        return 0
+    if isinstance(score, float):
+        return int(score) if score.is_integer() else Decimal(repr(score))
+    return score
+
+
+def load_global_scores(cur, metric, window, day=None):
+    """
+    Reads every user's score for a metric in the window bucket containing
+    `day`; returns the (user_id, score) rows and the snapshot they were read under.
+    """
+    metric = normalize_metric(metric)
+    column = METRICS[metric]
+    if window == 'all_time':
+        column = ALL_TIME_COLUMNS[column]
+    start = window_start(window, day or date.today())
+    end = None
+    if window == 'month':
+        end = (start + timedelta(days=32)).replace(day=1)
+    cur.execute(f"""
+        SELECT pg_current_snapshot()::text, array_agg(s.user_id), array_agg(s.score)
+        FROM ({GLOBAL_SCORE_SOURCES[window].format(column=column)}) AS s (user_id, score)
+        JOIN users u ON u.id = s.user_id
+        WHERE u.deleted_at IS NULL;
+    """, {'start': start, 'end': end})
+    snapshot, user_ids, scores = cur.fetchone()
+    return list(zip(user_ids or [], scores or [])), snapshot
+
+
+def load_board_members(cur, user_id):
+    """Returns (id, name) for a user and each of their friends, leaving out deleted accounts."""
+    cur.execute("""
+        SELECT u.id, u.name
+        FROM users u
+        WHERE (u.id = %(user_id)s
+               OR u.id IN (SELECT friend_id FROM friends WHERE user_id = %(user_id)s))
+          AND u.deleted_at IS NULL;
+    """, {'user_id': user_id})
+    return cur.fetchall()
+
+
+def load_user_names(cur, user_ids):
+    """Returns {id: name} for the given users that are not deleted."""
+    cur.execute("SELECT id, name FROM users WHERE id = ANY(%s) AND deleted_at IS NULL;", (list(user_ids),))
+    return dict(cur.fetchall())
+
+
+# --- Sorted sets ---
+
+class _SkipNode:
+    __slots__ = ('key', 'forward', 'span')
+
+    def __init__(self, key, level):
+        self.key = key
+        self.forward = [None] * level
+        self.span = [0] * level  # entries each forward link skips over, itself included
+
+
+class _SkipList:
+    """Ordered keys with O(log n) insert, remove and rank, like a Redis zset's skip list."""
+
+    MAX_LEVEL = 32
+    P = 0.25
+
+    def __init__(self):
+        self.head = _SkipNode(None, self.MAX_LEVEL)
+        self.level = 1
+        self.length = 0
+
+    def _random_level(self):
+        level = 1
+        while level < self.MAX_LEVEL and random.random() < self.P:
+            level += 1
+        return level
+
+    def insert(self, key):
+        update = [None] * self.MAX_LEVEL
+        rank = [0] * self.MAX_LEVEL  # position of update[i]
+        node = self.head
+        for i in reversed(range(self.level)):
+            rank[i] = rank[i + 1] if i + 1 < self.level else 0
+            while node.forward[i] is not None and node.forward[i].key < key:
+                rank[i] += node.span[i]
+                node = node.forward[i]
+            update[i] = node
+        level = self._random_level()
+        for i in range(self.level, level):
+            update[i] = self.head
+            self.head.span[i] = self.length
+        self.level = max(self.level, level)
+        node = _SkipNode(key, level)
+        for i in range(level):
+            node.forward[i] = update[i].forward[i]
+            update[i].forward[i] = node
+            node.span[i] = update[i].span[i] - (rank[0] - rank[i])
+            update[i].span[i] = rank[0] - rank[i] + 1
+        for i in range(level, self.level):
+            update[i].span[i] += 1
+        self.length += 1
+
+    def remove(self, key):
+        update = [None] * self.level
+        node = self.head
+        for i in reversed(range(self.level)):
+            while node.forward[i] is not None and node.forward[i].key < key:
+                node = node.forward[i]
+            update[i] = node
+        node = node.forward[0]
+        if node is None or node.key != key:
+            return False
+        for i in range(self.level):
+            if update[i].forward[i] is node:
+                update[i].span[i] += node.span[i] - 1
+                update[i].forward[i] = node.forward[i]
+            else:
+                update[i].span[i] -= 1
+        while self.level > 1 and self.head.forward[self.level - 1] is None:
+            self.level -= 1
+        self.length -= 1
+        return True
+
+    def count_below(self, key):
+        """Number of keys strictly less than `key`."""
+        count = 0
+        node = self.head
+        for i in reversed(range(self.level)):
+            while node.forward[i] is not None and node.forward[i].key < key:
+                count += node.span[i]
+                node = node.forward[i]
+        return count
+
+    def first(self, n=None):
+        """The n smallest keys (all of them if n is None), in order."""
+        keys = []
+        node = self.head.forward[0]
+        while node is not None and (n is None or len(keys) < n):
+            keys.append(node.key)
+            node = node.forward[0]
+        return keys
+
+
+class LocalSortedSet:
+    """In-process stand-in for a Redis sorted set (highest score ranks first)."""
+
+    def __init__(self, items=()):
+        self._scores = {}
+        self._order = _SkipList()  # (-score, member), ascending
+        for member, score in items:
+            self.zadd(member, score)
+
+    def zadd(self, member, score):
+        self.zrem(member)
+        self._scores[member] = score
+        self._order.insert((-score, member))
+
+    def zincrby(self, member, delta):
+        score = self._scores.get(member, 0) + delta
+        self.zadd(member, score)
+        return score
+
+    def zrem(self, member):
+        score = self._scores.pop(member, None)
+        if score is None:
+            return False
+        self._order.remove((-score, member))
+        return True
+
+    def zscore(self, member):
+        return self._scores.get(member)
+
+    def rank(self, member):
+        """1-based competition rank (ties share a rank, like SQL RANK()); None if absent."""
+        score = self._scores.get(member)
+        if score is None:
+            return None
+        return self.count_above(score) + 1
+
+    def count_above(self, score):
+        """Number of members with a strictly higher score."""
+        return self._order.count_below((-score,))
+
+    def top(self, n=None):
+        """The n best (member, score) pairs."""
+        return [(member, -neg) for neg, member in self._order.first(n)]
+
+    def __contains__(self, member):
+        return member in self._scores
+
+    def __len__(self):
+        return len(self._scores)
+
+
+class LocalSortedSetStore:
+    """Keyed LocalSortedSets with TTL/LRU eviction; the default global board store."""
+
+    def __init__(self, ttl=300.0, maxsize=64):
+        self._sets = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def exists(self, key):
+        return key in self._sets
+
+    def replace(self, key, items):
+        with self._lock:
+            self._sets.set(key, LocalSortedSet(items))
+
+    def incr(self, key, member, delta):
+        with self._lock:
+            zset = self._sets.peek(key)
+            if zset is not None:
+                zset.zincrby(member, delta)
+
+    def remove(self, key, member):
+        with self._lock:
+            zset = self._sets.peek(key)
+            if zset is not None:
+                zset.zrem(member)
+
+    def delete(self, key):
+        with self._lock:
+            self._sets.pop(key)
+
+    def keys(self):
+        return self._sets.keys()
+
+    def scores(self, key, members):
+        with self._lock:
+            zset = self._sets.get(key)
+            return [zset.zscore(m) if zset is not None else None for m in members]
+
+    def rank(self, key, member):
+        with self._lock:
+            zset = self._sets.get(key)
+            if zset is None:
+                return None
+            return zset.count_above(zset.zscore(member) or 0) + 1
+
+    def top(self, key, n):
+        with self._lock:
+            zset = self._sets.get(key)
+            return zset.top(n) if zset is not None else []
+
+
+class RedisSortedSetStore:
+    """Global boards in Redis sorted sets, shared by every app process."""
+
+    def __init__(self, client, prefix='fit:lb:', ttl=300.0):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def _key(self, key):
+        return self.prefix + key
+
+    def exists(self, key):
+        return bool(self.client.exists(self._key(key)))
+
+    def replace(self, key, items):
+        name = self._key(key)
+        pipe = self.client.pipeline()
+        pipe.delete(name)
+        mapping = {str(member): float(score) for member, score in items}
+        # An empty board is stored as a placeholder member so `exists` still holds.
+        pipe.zadd(name, mapping or {'': 0})
+        if self.ttl:
+            pipe.expire(name, int(self.ttl))
+        pipe.execute()
+
+    def incr(self, key, member, delta):
+        name = self._key(key)
+        # Only patch boards that are loaded; missing ones are rebuilt from the rollups.
+        if self.client.exists(name):
+            self.client.zincrby(name, float(delta), str(member))
+
+    def remove(self, key, member):
+        self.client.zrem(self._key(key), str(member))
+
+    def delete(self, key):
+        self.client.delete(self._key(key))
+
+    def keys(self):
+        keys = []
+        for name in self.client.scan_iter(match=self.prefix + '*'):
+            name = name.decode() if isinstance(name, bytes) else name
+            keys.append(name[len(self.prefix):])
+        return keys
+
+    def scores(self, key, members):
+        if not members:
+            return []
+        return self.client.zmscore(self._key(key), [str(m) for m in members])
+
+    def rank(self, key, member):
+        name = self._key(key)
+        score = self.client.zscore(name, str(member)) or 0
+        return self.client.zcount(name, f"({score}", '+inf') + 1
+
+    def top(self, key, n):
+        entries = self.client.zrevrange(self._key(key), 0, n - 1, withscores=True)
+        result = []
+        for member, score in entries:
+            member = member.decode() if isinstance(member, bytes) else member
+            if member:
+                result.append((int(member), board_score(score)))
+        return result
+
+
+def make_store(config):
+    """Builds the global board store described by a LEADERBOARD_CACHE_CONFIG dict."""
+    if config.get('backend') == 'redis':
+        import redis
+        return RedisSortedSetStore(redis.Redis.from_url(config['redis_url']),
+                                   ttl=config.get('global_ttl', 300.0))
+    return LocalSortedSetStore(ttl=config.get('global_ttl', 300.0))
+
+
+# --- Leaderboard cache ---
+
+class LeaderboardCache:
+    """Global and friend leaderboards maintained incrementally by the write path."""
+
+    def __init__(self, store, run_query, board_ttl=60.0, board_maxsize=10000):
+        # run_query(fn, *args) runs fn(cur, *args) on a database cursor and returns its result.
+        self.store = store
+        self.run_query = run_query
+        self._lock = threading.RLock()
+        self._boards = TTLCache(maxsize=board_maxsize, ttl=board_ttl, on_evict=self._forget_board)
+        self._member_of = {}  # user_id -> keys of the friend boards that include them
+        self._membership_changes = 0  # bumped by friendship changes and deletions; see _install_board
+        self._loading = {}    # global key -> [loads in flight, deltas (user_id, delta, xact) held back]
+        self._snapshots = TTLCache(maxsize=256, ttl=None)  # global key -> snapshot it was loaded under
+
+    # --- Global boards ---
+
+    def _ensure_global(self, metric, window, day=None):
+        key = window_key(metric, window, day)
+        if self.store.exists(key):
+            return key
+        with self._lock:
+            loading = self._loading.setdefault(key, [0, []])
+            loading[0] += 1
+        try:
+            rows, snapshot = self.run_query(load_global_scores, metric, window, day)
+            with self._lock:
+                if not self.store.exists(key):
+                    self.store.replace(key, rows)
+                    self._snapshots.set(key, snapshot)
+                    for user_id, delta, xact in loading[1]:
+                        self._apply_delta(key, user_id, delta, xact)
+                    loading[1].clear()
+        finally:
+            with self._lock:
+                loading[0] -= 1
+                if not loading[0]:
+                    self._loading.pop(key, None)
+        return key
+
+    def _apply_delta(self, key, user_id, delta, xact):
+        # Caller holds self._lock. Returns False for a delta the loaded board already counts.
+        snapshot = self._snapshots.peek(key)
+        if xact is not None and snapshot is not None and snapshot_includes(snapshot, xact):
+            return False
+        self.store.incr(key, user_id, delta)
+        return True
+
+    def global_top(self, metric='minutes', window='week', n=10):
+        """Top n (user_id, score) pairs across all users."""
+        metric = normalize_metric(metric)
+        return self.store.top(self._ensure_global(metric, window), n)
+
+    def global_rank(self, user_id, metric='minutes', window='week'):
+        """A user's 1-based rank across all users."""
+        metric = normalize_metric(metric)
+        return self.store.rank(self._ensure_global(metric, window), user_id)
+
+    def global_board(self, metric='minutes', window='week', n=10):
+        """Top n users across everyone as LeaderboardRows."""
+        metric = normalize_metric(metric)
+        key = self._ensure_global(metric, window)
+        top = self.store.top(key, n)
+        names = self.run_query(load_user_names, [member for member, _ in top]) if top else {}
+        return [LeaderboardRow(self.store.rank(key, member), member, names.get(member), score)
+                for member, score in top if member in names]
+
+    # --- Friend boards ---
+
+    def _forget_board(self, key, value):
+        # Called by the board cache whenever a board is evicted or replaced.
+        zset, names = value
+        for member in names:
+            keys = self._member_of.get(member)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._member_of[member]
+
+    def _install_board(self, board_key, members, changes):
+        """
+        Builds a friend board from the global scores and caches it, unless
+        another thread got there first. A board whose members may have changed
+        since they were read (`changes` is stale) is returned without caching.
+        """
+        ids = [member_id for member_id, _ in members]
+        with self._lock:
+            board = self._boards.get(board_key)
+            if board is not None:
+                return board
+            # Scores are read under the lock, so no delta lands between them and the install.
+            scores = self.store.scores(board_key[1], ids)
+            zset = LocalSortedSet((member_id, board_score(score)) for member_id, score in zip(ids, scores))
+            board = (zset, dict(members))
+            if changes != self._membership_changes:
+                return board
+            self._boards.set(board_key, board)
+            for member_id in ids:
+                self._member_of.setdefault(member_id, set()).add(board_key)
+            return board
+
+    def friend_board(self, user_id, metric='minutes', window='week', limit=None):
+        """The caller's friends leaderboard as a leaderboard_fit.Leaderboard."""
+        metric = normalize_metric(metric)
+        if window not in WINDOW_SOURCES:
+            raise ValueError(f"Unknown leaderboard window: {window}")
+        wkey = window_key(metric, window)
+        board_key = (user_id, wkey)
+        with self._lock:
+            board = self._boards.get(board_key)
+            changes = self._membership_changes
+        if board is None:
+            # The database reads run outside the lock so they never stall the write path.
+            members = self.run_query(load_board_members, user_id)
+            self._ensure_global(metric, window)
+            board = self._install_board(board_key, members, changes)
+        with self._lock:
+            zset, names = board
+            rows = [LeaderboardRow(zset.count_above(score) + 1, member_id, names[member_id], score)
+                    for member_id, score in zset.top(limit)]
+            rank = zset.rank(user_id)
+            position = LeaderboardRow(rank, user_id, names[user_id], zset.zscore(user_id)) if rank else None
+        return Leaderboard(metric, window, rows, position)
+
+    # --- Incremental updates ---
+
+    def record_workout(self, user_id, workout_date, duration, volume, xact=None):
+        """
+        Adds a committed workout to every loaded board it counts towards.
+        `xact` is the id of the transaction that wrote it (see CREATE_WORKOUT_QUERY).
+        """
+        deltas = {'minutes': duration, 'workouts': 1, 'volume': volume}
+        with self._lock:
+            for metric, delta in deltas.items():
+                for window in WINDOW_SOURCES:
+                    wkey = window_key(metric, window, workout_date)
+                    loading = self._loading.get(wkey)
+                    if loading is not None and not self.store.exists(wkey):
+                        loading[1].append((user_id, delta, xact))
+                        continue
+                    if not self._apply_delta(wkey, user_id, delta, xact):
+                        continue
+                    for board_key in self._member_of.get(user_id, ()):
+                        if board_key[1] == wkey:
+                            board = self._boards.peek(board_key)
+                            if board is not None:
+                                board[0].zincrby(user_id, delta)
+
+    def remove_user(self, user_id):
+        """Drops a deleted user from every board, and their own boards."""
+        with self._lock:
+            self._membership_changes += 1
+            for key in self.store.keys():
+                self.store.remove(key, user_id)
+            for board_key in list(self._member_of.get(user_id, ())):
+                board = self._boards.peek(board_key)
+                if board is None:
+                    continue
+                if board_key[0] == user_id:
+                    self._boards.pop(board_key)
+                else:
+                    zset, names = board
+                    zset.zrem(user_id)
+                    names.pop(user_id, None)
+            self._member_of.pop(user_id, None)
+
+    def add_friend(self, user_id, friend_id, friend_name):
+        """Adds a new friend to the user's loaded boards, using the friend's global score."""
+        with self._lock:
+            self._membership_changes += 1
+            for board_key in list(self._member_of.get(user_id, ())):
+                if board_key[0] != user_id:
+                    continue
+                board = self._boards.peek(board_key)
+                if board is None or not self.store.exists(board_key[1]):
+                    self._boards.pop(board_key)
+                    continue
+                zset, names = board
+                zset.zadd(friend_id, board_score(self.store.scores(board_key[1], [friend_id])[0]))
+                names[friend_id] = friend_name
+                self._member_of.setdefault(friend_id, set()).add(board_key)
+
+    def remove_friend(self, user_id, friend_id):
+        """Removes a former friend from the user's loaded boards."""
+        if friend_id == user_id:
+            return
+        with self._lock:
+            self._membership_changes += 1
+            for board_key in list(self._member_of.get(friend_id, ())):
+                if board_key[0] != user_id:
+                    continue
+                board = self._boards.peek(board_key)
+                if board is not None:
+                    board[0].zrem(friend_id)
+                    board[1].pop(friend_id, None)
+                self._member_of[friend_id].discard(board_key)
+            if friend_id in self._member_of and not self._member_of[friend_id]:
+                del self._member_of[friend_id]
+
+    def invalidate_user(self, user_id, first_date=None, last_date=None):
+        """
+        Drops the boards a user's scores changed in, e.g. after a bulk import of
+        workouts dated first_date..last_date: the all-time boards and the week
+        and month boards of the buckets in that range (all boards without a
+        range). They are reloaded on the next read.
+        """
+        with self._lock:
+            for key in self.store.keys():
+                if key_overlaps(key, first_date, last_date):
+                    self.store.delete(key)
+            for board_key in list(self._member_of.get(user_id, ())):
+                if key_overlaps(board_key[1], first_date, last_date):
+                    self._boards.pop(board_key)
+
+    def clear(self):
+        with self._lock:
+            self._boards.clear()
+            self._member_of.clear()
+            self._snapshots.clear()
+
+    def stats(self):
+        return self._boards.stats()
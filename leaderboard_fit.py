@@ -0,0 +1,104 @@
+from typing import NamedTuple, Optional
+
+# Friends leaderboard computed in one statement from the stats rollups.
+# The caller's friends are joined straight from `friends`, each member's score
+# for the window comes from user_stats (all time) or user_stats_buckets
+# (week/month), and RANK() orders them; the caller's own row is always returned
+# so their position is known even when a top-N limit cuts them off.
+
+# Metric name -> column of the per-window aggregate (see WINDOW_SOURCES).
+METRICS = {
+    'minutes': 'duration',
+    'workouts': 'workouts',
+    'volume': 'volume',
+}
+METRIC_ALIASES = {'total_workout_minutes': 'minutes'}
+
+# Window name -> LATERAL subquery yielding (duration, workouts, volume) for m.user_id.
+WINDOW_SOURCES = {
+    'week': """
+        SELECT b.duration, b.workouts, b.volume
+        FROM user_stats_buckets b
+        WHERE b.user_id = m.user_id
+          AND b.period = 'week'
+          AND b.bucket_start = date_trunc('week', CURRENT_DATE)::date
+    """,
+    'month': """
+        SELECT SUM(b.duration) AS duration, SUM(b.workouts) AS workouts, SUM(b.volume) AS volume
+        FROM user_stats_buckets b
+        WHERE b.user_id = m.user_id
+          AND b.period = 'day'
+          AND b.bucket_start >= date_trunc('month', CURRENT_DATE)::date
+    """,
+    'all_time': """
+        SELECT s.total_duration AS duration, s.total_workouts AS workouts, s.total_volume AS volume
+        FROM user_stats s
+        WHERE s.user_id = m.user_id
+    """,
+}
+
+WINDOW_LABELS = {'week': 'this week', 'month': 'this month', 'all_time': 'all time'}
+METRIC_LABELS = {'minutes': 'workout minutes', 'workouts': 'workouts', 'volume': 'total volume (kg)'}
+
+
+class LeaderboardRow(NamedTuple):
+    rank: int
+    user_id: int
+    name: str
+    value: object
+
+
+class Leaderboard(NamedTuple):
+    metric: str
+    window: str
+    rows: list                            # top rows, best first
+    position: Optional[LeaderboardRow]    # the caller's own row
+
+
+def normalize_metric(metric):
+    metric = METRIC_ALIASES.get(metric, metric)
+    if metric not in METRICS:
+        raise ValueError(f"Unknown leaderboard metric: {metric}")
+    return metric
+
+
+def leaderboard_query(metric, window):
+    """Builds the single-statement leaderboard query for a metric and window."""
+    metric = normalize_metric(metric)
+    if window not in WINDOW_SOURCES:
+        raise ValueError(f"Unknown leaderboard window: {window}")
+    return f"""
+        WITH members AS (
+            SELECT friend_id AS user_id FROM friends WHERE user_id = %(user_id)s
+            UNION
+            SELECT %(user_id)s
+        ),
+        ranked AS (
+            SELECT
+                RANK() OVER (ORDER BY COALESCE(x.{METRICS[metric]}, 0) DESC) AS rank,
+                u.id, u.name, COALESCE(x.{METRICS[metric]}, 0) AS value
+            FROM members m
+            JOIN users u ON u.id = m.user_id
+            LEFT JOIN LATERAL ({WINDOW_SOURCES[window]}) x ON TRUE
+        )
+        SELECT rank, id, name, value
+        FROM ranked
+        WHERE %(limit)s::int IS NULL OR rank <= %(limit)s::int OR id = %(user_id)s
+        ORDER BY rank, name, id;
+    """
+
+
+def compute_leaderboard(cur, user_id, metric='minutes', window='week', limit=None):
+    """Ranks a user and their friends in one round trip; returns a Leaderboard."""
+    metric = normalize_metric(metric)
+    cur.execute(leaderboard_query(metric, window), {'user_id': user_id, 'limit': limit})
+    return leaderboard_from_rows(cur.fetchall(), user_id, metric, window, limit)
+
+
+def leaderboard_from_rows(rows, user_id, metric, window, limit=None):
+    """Builds a Leaderboard from the rows of leaderboard_query."""
+    rows = [LeaderboardRow(*row) for row in rows]
+    position = next((row for row in rows if row.user_id == user_id), None)
+    if limit is not None:
+        rows = [row for row in rows if row.rank <= limit]
+    return Leaderboard(metric, window, rows, position)
@@ -0,0 +1,294 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from benchmark_fit import SUITE_WORKOUT, percentiles
+from datagen_fit import GEN_EMAIL_PREFIX
+from instrumentation_fit import thread_error_count
+
+# Load driver that replays Streamlit-style sessions against backend_fit.
+# Streamlit reruns frontend_fit.py top to bottom on every interaction, so one
+# "interaction" here is the set of backend calls a single rerun of one page
+# makes. Each worker process keeps a set of logged-in sessions and fires
+# interactions at a Poisson arrival rate (open loop: a slow backend does not
+# slow the arrivals down), so queueing shows up in the latencies, measured
+# from the scheduled start. Every process has its own backend_fit, connection
+# pool and caches, like separate Streamlit server processes.
+# Usage: python loadtest_fit.py run --rate 50 --duration 60 --processes 4
+#        python loadtest_fit.py ramp --start-rate 10 --step 10 --max-rate 500 --slo-ms 500
+# --write-behind sends log_workout through the ingestion queue (ingest_fit.py).
+# Sessions log in as existing users (by default the ones made by datagen_fit).
+
+# One rerun of each page: interaction -> fn(db, session, rng)
+INTERACTIONS = {
+    'login': lambda db, s, rng: (db.find_user_by_email(s['email']),
+                                 db.read_goals(s['user_id']),
+                                 db.read_workouts(s['user_id'], limit=3)),
+    'dashboard': lambda db, s, rng: (db.read_goals(s['user_id']),
+                                     db.read_workouts(s['user_id'], limit=3)),
+    'log_workout': lambda db, s, rng: db.create_workout(s['user_id'], date.today(),
+                                                        rng.randint(20, 90), SUITE_WORKOUT),
+    'leaderboard': lambda db, s, rng: (db.read_friends(s['user_id']),
+                                       db.get_leaderboard(s['user_id'], 'minutes', 'week', limit=25),
+                                       db.get_global_rank(s['user_id'], 'minutes', 'week')),
+    'feed': lambda db, s, rng: db.read_feed(s['user_id'], page_size=20),
+    'goals': lambda db, s, rng: db.read_goals(s['user_id']),
+    'progress': lambda db, s, rng: db.get_exercise_progress(s['user_id']),
+    'insights': lambda db, s, rng: db.get_business_insights(s['user_id']),
+}
+
+# Relative frequency of each page in a session (login is implied at session start).
+SESSION_MIXES = {
+    'default': {'dashboard': 35, 'log_workout': 10, 'leaderboard': 20, 'feed': 10, 'goals': 10,
+                'progress': 10, 'insights': 15},
+    'read_heavy': {'dashboard': 40, 'log_workout': 2, 'leaderboard': 25, 'feed': 10, 'goals': 8,
+                   'progress': 10, 'insights': 15},
+    'write_heavy': {'dashboard': 30, 'log_workout': 40, 'leaderboard': 10, 'feed': 5, 'goals': 10,
+                    'progress': 5, 'insights': 5},
+}
+
+
+def load_users(email_prefix=GEN_EMAIL_PREFIX, limit=10000):
+    """(user_id, email) pairs to log in as, read over a short-lived unpooled connection."""
+    import backend_fit as db
+
+    conn = db.get_connection()
+    if conn is None:
+        return []
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT id, email FROM users WHERE email LIKE %s ORDER BY id LIMIT %s;",
+                    (email_prefix + '%', limit))
+        return cur.fetchall()
+    finally:
+        conn.close()
+
+
+def _worker(index, users, rate, duration, options):
+    """Runs one process' share of the load; returns its raw measurements."""
+    import backend_fit as db
+
+    db.READ_CACHE_CONFIG['enabled'] = options['caches']
+    db.LEADERBOARD_CACHE_CONFIG['enabled'] = options['caches']
+    db.POOL_CONFIG['maxconn'] = options['maxconn']
+    db.MIGRATE_ON_STARTUP = False
+    if options['write_behind']:
+        db.INGEST_CONFIG.update(enabled=True, path=f"loadtest-ingest-{os.getpid()}.log")
+    db.get_pool()
+
+    rng = random.Random(options['seed'] * 1000 + index)
+    mix = SESSION_MIXES[options['mix']]
+    pages, weights = list(mix), list(mix.values())
+    lock = threading.Lock()
+    results = {'latencies': {}, 'service': {}, 'errors': {}, 'exceptions': 0}
+
+    def new_session():
+        user_id, email = rng.choice(users)
+        return {'user_id': user_id, 'email': email,
+                'remaining': max(1, int(rng.expovariate(1 / options['session_length'])))}
+
+    def run(kind, session, scheduled, call_rng):
+        started = time.perf_counter()
+        errors_before = thread_error_count()
+        failed = False
+        try:
+            INTERACTIONS[kind](db, session, call_rng)
+        except Exception:
+            failed = True
+        finished = time.perf_counter()
+        errors = thread_error_count() - errors_before + failed
+        with lock:
+            results['latencies'].setdefault(kind, []).append((finished - scheduled) * 1000)
+            results['service'].setdefault(kind, []).append((finished - started) * 1000)
+            results['errors'][kind] = results['errors'].get(kind, 0) + (errors > 0)
+            results['exceptions'] += failed
+
+    # Steady state: sessions start out logged in; finished ones are replaced by a fresh login.
+    sessions = [new_session() for _ in range(options['sessions'])]
+    submitted = 0
+    started = time.perf_counter()
+    next_at = started
+    end = started + duration
+    with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+        while next_at < end:
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            slot = rng.randrange(len(sessions))
+            session = sessions[slot]
+            session['remaining'] -= 1
+            if session['remaining'] <= 0:
+                session = sessions[slot] = new_session()
+                kind = 'login'
+            else:
+                kind = rng.choices(pages, weights)[0]
+            executor.submit(run, kind, session, next_at, random.Random(rng.random()))
+            submitted += 1
+            next_at += rng.expovariate(rate)
+    results['submitted'] = submitted
+    results['elapsed'] = time.perf_counter() - started
+    results['pool'] = {key: value for key, value in db.pool_stats().items() if key != 'checkout_latency'}
+    ingest = db.get_ingest_worker() if options['write_behind'] else None
+    db.close_pool()  # also commits what is left in the ingestion queue
+    results['ingest'] = ingest.stats() if ingest is not None else None
+    return results
+
+
+def run_load_test(users, rate, duration, processes=4, threads=16, mix='default', sessions=50,
+                  session_length=10, caches=True, maxconn=10, seed=1, write_behind=False):
+    """Drives `rate` interactions/s for `duration` seconds across processes; returns a summary dict."""
+    options = {'threads': threads, 'mix': mix, 'sessions': sessions, 'session_length': session_length,
+               'caches': caches, 'maxconn': maxconn, 'seed': seed, 'write_behind': write_behind}
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(processes) as pool:
+        parts = pool.starmap(_worker, [(index, users, rate / processes, duration, options)
+                                       for index in range(processes)])
+
+    latencies, service, per_interaction = [], [], {}
+    errors = exceptions = 0
+    for part in parts:
+        exceptions += part['exceptions']
+        for kind, values in part['latencies'].items():
+            latencies.extend(values)
+            service.extend(part['service'][kind])
+            entry = per_interaction.setdefault(kind, {'latencies': [], 'errors': 0})
+            entry['latencies'].extend(values)
+            entry['errors'] += part['errors'].get(kind, 0)
+            errors += part['errors'].get(kind, 0)
+    # Elapsed includes draining the backlog, so a backend that falls behind
+    # shows up as achieved_rate < offered_rate.
+    elapsed = max(part['elapsed'] for part in parts)
+    completed = len(latencies)
+    return {
+        'target_rate': rate,
+        'offered_rate': sum(part['submitted'] for part in parts) / duration,
+        'achieved_rate': completed / elapsed if elapsed else 0.0,
+        'duration_s': duration,
+        'processes': processes,
+        'threads_per_process': threads,
+        'maxconn_per_process': maxconn,
+        'mix': mix,
+        'caches': caches,
+        'write_behind': write_behind,
+        'completed': completed,
+        'errors': errors,
+        'exceptions': exceptions,
+        'error_rate': errors / completed if completed else 0.0,
+        'latency_ms': percentiles(latencies),
+        'service_ms': percentiles(service),
+        'per_interaction': {
+            kind: {'count': len(entry['latencies']), 'errors': entry['errors'],
+                   'latency_ms': percentiles(entry['latencies'])}
+            for kind, entry in sorted(per_interaction.items())
+        },
+        'pool': {
+            'checkouts': sum(part['pool']['checkouts'] for part in parts),
+            'timeouts': sum(part['pool']['timeouts'] for part in parts),
+            'max_wait_time': max(part['pool']['max_wait_time'] for part in parts),
+            'total_wait_time': sum(part['pool']['total_wait_time'] for part in parts),
+        },
+        'ingest': {
+            'batches': sum(part['ingest']['batches'] for part in parts),
+            'applied': sum(part['ingest']['applied'] for part in parts),
+            'rejected': sum(part['ingest']['rejected'] for part in parts),
+        } if write_behind else None,
+    }
+
+
+def saturated(summary, slo_ms, max_error_rate):
+    """Why a step did not keep up (empty string if it did)."""
+    if summary['achieved_rate'] < 0.95 * summary['offered_rate']:
+        return "throughput below offered load"
+    if summary['latency_ms']['p99'] is not None and summary['latency_ms']['p99'] > slo_ms:
+        return f"p99 above {slo_ms} ms"
+    if summary['error_rate'] > max_error_rate:
+        return "error rate too high"
+    return ""
+
+
+def ramp(users, start_rate, step, max_rate, slo_ms=500.0, max_error_rate=0.01, **options):
+    """Raises the rate step by step until the backend saturates; returns (steps, last sustained rate)."""
+    steps, sustained = [], None
+    rate = start_rate
+    while rate <= max_rate:
+        summary = run_load_test(users, rate, **options)
+        summary['saturated'] = saturated(summary, slo_ms, max_error_rate)
+        steps.append(summary)
+        print_summary(summary)
+        if summary['saturated']:
+            print(f"Saturated at {rate} interactions/s: {summary['saturated']}")
+            break
+        sustained = rate
+        rate += step
+    return steps, sustained
+
+
+def print_summary(summary):
+    latency = summary['latency_ms']
+    if not summary['completed']:
+        print(f"target {summary['target_rate']:>7.1f}/s: no interactions completed")
+        return
+    print(f"target {summary['target_rate']:>7.1f}/s  offered {summary['offered_rate']:>7.1f}/s  "
+          f"achieved {summary['achieved_rate']:>7.1f}/s  "
+          f"p50 {latency['p50']:8.1f} ms  p95 {latency['p95']:8.1f} ms  p99 {latency['p99']:8.1f} ms  "
+          f"errors {summary['error_rate']:.2%}  pool timeouts {summary['pool']['timeouts']}")
+    for kind, entry in summary['per_interaction'].items():
+        print(f"    {kind:<12} n={entry['count']:<7} p95 {entry['latency_ms']['p95']:8.1f} ms  "
+              f"errors {entry['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay Streamlit-like session load against backend_fit.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--duration', type=float, default=30.0, help="Seconds per run / ramp step")
+    common.add_argument('--processes', type=int, default=4)
+    common.add_argument('--threads', type=int, default=16, help="Concurrent interactions per process")
+    common.add_argument('--maxconn', type=int, default=10, help="Pool size per process")
+    common.add_argument('--mix', choices=list(SESSION_MIXES), default='default')
+    common.add_argument('--sessions', type=int, default=50, help="Concurrent sessions per process")
+    common.add_argument('--session-length', type=float, default=10.0, help="Mean interactions per session")
+    common.add_argument('--no-caches', dest='caches', action='store_false')
+    common.add_argument('--write-behind', action='store_true', help="Queue workouts and group-commit them")
+    common.add_argument('--email-prefix', default=GEN_EMAIL_PREFIX)
+    common.add_argument('--seed', type=int, default=1)
+    common.add_argument('--output', help="Also write the results as JSON to this file")
+    run = sub.add_parser('run', parents=[common], help="Fixed arrival rate")
+    run.add_argument('--rate', type=float, required=True, help="Interactions (reruns) per second")
+    ramp_parser = sub.add_parser('ramp', parents=[common], help="Increase the rate until saturation")
+    ramp_parser.add_argument('--start-rate', type=float, default=10.0)
+    ramp_parser.add_argument('--step', type=float, default=10.0)
+    ramp_parser.add_argument('--max-rate', type=float, default=1000.0)
+    ramp_parser.add_argument('--slo-ms', type=float, default=500.0, help="p99 latency limit")
+    ramp_parser.add_argument('--max-error-rate', type=float, default=0.01)
+    args = parser.parse_args()
+
+    users = load_users(args.email_prefix)
+    if not users:
+        raise SystemExit("No users to log in as; run `python datagen_fit.py generate` first.")
+    options = dict(duration=args.duration, processes=args.processes, threads=args.threads, mix=args.mix,
+                   sessions=args.sessions, session_length=args.session_length, caches=args.caches,
+                   maxconn=args.maxconn, seed=args.seed, write_behind=args.write_behind)
+
+    if args.command == 'run':
+        output = run_load_test(users, args.rate, **options)
+        print_summary(output)
+    else:
+        steps, sustained = ramp(users, args.start_rate, args.step, args.max_rate,
+                                args.slo_ms, args.max_error_rate, **options)
+        print(f"Highest sustained rate: {sustained} interactions/s" if sustained
+              else "Saturated at the starting rate.")
+        output = {'steps': steps, 'sustained_rate': sustained}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(output, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
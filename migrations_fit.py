@@ -0,0 +1,337 @@
+import argparse
+import json
+import os
+from datetime import date
+from typing import Callable, NamedTuple, Union
+
+from deletion_fit import CLAIM_JOB_QUERY, DELETION_DDL, STEP_QUERIES
+from feed_fit import FEED_DDL, FEED_QUERY, feed_params, rebuild_feed
+from goals_fit import GOAL_PROGRESS_QUERY, GOALS_DDL
+from partitions_fit import partition_tables
+from progression_fit import PROGRESS_QUERY, PROGRESSION_DDL, progress_params, rebuild_progress
+from stats_fit import ROLLUP_DDL, rebuild_user_stats
+
+# Versioned schema migrations on top of the baseline schema in Database_Tracker.
+# backend_fit applies pending migrations when the connection pool is created
+# (MIGRATE_ON_STARTUP); they can also be run by hand:
+#   python migrations_fit.py upgrade | status | check
+# Each migration runs in its own transaction together with its EXPLAIN checks,
+# so a migration whose hot queries still fall back to sequential scans is
+# rolled back instead of recorded.
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Database_Tracker')
+
+# Arbitrary key for pg_advisory_xact_lock so concurrent app starts migrate one at a time.
+MIGRATION_LOCK_KEY = 30139
+
+
+class MigrationCheckFailed(Exception):
+    """Raised when an EXPLAIN regression check does not hold."""
+
+
+class Check(NamedTuple):
+    """A hot query that must be served by the given indexes, never by a seq scan on `tables`."""
+    description: str
+    query: Union[str, Callable]   # SQL, or a callable returning (sql, params) built by backend_fit
+    params: object = None
+    indexes: tuple = ()
+    tables: tuple = ()
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Union[str, Callable]   # SQL, or a callable taking a cursor
+    checks: tuple = ()
+
+
+def _rollup_tables(cur):
+    cur.execute(ROLLUP_DDL)
+    rebuild_user_stats(cur)
+
+
+def _progression_tables(cur):
+    cur.execute(PROGRESSION_DDL)
+    rebuild_progress(cur)
+
+
+def _activity_feed(cur):
+    cur.execute(FEED_DDL)
+    rebuild_feed(cur)
+
+
+def _workouts_page_query():
+    import backend_fit
+    return backend_fit._workouts_query(1, limit=3, colocated=False)
+
+
+def _partitioned_page_query():
+    import backend_fit
+    return backend_fit._workouts_query(1, limit=3, before=(date.today(), 1))
+
+
+MIGRATIONS = [
+    Migration(1, 'stats_rollups', _rollup_tables),
+    Migration(
+        2, 'hot_path_indexes',
+        """
+        -- read_workouts / read_workouts_page / iter_workouts: newest-first pages per user.
+        CREATE INDEX IF NOT EXISTS workouts_user_date_idx
+            ON workouts (user_id, workout_date DESC, id DESC) INCLUDE (duration_minutes);
+        -- Exercises of a page of workouts, in insertion order, without touching the heap.
+        CREATE INDEX IF NOT EXISTS exercises_workout_idx
+            ON exercises (workout_id, id) INCLUDE (exercise_name, sets, reps, weight_kg);
+        -- Reverse friend lookups (who has this user as a friend, ON DELETE CASCADE).
+        CREATE INDEX IF NOT EXISTS friends_friend_idx
+            ON friends (friend_id, user_id);
+        -- read_goals.
+        CREATE INDEX IF NOT EXISTS goals_user_idx
+            ON goals (user_id) INCLUDE (description, target_value, current_value);
+        """,
+        checks=(
+            Check("read_workouts page", _workouts_page_query,
+                  indexes=('workouts_user_date_idx', 'exercises_workout_idx'),
+                  tables=('workouts', 'exercises')),
+            Check("read_goals",
+                  "SELECT id, description, target_value, current_value FROM goals WHERE user_id = %s;",
+                  (1,), indexes=('goals_user_idx',), tables=('goals',)),
+            Check("followers of a user",
+                  "SELECT user_id FROM friends WHERE friend_id = %s;",
+                  (1,), indexes=('friends_friend_idx',), tables=('friends',)),
+            Check("read_friends",
+                  "SELECT u.name, u.email FROM friends f JOIN users u ON f.friend_id = u.id WHERE f.user_id = %s;",
+                  (1,), indexes=('friends_pkey', 'users_pkey'), tables=('friends', 'users')),
+        ),
+    ),
+    Migration(
+        3, 'structured_goals', GOALS_DDL,
+        checks=(
+            Check("read_goals progress", GOAL_PROGRESS_QUERY, {'user_id': 1},
+                  indexes=('goals_user_idx', 'user_stats_buckets_pkey'),
+                  tables=('goals', 'user_stats', 'user_stats_buckets', 'user_exercise_stats')),
+        ),
+    ),
+    Migration(
+        4, 'exercise_progression', _progression_tables,
+        checks=(
+            Check("get_exercise_progress", PROGRESS_QUERY, progress_params(1),
+                  indexes=('exercise_progress_pkey', 'exercise_weekly_pkey', 'exercise_pr_history_user_idx'),
+                  tables=('exercise_progress', 'exercise_weekly', 'exercise_pr_history')),
+        ),
+    ),
+    Migration(
+        5, 'workout_idempotency_keys',
+        """
+        -- Retried and replayed create_workout calls (ingest_fit.py) carry a key
+        -- that may be recorded only once per user.
+        ALTER TABLE workouts ADD COLUMN IF NOT EXISTS idempotency_key VARCHAR(64);
+        CREATE UNIQUE INDEX IF NOT EXISTS workouts_idempotency_idx
+            ON workouts (user_id, idempotency_key) WHERE idempotency_key IS NOT NULL;
+        """,
+        checks=(
+            Check("create_workout duplicate check",
+                  "SELECT id FROM workouts WHERE user_id = %s AND idempotency_key = %s;",
+                  (1, 'key'), indexes=('workouts_idempotency_idx',), tables=('workouts',)),
+        ),
+    ),
+    Migration(
+        6, 'activity_feed', _activity_feed,
+        checks=(
+            Check("read_feed page", FEED_QUERY, feed_params(1),
+                  indexes=('feed_timelines_pkey', 'feed_events_pkey', 'feed_events_actor_idx'),
+                  tables=('feed_timelines', 'feed_events')),
+        ),
+    ),
+    Migration(
+        7, 'account_deletion', DELETION_DDL,
+        checks=(
+            Check("claim a deletion job", CLAIM_JOB_QUERY.format(lock="SKIP LOCKED"),
+                  indexes=('deletion_jobs_pending_idx',), tables=('deletion_jobs',)),
+            Check("purge a batch of exercises", STEP_QUERIES['exercises'], {'user_id': 1, 'batch': 1000},
+                  indexes=('workouts_user_date_idx', 'exercises_workout_idx'), tables=('workouts', 'exercises')),
+            Check("purge a batch of feed deliveries", STEP_QUERIES['feed_deliveries'], {'user_id': 1, 'batch': 1000},
+                  indexes=('feed_events_actor_idx', 'feed_timelines_event_idx'),
+                  tables=('feed_events', 'feed_timelines')),
+        ),
+    ),
+    Migration(
+        8, 'partitioned_workouts', partition_tables,
+        checks=(
+            Check("read_workouts page", _partitioned_page_query,
+                  indexes=('workouts_user_date_idx', 'exercises_workout_idx'),
+                  tables=('workouts', 'exercises')),
+            Check("idempotent create_workout",
+                  "SELECT id FROM workouts WHERE user_id = %s AND idempotency_key = %s AND workout_date = %s;",
+                  (1, 'key', date(2024, 1, 1)), indexes=('workouts_idempotency_idx',), tables=('workouts',)),
+        ),
+    ),
+]
+
+
+# --- Applying migrations ---
+
+def ensure_baseline(cur):
+    """Creates the baseline schema from Database_Tracker on an empty database."""
+    cur.execute("SELECT to_regclass('users') IS NOT NULL;")
+    if cur.fetchone()[0]:
+        return False
+    with open(SCHEMA_FILE, encoding='utf-8') as f:
+        cur.execute(f.read())
+    return True
+
+
+def ensure_migrations_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT now()
+        );
+    """)
+
+
+def applied_versions(cur):
+    cur.execute("SELECT version FROM schema_migrations;")
+    return {row[0] for row in cur.fetchall()}
+
+
+def _plan_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', ()):
+        yield from _plan_nodes(child)
+
+
+def explain_check(cur, check):
+    """Runs EXPLAIN for a check with seq scans discouraged; returns a list of problems."""
+    if callable(check.query):
+        query, params = check.query()
+    else:
+        query, params = check.query, check.params
+    # With enable_seqscan off the planner only picks a seq scan when no usable
+    # index exists, so the check is independent of current table sizes.
+    cur.execute("SET LOCAL enable_seqscan = off;")
+    cur.execute("EXPLAIN (FORMAT JSON) " + query, params)
+    plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    cur.execute("SET LOCAL enable_seqscan = DEFAULT;")
+
+    nodes = list(_plan_nodes(plan[0]['Plan']))
+    # Plans of partitioned tables name the partitions and their indexes; check against the parents.
+    names = {node.get(key) for node in nodes for key in ('Index Name', 'Relation Name')} - {None}
+    cur.execute(
+        """
+        SELECT c.relname, p.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE c.relname = ANY(%s);
+        """,
+        (sorted(names),)
+    )
+    parents = dict(cur.fetchall())
+    used = {parents.get(node.get('Index Name'), node.get('Index Name')) for node in nodes}
+    problems = []
+    for node in nodes:
+        relation = parents.get(node.get('Relation Name'), node.get('Relation Name'))
+        if node['Node Type'] == 'Seq Scan' and relation in check.tables:
+            problems.append(f"{check.description}: sequential scan on {node['Relation Name']}")
+    for index in check.indexes:
+        if index not in used:
+            problems.append(f"{check.description}: index {index} not used")
+    return problems
+
+
+def run_checks(cur, migrations=None):
+    """Runs the EXPLAIN checks of the given migrations (default: all); returns the problems found."""
+    problems = []
+    for migration in migrations if migrations is not None else MIGRATIONS:
+        for check in migration.checks:
+            problems.extend(explain_check(cur, check))
+    return problems
+
+
+def apply_migrations(conn, target=None):
+    """Applies pending migrations up to `target` (default: latest); returns the versions applied."""
+    cur = conn.cursor()
+    if ensure_baseline(cur):
+        print("Created baseline schema from Database_Tracker.")
+    ensure_migrations_table(cur)
+    conn.commit()
+
+    applied = []
+    for migration in sorted(MIGRATIONS, key=lambda m: m.version):
+        if target is not None and migration.version > target:
+            break
+        try:
+            cur.execute("SELECT pg_advisory_xact_lock(%s);", (MIGRATION_LOCK_KEY,))
+            if migration.version in applied_versions(cur):
+                conn.rollback()
+                continue
+            if callable(migration.apply):
+                migration.apply(cur)
+            else:
+                cur.execute(migration.apply)
+            problems = run_checks(cur, [migration])
+            if problems:
+                raise MigrationCheckFailed("; ".join(problems))
+            cur.execute(
+                "INSERT INTO schema_migrations (version, name) VALUES (%s, %s);",
+                (migration.version, migration.name)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(migration.version)
+        print(f"Applied migration {migration.version:04d}_{migration.name}.")
+    return applied
+
+
+def migration_status(conn):
+    """Returns (version, name, applied) for every known migration."""
+    cur = conn.cursor()
+    ensure_migrations_table(cur)
+    done = applied_versions(cur)
+    conn.commit()
+    return [(m.version, m.name, m.version in done) for m in sorted(MIGRATIONS, key=lambda m: m.version)]
+
+
+def main():
+    import backend_fit as db
+
+    parser = argparse.ArgumentParser(description="Apply and verify schema migrations.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    upgrade = sub.add_parser('upgrade', help="Apply pending migrations")
+    upgrade.add_argument('--target', type=int, help="Stop after this version")
+    sub.add_parser('status', help="List migrations and whether they are applied")
+    sub.add_parser('check', help="Run the EXPLAIN regression checks of applied migrations")
+    args = parser.parse_args()
+
+    conn = db.get_connection()
+    if not conn:
+        raise SystemExit(1)
+    try:
+        if args.command == 'upgrade':
+            applied = apply_migrations(conn, args.target)
+            if not applied:
+                print("Schema is up to date.")
+        elif args.command == 'status':
+            for version, name, done in migration_status(conn):
+                print(f"{version:04d}_{name}: {'applied' if done else 'pending'}")
+        elif args.command == 'check':
+            cur = conn.cursor()
+            done = applied_versions(cur)
+            problems = run_checks(cur, [m for m in MIGRATIONS if m.version in done])
+            conn.rollback()
+            for problem in problems:
+                print(f"FAIL {problem}")
+            if problems:
+                raise SystemExit(1)
+            print("All EXPLAIN checks passed.")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
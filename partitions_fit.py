@@ -0,0 +1,546 @@
+import argparse
+import gzip
+import os
+import re
+from datetime import date, datetime, timedelta
+from typing import NamedTuple
+
+from feed_fit import ARCHIVED_EVENTS_QUERY
+from progression_fit import e1rm_sql
+
+# Monthly range partitioning of workouts and exercises on workout_date.
+# exercises carries its workout's date and is partitioned on the same bounds,
+# so a workout and its exercises always sit in the partitions of one month;
+# the FK (workout_id, workout_date) -> workouts (id, workout_date) lets a page of
+# workouts probe only the matching exercises partitions.
+# Each table has a partition per month, <table>_pYYYY_MM, from `keep_months`
+# before the migration up to `premake` months ahead, and <table>_p_before
+# FROM (MINVALUE) for anything older. There is no DEFAULT partition, so
+# newest-first reads run as an ordered Append that stops inside the recent
+# (hot) partitions; workout dates after latest_workout_date are rejected.
+# Maintenance (maintain; backend_fit also runs create_upcoming on pool startup
+# and whenever a workout date is past the newest partition it knows of):
+#  - ensure_partitions creates the monthly partitions `premake` months ahead;
+#  - archive_partitions handles every partition older than `keep_months` that
+#    still holds rows: they are written to gzipped CSV files under archive_dir,
+#    compacted into the archived_workout_months / archived_exercise_months
+#    summaries and logged in partition_archives, their feed events are
+#    dropped (feed_fit.ARCHIVED_EVENTS_QUERY), then the partitions are
+#    detached, dropped and created again empty. Bounds never change, so
+#    back-dated workouts always find a partition and go with the next run.
+# Rollups keep the archived history: the stats_fit and progression_fit
+# rebuilds add the summaries and keep their dated rows from before the latest
+# archived date (stats_fit.archived_before).
+# Usage: python partitions_fit.py status
+#        python partitions_fit.py maintain [--keep-months 24] [--no-archive]
+
+PARTITIONED_TABLES = ('workouts', 'exercises')
+PREMAKE_MONTHS = 3
+KEEP_MONTHS = 24
+ARCHIVE_DIR = 'archive'
+# Detaching needs a brief exclusive lock on the parents; give up rather than queue behind long readers.
+LOCK_TIMEOUT = '5s'
+
+ARCHIVE_DDL = """
+    CREATE TABLE IF NOT EXISTS archived_workout_months (
+        user_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        month_start DATE NOT NULL,
+        workouts INT NOT NULL DEFAULT 0,
+        duration INT NOT NULL DEFAULT 0,
+        min_duration INT,
+        max_duration INT,
+        exercises INT NOT NULL DEFAULT 0,
+        volume DECIMAL NOT NULL DEFAULT 0,
+        max_weight_kg DECIMAL,
+        first_date DATE NOT NULL,
+        last_date DATE NOT NULL,
+        PRIMARY KEY (user_id, month_start)
+    );
+
+    CREATE TABLE IF NOT EXISTS archived_exercise_months (
+        user_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        month_start DATE NOT NULL,
+        exercise_name VARCHAR(255) NOT NULL,
+        sessions INT NOT NULL DEFAULT 0,
+        sets INT NOT NULL DEFAULT 0,
+        volume DECIMAL NOT NULL DEFAULT 0,
+        max_weight_kg DECIMAL,
+        best_e1rm DECIMAL,
+        first_date DATE NOT NULL,
+        last_date DATE NOT NULL,
+        session_dates DATE[] NOT NULL,   -- lets rebuilds count the sessions since a record
+        PRIMARY KEY (user_id, month_start, exercise_name)
+    );
+
+    CREATE TABLE IF NOT EXISTS partition_archives (
+        id SERIAL PRIMARY KEY,
+        source VARCHAR(63) NOT NULL,
+        before_date DATE NOT NULL,
+        workouts BIGINT NOT NULL,
+        exercises BIGINT NOT NULL,
+        workouts_file TEXT NOT NULL,
+        exercises_file TEXT NOT NULL,
+        archived_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+"""
+
+# The partitioned parents; partition_tables copies the old tables into them.
+PARTITIONED_DDL = """
+    CREATE TABLE workouts (
+        id INT NOT NULL DEFAULT nextval(%(workouts)s::regclass),
+        user_id INT NOT NULL CONSTRAINT workouts_user_id_fkey REFERENCES users(id) ON DELETE CASCADE,
+        workout_date DATE NOT NULL,
+        duration_minutes INT NOT NULL,
+        idempotency_key VARCHAR(64),
+        PRIMARY KEY (id, workout_date)
+    ) PARTITION BY RANGE (workout_date);
+
+    CREATE TABLE exercises (
+        id INT NOT NULL DEFAULT nextval(%(exercises)s::regclass),
+        workout_id INT NOT NULL,
+        workout_date DATE NOT NULL,
+        exercise_name VARCHAR(255) NOT NULL,
+        sets INT,
+        reps INT,
+        weight_kg DECIMAL,
+        PRIMARY KEY (id, workout_date),
+        CONSTRAINT exercises_workout_id_fkey FOREIGN KEY (workout_id, workout_date)
+            REFERENCES workouts (id, workout_date) ON DELETE CASCADE
+    ) PARTITION BY RANGE (workout_date);
+"""
+
+# Built after the copy, under the names of the indexes of migrations 2 and 5.
+PARTITIONED_INDEXES = """
+    CREATE INDEX workouts_user_date_idx
+        ON workouts (user_id, workout_date DESC, id DESC) INCLUDE (duration_minutes);
+    -- Unique indexes must contain the partition key; a retried request repeats its date.
+    CREATE UNIQUE INDEX workouts_idempotency_idx
+        ON workouts (user_id, idempotency_key, workout_date) WHERE idempotency_key IS NOT NULL;
+    CREATE INDEX exercises_workout_idx
+        ON exercises (workout_id, id) INCLUDE (exercise_name, sets, reps, weight_kg);
+"""
+
+COPY_QUERIES = (
+    """
+    INSERT INTO workouts (id, user_id, workout_date, duration_minutes, idempotency_key)
+    SELECT id, user_id, workout_date, duration_minutes, idempotency_key
+    FROM workouts_unpartitioned;
+    """,
+    """
+    INSERT INTO exercises (id, workout_id, workout_date, exercise_name, sets, reps, weight_kg)
+    SELECT e.id, e.workout_id, w.workout_date, e.exercise_name, e.sets, e.reps, e.weight_kg
+    FROM exercises_unpartitioned e
+    JOIN workouts_unpartitioned w ON w.id = e.workout_id;
+    """,
+)
+
+# Compact the rows before %(before)s of one pair of workouts/exercises
+# partitions into the monthly summaries, adding to any summary already there.
+SUMMARY_QUERIES = (
+    """
+    WITH per_workout AS (
+        SELECT w.user_id, w.workout_date, w.duration_minutes,
+               COUNT(e.id) AS exercises,
+               COALESCE(SUM(e.sets * e.reps * e.weight_kg), 0) AS volume,
+               MAX(e.weight_kg) AS max_weight_kg
+        FROM {workouts} w
+        LEFT JOIN {exercises} e ON e.workout_id = w.id AND e.workout_date = w.workout_date
+        WHERE w.workout_date < %(before)s
+        GROUP BY w.id, w.user_id, w.workout_date, w.duration_minutes
+    )
+    INSERT INTO archived_workout_months AS a
+        (user_id, month_start, workouts, duration, min_duration, max_duration, exercises, volume,
+         max_weight_kg, first_date, last_date)
+    SELECT user_id, date_trunc('month', workout_date)::date, COUNT(*), SUM(duration_minutes),
+           MIN(duration_minutes), MAX(duration_minutes), SUM(exercises), SUM(volume), MAX(max_weight_kg),
+           MIN(workout_date), MAX(workout_date)
+    FROM per_workout
+    GROUP BY 1, 2
+    ON CONFLICT (user_id, month_start) DO UPDATE SET
+        workouts = a.workouts + EXCLUDED.workouts,
+        duration = a.duration + EXCLUDED.duration,
+        min_duration = LEAST(a.min_duration, EXCLUDED.min_duration),
+        max_duration = GREATEST(a.max_duration, EXCLUDED.max_duration),
+        exercises = a.exercises + EXCLUDED.exercises,
+        volume = a.volume + EXCLUDED.volume,
+        max_weight_kg = GREATEST(a.max_weight_kg, EXCLUDED.max_weight_kg),
+        first_date = LEAST(a.first_date, EXCLUDED.first_date),
+        last_date = GREATEST(a.last_date, EXCLUDED.last_date);
+    """,
+    f"""
+    WITH per_session AS (
+        SELECT w.user_id, w.workout_date, e.exercise_name,
+               SUM(e.sets) AS sets, COALESCE(SUM(e.sets * e.reps * e.weight_kg), 0) AS volume,
+               MAX(e.weight_kg) AS max_weight_kg, MAX({e1rm_sql('e.weight_kg', 'e.reps')}) AS best_e1rm
+        FROM {{exercises}} e
+        JOIN {{workouts}} w ON w.id = e.workout_id AND w.workout_date = e.workout_date
+        WHERE e.workout_date < %(before)s
+        GROUP BY w.id, w.user_id, w.workout_date, e.exercise_name
+    )
+    INSERT INTO archived_exercise_months AS a
+        (user_id, month_start, exercise_name, sessions, sets, volume, max_weight_kg, best_e1rm,
+         first_date, last_date, session_dates)
+    SELECT user_id, date_trunc('month', workout_date)::date, exercise_name,
+           COUNT(*), COALESCE(SUM(sets), 0), SUM(volume), MAX(max_weight_kg), MAX(best_e1rm),
+           MIN(workout_date), MAX(workout_date), array_agg(workout_date ORDER BY workout_date)
+    FROM per_session
+    GROUP BY 1, 2, 3
+    ON CONFLICT (user_id, month_start, exercise_name) DO UPDATE SET
+        sessions = a.sessions + EXCLUDED.sessions,
+        sets = a.sets + EXCLUDED.sets,
+        volume = a.volume + EXCLUDED.volume,
+        max_weight_kg = GREATEST(a.max_weight_kg, EXCLUDED.max_weight_kg),
+        best_e1rm = GREATEST(a.best_e1rm, EXCLUDED.best_e1rm),
+        first_date = LEAST(a.first_date, EXCLUDED.first_date),
+        last_date = GREATEST(a.last_date, EXCLUDED.last_date),
+        session_dates = a.session_dates || EXCLUDED.session_dates;
+    """,
+)
+
+
+class PartitioningError(Exception):
+    """Raised when moving or archiving rows would lose some of them."""
+
+
+class Partition(NamedTuple):
+    name: str
+    lower: date    # None for FROM (MINVALUE)
+    upper: date
+
+
+class ArchivedRange(NamedTuple):
+    source: str    # the workouts partition the rows came from
+    before: date
+    workouts: int
+    exercises: int
+    files: tuple
+
+
+class MaintenanceResult(NamedTuple):
+    created: list    # names of the new workouts partitions
+    archived: list   # ArchivedRange per archived partition
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def add_months(day, months):
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table, month=None):
+    """<table>_pYYYY_MM for a month, <table>_p_before (month None) for the rows older than the first month."""
+    return f"{table}_p_before" if month is None else f"{table}_p{month:%Y_%m}"
+
+
+def _bound(text):
+    text = text.strip()
+    return None if text == 'MINVALUE' else date.fromisoformat(text.strip("'"))
+
+
+def is_partitioned(cur):
+    cur.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('workouts');")
+    row = cur.fetchone()
+    return bool(row and row[0])
+
+
+def require_partitioned(cur):
+    """Raises PartitioningError unless workouts is partitioned, as the workout queries of backend_fit assume."""
+    if not is_partitioned(cur):
+        raise PartitioningError("workouts is not partitioned yet; apply the schema migrations "
+                                "(python migrations_fit.py upgrade)")
+
+
+def list_partitions(cur, table='workouts'):
+    """Partitions of a table, oldest first."""
+    cur.execute(
+        """
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass;
+        """,
+        (table,)
+    )
+    partitions = []
+    for name, bound in cur.fetchall():
+        lower, upper = re.match(r"FOR VALUES FROM \((.+)\) TO \((.+)\)", bound).groups()
+        partitions.append(Partition(name, _bound(lower), _bound(upper)))
+    return sorted(partitions, key=lambda p: p.upper)
+
+
+def partition_for(partitions, day):
+    """The Partition of a list_partitions list whose bounds hold `day`, or None."""
+    for partition in partitions:
+        if day < partition.upper:
+            return partition if partition.lower is None or partition.lower <= day else None
+    return None
+
+
+def latest_workout_date(today=None, premake=PREMAKE_MONTHS):
+    """
+    The last workout date the premade partitions are sure to cover, allowing
+    for a process whose partitions were last ensured during the previous month.
+    Raises ValueError for a premake below 1, which would reject today's date.
+    """
+    if premake < 1:
+        raise ValueError(f"premake_months must be at least 1, got {premake}")
+    return add_months(month_start(today or date.today()), premake) - timedelta(days=1)
+
+
+def _create_partition(cur, table, lower, upper):
+    bound = "MINVALUE" if lower is None else "%s"
+    params = (upper,) if lower is None else (lower, upper)
+    cur.execute(f"CREATE TABLE IF NOT EXISTS {partition_name(table, lower)} PARTITION OF {table} "
+                f"FOR VALUES FROM ({bound}) TO (%s);", params)
+
+
+def _create_month(cur, month):
+    for table in PARTITIONED_TABLES:
+        _create_partition(cur, table, month, add_months(month, 1))
+    return partition_name('workouts', month)
+
+
+def ensure_partitions(cur, today=None, premake=PREMAKE_MONTHS):
+    """
+    Creates the monthly partitions up to `premake` months after today's;
+    returns the names of the new workouts partitions.
+    """
+    if not is_partitioned(cur):
+        return []
+    today = today or date.today()
+    created = []
+    month = list_partitions(cur)[-1].upper
+    while month < add_months(month_start(today), premake + 1):
+        created.append(_create_month(cur, month))
+        month = add_months(month, 1)
+    return created
+
+
+def partition_months(today, keep_months=KEEP_MONTHS, premake=PREMAKE_MONTHS, newest=None):
+    """
+    First days of the months partition_tables creates partitions for: every
+    month of the kept window, so later imports of recent history never land in
+    _p_before (older rows are archived by the first maintenance run), up to
+    `premake` months ahead, or up to the month of `newest`, the latest stored
+    workout date, so every existing row has a partition to go to.
+    """
+    month = add_months(month_start(today), -keep_months)
+    end = add_months(month_start(today), premake + 1)
+    if newest is not None:
+        end = max(end, add_months(month_start(newest), 1))
+    months = []
+    while month < end:
+        months.append(month)
+        month = add_months(month, 1)
+    return months
+
+
+def partition_tables(cur, today=None, keep_months=KEEP_MONTHS, premake=PREMAKE_MONTHS):
+    """
+    Replaces the plain workouts and exercises tables by partitioned ones within
+    the current transaction, keeping ids, sequences and index names. Raises
+    PartitioningError unless every row was copied.
+    """
+    if is_partitioned(cur):
+        return False
+    today = today or date.today()
+    # A partitioned workouts table is keyed on (id, workout_date), so foreign keys
+    # to workouts(id) from feed events and PR history go; they keep the plain id.
+    # archive_partitions drops the feed events of the workouts it archives.
+    cur.execute("""
+        SELECT conrelid::regclass::text, conname
+        FROM pg_constraint
+        WHERE contype = 'f' AND confrelid = 'workouts'::regclass AND conrelid <> 'exercises'::regclass;
+    """)
+    for table, constraint in cur.fetchall():
+        cur.execute(f"ALTER TABLE {table} DROP CONSTRAINT {constraint};")
+    sequences = {}
+    for table in PARTITIONED_TABLES:
+        cur.execute("SELECT pg_get_serial_sequence(%s, 'id');", (table,))
+        sequences[table] = cur.fetchone()[0]
+        cur.execute(f"ALTER SEQUENCE {sequences[table]} OWNED BY NONE;")
+        cur.execute(f"ALTER TABLE {table} RENAME TO {table}_unpartitioned;")
+        cur.execute(f"ALTER TABLE {table}_unpartitioned RENAME CONSTRAINT {table}_pkey TO {table}_unpartitioned_pkey;")
+    cur.execute(PARTITIONED_DDL, sequences)
+
+    cur.execute("SELECT MAX(workout_date) FROM workouts_unpartitioned;")
+    months = partition_months(today, keep_months, premake, cur.fetchone()[0])
+    for table in PARTITIONED_TABLES:
+        _create_partition(cur, table, None, months[0])
+    for month in months:
+        _create_month(cur, month)
+
+    for table, query in zip(PARTITIONED_TABLES, COPY_QUERIES):
+        cur.execute(query)
+        copied = cur.rowcount
+        cur.execute(f"SELECT COUNT(*) FROM {table}_unpartitioned;")
+        expected = cur.fetchone()[0]
+        if copied != expected:
+            raise PartitioningError(f"{table}: copied {copied} of {expected} rows")
+    for table in reversed(PARTITIONED_TABLES):
+        cur.execute(f"DROP TABLE {table}_unpartitioned;")
+    for table in PARTITIONED_TABLES:
+        cur.execute(f"ALTER SEQUENCE {sequences[table]} OWNED BY {table}.id;")
+    cur.execute(PARTITIONED_INDEXES)
+    cur.execute(ARCHIVE_DDL)
+    cur.execute("ANALYZE workouts; ANALYZE exercises;")
+    return True
+
+
+# --- Archival ---
+
+def _copy_to_file(cur, query, params, path):
+    """COPYs a query into a gzipped CSV file, fsynced before it is renamed into place; returns the row count."""
+    with gzip.open(path + '.part', 'wt', encoding='utf-8', newline='') as f:
+        cur.copy_expert(f"COPY ({cur.mogrify(query, params).decode()}) TO STDOUT WITH (FORMAT csv, HEADER)", f)
+    rows = cur.rowcount
+    with open(path + '.part', 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(path + '.part', path)
+    return rows
+
+
+def _archive_rows(cur, workouts, exercises, before, archive_dir, label):
+    """Archives the rows before `before` of one pair of partitions; returns an ArchivedRange."""
+    params = {'before': before}
+    files = []
+    counts = []
+    for table, name in zip(PARTITIONED_TABLES, (workouts, exercises)):
+        path = os.path.join(archive_dir, f"{table}_{label}.csv.gz")
+        rows = _copy_to_file(cur, f"SELECT * FROM {name} WHERE workout_date < %(before)s ORDER BY id",
+                             params, path)
+        cur.execute(f"SELECT COUNT(*) FROM {name} WHERE workout_date < %(before)s;", params)
+        if cur.fetchone()[0] != rows:
+            raise PartitioningError(f"{name}: {path} does not hold every row")
+        files.append(path)
+        counts.append(rows)
+    for query in SUMMARY_QUERIES:
+        cur.execute(query.format(workouts=workouts, exercises=exercises), params)
+    cur.execute(ARCHIVED_EVENTS_QUERY.format(workouts=workouts), params)
+    cur.execute(
+        """
+        INSERT INTO partition_archives (source, before_date, workouts, exercises, workouts_file, exercises_file)
+        VALUES (%s, %s, %s, %s, %s, %s);
+        """,
+        (workouts, before, counts[0], counts[1], files[0], files[1])
+    )
+    return ArchivedRange(workouts, before, counts[0], counts[1], tuple(files))
+
+
+def _recreate(cur, partition):
+    """Detaches and drops one partition of both tables, then creates it again, empty, with the same bounds."""
+    # Partitions are only ever created, never re-attached: detaching a
+    # re-attached partition of a referencing table fails on some PostgreSQL
+    # releases ("could not find ON INSERT check triggers").
+    for table in reversed(PARTITIONED_TABLES):   # exercises first: it references workouts
+        name = partition_name(table, partition.lower)
+        cur.execute(f"ALTER TABLE {table} DETACH PARTITION {name};")
+        cur.execute(f"DROP TABLE {name};")
+    for table in PARTITIONED_TABLES:
+        _create_partition(cur, table, partition.lower, partition.upper)
+
+
+def archive_partitions(conn, today=None, keep_months=KEEP_MONTHS, archive_dir=ARCHIVE_DIR):
+    """
+    Archives the rows of every partition older than `keep_months` months, one
+    transaction per partition; returns the ArchivedRange list. A failed
+    partition is rolled back and retried by the next run.
+    """
+    cur = conn.cursor()
+    if not is_partitioned(cur):
+        conn.rollback()
+        return []
+    os.makedirs(archive_dir, exist_ok=True)
+    horizon = add_months(month_start(today or date.today()), -keep_months)
+    archived = []
+    try:
+        for partition in list_partitions(cur):
+            if partition.upper > horizon:
+                continue
+            names = [partition_name(table, partition.lower) for table in PARTITIONED_TABLES]
+            cur.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}';")
+            cur.execute(f"LOCK TABLE {', '.join(names)} IN SHARE MODE;")
+            cur.execute(f"SELECT EXISTS (SELECT 1 FROM {names[0]});")
+            if not cur.fetchone()[0]:
+                conn.rollback()
+                continue
+            # A partition is archived again whenever back-dated rows arrive, hence the timestamp.
+            label = f"{names[0][len('workouts_'):]}_{datetime.now():%Y%m%d%H%M%S}"
+            archived.append(_archive_rows(cur, names[0], names[1], partition.upper, archive_dir, label))
+            _recreate(cur, partition)
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return archived
+
+
+def create_upcoming(conn, today=None, premake=PREMAKE_MONTHS):
+    """ensure_partitions in a transaction of its own, under LOCK_TIMEOUT; returns the new partition names."""
+    cur = conn.cursor()
+    try:
+        cur.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}';")
+        created = ensure_partitions(cur, today, premake)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return created
+
+
+def maintain(conn, today=None, premake=PREMAKE_MONTHS, keep_months=KEEP_MONTHS, archive_dir=ARCHIVE_DIR,
+             archive=True):
+    """Creates the upcoming partitions, then archives the old ones; returns a MaintenanceResult."""
+    created = create_upcoming(conn, today, premake)
+    archived = archive_partitions(conn, today, keep_months, archive_dir) if archive else []
+    return MaintenanceResult(created, archived)
+
+
+def partition_sizes(cur):
+    """(name, lower, upper, estimated rows) per workouts partition, oldest first."""
+    partitions = list_partitions(cur)
+    cur.execute("SELECT relname, reltuples::bigint FROM pg_class WHERE relname = ANY(%s);",
+                ([p.name for p in partitions],))
+    rows = dict(cur.fetchall())
+    return [(p.name, p.lower, p.upper, max(rows.get(p.name, 0), 0)) for p in partitions]
+
+
+def main():
+    import backend_fit as db
+
+    parser = argparse.ArgumentParser(description="Maintain the monthly workout partitions.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('status', help="List the workouts partitions and recent archives")
+    run = sub.add_parser('maintain', help="Create upcoming partitions and archive old ones")
+    run.add_argument('--keep-months', type=int, default=db.PARTITION_CONFIG['keep_months'])
+    run.add_argument('--no-archive', action='store_true', help="Only create upcoming partitions")
+    args = parser.parse_args()
+
+    if args.command == 'maintain':
+        db.PARTITION_CONFIG['keep_months'] = args.keep_months
+        result = db.maintain_partitions(archive=not args.no_archive)
+        if result is None:
+            raise SystemExit(1)
+        for name in result.created:
+            print(f"Created {name}.")
+        for item in result.archived:
+            print(f"Archived {item.workouts} workouts and {item.exercises} exercises "
+                  f"before {item.before} from {item.source}.")
+    elif args.command == 'status':
+        with db.pooled_connection() as conn:
+            cur = conn.cursor()
+            for name, lower, upper, rows in partition_sizes(cur):
+                print(f"{name}: {lower or 'MINVALUE'} .. {upper}, ~{rows} rows")
+            cur.execute("SELECT before_date, workouts, exercises, workouts_file FROM partition_archives "
+                        "ORDER BY id DESC LIMIT 12;")
+            for before, workouts, exercises, path in cur.fetchall():
+                print(f"archived before {before}: {workouts} workouts, {exercises} exercises -> {path}")
+            conn.rollback()
+    db.close_pool()
+
+
+if __name__ == '__main__':
+    main()
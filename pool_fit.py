@@ -0,0 +1,300 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# A small thread-safe connection pool used by backend_fit.
+# It hands out DB-API connections created by a `connect` callable, checks
+# their health on checkout, closes connections that sat idle for too long
+# and keeps metrics on how long callers waited for a connection.
+
+# Upper bounds (in seconds) of the checkout latency histogram buckets.
+DEFAULT_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the timeout."""
+
+
+class PoolClosed(Exception):
+    """Raised when a connection is requested from a closed pool."""
+
+
+class LatencyHistogram:
+    """Cumulative latency histogram with fixed bucket bounds."""
+
+    def __init__(self, buckets=DEFAULT_LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        """Records a single observation."""
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def percentile(self, pct):
+        """Returns the bucket upper bound containing the given percentile."""
+        with self._lock:
+            if not self.count:
+                return 0.0
+            rank = pct / 100.0 * self.count
+            seen = 0
+            for bound, count in zip(self.buckets, self.counts):
+                seen += count
+                if seen >= rank:
+                    return bound
+            return self.max
+
+    def snapshot(self):
+        """Returns the histogram as a plain dict."""
+        with self._lock:
+            cumulative = []
+            seen = 0
+            for bound, count in zip(self.buckets, self.counts):
+                seen += count
+                cumulative.append((bound, seen))
+            cumulative.append((float('inf'), self.count))
+            return {
+                'count': self.count,
+                'sum': self.total,
+                'max': self.max,
+                'buckets': cumulative,
+            }
+
+
+class ConnectionPool:
+    """Thread-safe pool of database connections."""
+
+    def __init__(self, connect, minconn=1, maxconn=10, timeout=30.0,
+                 max_idle=300.0, health_check_interval=30.0):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("Invalid pool size: need 0 <= minconn <= maxconn and maxconn >= 1.")
+        self._connect = connect
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.health_check_interval = health_check_interval
+
+        self._cond = threading.Condition()
+        self._idle = []  # (conn, returned_at) pairs, most recently used last
+        self._in_use = set()
+        self._opening = 0
+        self._closed = False
+
+        self.checkout_latency = LatencyHistogram()
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.connections_opened = 0
+        self.connections_discarded = 0
+        self.connections_reaped = 0
+
+        for _ in range(minconn):
+            conn = self._open()
+            self._idle.append((conn, time.monotonic()))
+
+    # --- Connection lifecycle ---
+
+    def _open(self):
+        conn = self._connect()
+        with self._cond:
+            self.connections_opened += 1
+        return conn
+
+    @staticmethod
+    def _is_closed(conn):
+        return bool(getattr(conn, 'closed', False))
+
+    def _is_healthy(self, conn, idle_for):
+        """Cheap liveness check; only pings connections that sat idle for a while."""
+        if self._is_closed(conn):
+            return False
+        if idle_for < self.health_check_interval:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1;")
+            cur.fetchone()
+            cur.close()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _reap_idle_locked(self, now):
+        """Closes connections idle longer than max_idle, keeping minconn open."""
+        if self.max_idle is None:
+            return
+        keep = []
+        reaped = []
+        total = len(self._idle) + len(self._in_use) + self._opening
+        # Oldest connections sit at the front of the idle list.
+        for conn, returned_at in self._idle:
+            if now - returned_at > self.max_idle and total > self.minconn:
+                reaped.append(conn)
+                total -= 1
+            else:
+                keep.append((conn, returned_at))
+        self._idle = keep
+        self.connections_reaped += len(reaped)
+        for conn in reaped:
+            self._close_quietly(conn)
+
+    def reap_idle(self):
+        """Closes connections that have been idle for longer than max_idle."""
+        with self._cond:
+            self._reap_idle_locked(time.monotonic())
+
+    # --- Checkout / checkin ---
+
+    def getconn(self, timeout=None):
+        """Checks a connection out of the pool, waiting up to `timeout` seconds."""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout if timeout is not None else None
+
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise PoolClosed("Connection pool is closed.")
+                now = time.monotonic()
+                self._reap_idle_locked(now)
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                    self._in_use.add(conn)
+                    idle_for = now - returned_at
+                    candidate = conn
+                elif len(self._in_use) + self._opening < self.maxconn:
+                    self._opening += 1
+                    candidate = None
+                else:
+                    remaining = None if deadline is None else deadline - now
+                    if remaining is not None and remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeout(f"Timed out after {timeout}s waiting for a connection.")
+                    self._cond.wait(remaining)
+                    continue
+
+            if candidate is None:
+                try:
+                    conn = self._open()
+                except BaseException:
+                    # Give the reserved slot back and let a waiter try it.
+                    with self._cond:
+                        self._opening -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._opening -= 1
+                    self._in_use.add(conn)
+                break
+
+            if self._is_healthy(candidate, idle_for):
+                conn = candidate
+                break
+            # Broken connection: drop it and try again.
+            with self._cond:
+                self._in_use.discard(candidate)
+                self.connections_discarded += 1
+                self._cond.notify()
+            self._close_quietly(candidate)
+
+        waited = time.monotonic() - started
+        self.checkout_latency.observe(waited)
+        with self._cond:
+            self.checkouts += 1
+            self.total_wait_time += waited
+            if waited > self.max_wait_time:
+                self.max_wait_time = waited
+        return conn
+
+    def putconn(self, conn, discard=False):
+        """Returns a connection to the pool, closing it if discard is set or it is broken."""
+        with self._cond:
+            self._in_use.discard(conn)
+            if discard or self._closed or self._is_closed(conn):
+                self.connections_discarded += 1
+                self._cond.notify()
+                close = True
+            else:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+                close = False
+        if close:
+            self._close_quietly(conn)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Context manager that checks out a connection and always returns it.
+
+        Any transaction left open (including read-only ones) is rolled back
+        before the connection goes back to the pool.
+        """
+        conn = self.getconn(timeout)
+        discard = False
+        try:
+            yield conn
+        except BaseException:
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+            raise
+        else:
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+        finally:
+            self.putconn(conn, discard=discard)
+
+    def close_all(self):
+        """Closes idle connections and marks the pool closed; in-use ones close on return."""
+        with self._cond:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle = []
+            self._cond.notify_all()
+        for conn in idle:
+            self._close_quietly(conn)
+
+    # --- Metrics ---
+
+    def stats(self):
+        """Returns a snapshot of the pool metrics."""
+        with self._cond:
+            stats = {
+                'minconn': self.minconn,
+                'maxconn': self.maxconn,
+                'in_use': len(self._in_use),
+                'idle': len(self._idle),
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'total_wait_time': self.total_wait_time,
+                'avg_wait_time': self.total_wait_time / self.checkouts if self.checkouts else 0.0,
+                'max_wait_time': self.max_wait_time,
+                'connections_opened': self.connections_opened,
+                'connections_discarded': self.connections_discarded,
+                'connections_reaped': self.connections_reaped,
+            }
+        stats['checkout_latency'] = self.checkout_latency.snapshot()
+        return stats
@@ -0,0 +1,402 @@
+import argparse
+import datetime
+from decimal import Decimal
+from typing import NamedTuple, Optional
+
+from stats_fit import clear_rollups, rebuild_params
+
+# Per-exercise progression: PR history, estimated one-rep max (Epley), weekly
+# volume and plateau detection, kept in precomputed tables:
+#   exercise_progress    - current state per (user, exercise)
+#   exercise_weekly      - sessions, sets, volume and best e1RM per week
+#   exercise_pr_history  - one row per session that set a weight or e1RM record
+# create_workout folds each new workout in with apply_progress (one statement,
+# inside its transaction); rebuild_progress recomputes everything from raw
+# workouts, which is also how backdated imports are made exact. Archived months
+# (partitions_fit) count through their monthly summaries, and their weekly and
+# PR history rows are kept as they are. The Progress page is served by
+# read_progress in a single query; compute_progress derives the same rows from
+# raw exercises for the embedded engine (storage_fit.py).
+# Usage: python progression_fit.py rebuild [--user-id N]
+
+# A plateau is this many sessions of an exercise without a record, spanning at
+# least this many days.
+PLATEAU_SESSIONS = 4
+PLATEAU_DAYS = 21
+# Weeks of volume history returned by read_progress.
+TREND_WEEKS = 12
+
+PROGRESSION_DDL = """
+    CREATE TABLE IF NOT EXISTS exercise_progress (
+        user_id INT NOT NULL,
+        exercise_name VARCHAR(255) NOT NULL,
+        best_weight_kg DECIMAL,
+        best_e1rm DECIMAL,
+        first_session_date DATE NOT NULL,
+        last_session_date DATE NOT NULL,
+        last_pr_date DATE,
+        sessions INT NOT NULL DEFAULT 0,
+        sessions_since_pr INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, exercise_name),
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    );
+
+    CREATE TABLE IF NOT EXISTS exercise_weekly (
+        user_id INT NOT NULL,
+        exercise_name VARCHAR(255) NOT NULL,
+        week_start DATE NOT NULL,
+        sessions INT NOT NULL DEFAULT 0,
+        sets INT NOT NULL DEFAULT 0,
+        volume DECIMAL NOT NULL DEFAULT 0,
+        best_e1rm DECIMAL,
+        PRIMARY KEY (user_id, exercise_name, week_start),
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    );
+
+    CREATE TABLE IF NOT EXISTS exercise_pr_history (
+        id BIGSERIAL PRIMARY KEY,
+        user_id INT NOT NULL,
+        exercise_name VARCHAR(255) NOT NULL,
+        workout_id INT REFERENCES workouts(id) ON DELETE SET NULL,
+        achieved_on DATE NOT NULL,
+        weight_kg DECIMAL,
+        e1rm DECIMAL,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    );
+    CREATE INDEX IF NOT EXISTS exercise_pr_history_user_idx
+        ON exercise_pr_history (user_id, exercise_name, achieved_on);
+"""
+
+# Progression table -> its date column; rebuilds keep the rows dated before the archived date.
+PROGRESSION_TABLES = {'exercise_progress': None, 'exercise_weekly': 'week_start', 'exercise_pr_history': 'achieved_on'}
+
+
+def e1rm_sql(weight, reps):
+    # Epley: weight * (1 + reps / 30); a single rep is the weight itself.
+    return (f"CASE WHEN {weight} IS NULL OR COALESCE({reps}, 0) < 1 THEN NULL "
+            f"WHEN {reps} = 1 THEN {weight} "
+            f"ELSE ROUND({weight} * (1 + {reps} / 30.0), 2) END")
+
+
+# Folds one workout into the progression tables. A session is a record when it
+# beats the best weight or e1RM stored so far.
+APPLY_PROGRESS_QUERY = f"""
+    WITH session AS (
+        SELECT
+            name AS exercise_name,
+            MAX(weight) AS best_weight,
+            MAX({e1rm_sql('weight', 'reps')}) AS best_e1rm,
+            COALESCE(SUM(sets * reps * weight), 0) AS volume,
+            COALESCE(SUM(sets), 0) AS sets
+        FROM unnest(%(names)s::varchar[], %(sets)s::int[], %(reps)s::int[], %(weights)s::numeric[])
+            AS e(name, sets, reps, weight)
+        GROUP BY name
+    ),
+    judged AS (
+        SELECT s.*,
+               COALESCE(s.best_weight > COALESCE(p.best_weight_kg, 0)
+                        OR s.best_e1rm > COALESCE(p.best_e1rm, 0), false) AS is_pr
+        FROM session s
+        LEFT JOIN exercise_progress p
+            ON p.user_id = %(user_id)s AND p.exercise_name = s.exercise_name
+    ),
+    history AS (
+        INSERT INTO exercise_pr_history (user_id, exercise_name, workout_id, achieved_on, weight_kg, e1rm)
+        SELECT %(user_id)s, exercise_name, %(workout_id)s, %(date)s::date, best_weight, best_e1rm
+        FROM judged
+        WHERE is_pr
+        RETURNING 1
+    ),
+    weekly AS (
+        INSERT INTO exercise_weekly AS x (user_id, exercise_name, week_start, sessions, sets, volume, best_e1rm)
+        SELECT %(user_id)s, exercise_name, date_trunc('week', %(date)s::date)::date, 1, sets, volume, best_e1rm
+        FROM session
+        ON CONFLICT (user_id, exercise_name, week_start) DO UPDATE SET
+            sessions = x.sessions + 1,
+            sets = x.sets + EXCLUDED.sets,
+            volume = x.volume + EXCLUDED.volume,
+            best_e1rm = GREATEST(x.best_e1rm, EXCLUDED.best_e1rm)
+        RETURNING 1
+    )
+    INSERT INTO exercise_progress AS p (
+        user_id, exercise_name, best_weight_kg, best_e1rm, first_session_date,
+        last_session_date, last_pr_date, sessions, sessions_since_pr
+    )
+    SELECT %(user_id)s, exercise_name, best_weight, best_e1rm, %(date)s::date, %(date)s::date,
+           CASE WHEN is_pr THEN %(date)s::date END, 1, CASE WHEN is_pr THEN 0 ELSE 1 END
+    FROM judged
+    ON CONFLICT (user_id, exercise_name) DO UPDATE SET
+        best_weight_kg = GREATEST(p.best_weight_kg, EXCLUDED.best_weight_kg),
+        best_e1rm = GREATEST(p.best_e1rm, EXCLUDED.best_e1rm),
+        first_session_date = LEAST(p.first_session_date, EXCLUDED.first_session_date),
+        last_session_date = GREATEST(p.last_session_date, EXCLUDED.last_session_date),
+        last_pr_date = GREATEST(p.last_pr_date, EXCLUDED.last_pr_date),
+        sessions = p.sessions + 1,
+        sessions_since_pr = CASE WHEN EXCLUDED.sessions_since_pr = 0 THEN 0 ELSE p.sessions_since_pr + 1 END;
+"""
+
+# Recomputes the progression tables for the matching workouts in one statement.
+# Each archived month ({archived_exercises} AS a, see stats_fit.rebuild_params)
+# takes part in record detection as one session dated on its last day, less the
+# `trailing` sessions after its last kept record; weekly rows and records are
+# only written from %(since)s on, the older ones are kept.
+# {where} and {archived_where} are either empty or filters on w.user_id and a.user_id.
+REBUILD_PROGRESS_QUERY = f"""
+    WITH sessions AS (
+        SELECT
+            w.user_id, e.exercise_name, w.id AS workout_id, w.workout_date,
+            MAX(e.weight_kg) AS best_weight,
+            MAX({e1rm_sql('e.weight_kg', 'e.reps')}) AS best_e1rm,
+            COALESCE(SUM(e.sets * e.reps * e.weight_kg), 0) AS volume,
+            COALESCE(SUM(e.sets), 0) AS sets
+        FROM workouts w
+        JOIN exercises e ON e.workout_id = w.id
+        {{where}}
+        GROUP BY w.user_id, e.exercise_name, w.id, w.workout_date
+    ),
+    combined AS (
+        SELECT user_id, exercise_name, workout_id, workout_date, workout_date AS first_date,
+               best_weight, best_e1rm, 1 AS sessions, 0 AS trailing, false AS archived
+        FROM sessions
+        UNION ALL
+        SELECT user_id, exercise_name, NULL, last_date, first_date, max_weight_kg, best_e1rm, sessions,
+               (SELECT COUNT(*) FROM unnest(a.session_dates) AS d(day)
+                WHERE day > (SELECT MAX(achieved_on) FROM exercise_pr_history r
+                             WHERE r.user_id = a.user_id AND r.exercise_name = a.exercise_name
+                               AND r.achieved_on BETWEEN a.first_date AND a.last_date)),
+               true
+        FROM {{archived_exercises}} AS a
+        {{archived_where}}
+    ),
+    ranked AS (
+        SELECT c.*,
+               SUM(c.sessions) OVER upto AS session_no,
+               COALESCE(c.best_weight > COALESCE(MAX(c.best_weight) OVER prior, 0)
+                        OR c.best_e1rm > COALESCE(MAX(c.best_e1rm) OVER prior, 0), false) AS is_pr
+        FROM combined c
+        WINDOW h AS (PARTITION BY c.user_id, c.exercise_name ORDER BY c.workout_date, c.workout_id),
+               prior AS (h ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING),
+               upto AS (h ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW)
+    ),
+    kept AS (
+        SELECT user_id, exercise_name, MAX(achieved_on) AS last_pr_date
+        FROM exercise_pr_history a
+        {{archived_where}}
+        GROUP BY user_id, exercise_name
+    ),
+    history AS (
+        INSERT INTO exercise_pr_history (user_id, exercise_name, workout_id, achieved_on, weight_kg, e1rm)
+        SELECT user_id, exercise_name, workout_id, workout_date, best_weight, best_e1rm
+        FROM ranked
+        WHERE is_pr AND NOT archived AND workout_date >= %(since)s
+        RETURNING 1
+    ),
+    weekly AS (
+        INSERT INTO exercise_weekly (user_id, exercise_name, week_start, sessions, sets, volume, best_e1rm)
+        SELECT user_id, exercise_name, date_trunc('week', workout_date)::date,
+               COUNT(*), SUM(sets), SUM(volume), MAX(best_e1rm)
+        FROM sessions
+        WHERE date_trunc('week', workout_date) >= %(since)s
+        GROUP BY user_id, exercise_name, date_trunc('week', workout_date)
+        RETURNING 1
+    )
+    INSERT INTO exercise_progress (
+        user_id, exercise_name, best_weight_kg, best_e1rm, first_session_date,
+        last_session_date, last_pr_date, sessions, sessions_since_pr
+    )
+    SELECT r.user_id, r.exercise_name, MAX(r.best_weight), MAX(r.best_e1rm), MIN(r.first_date),
+           MAX(r.workout_date), GREATEST(MAX(r.workout_date) FILTER (WHERE r.is_pr AND NOT r.archived),
+                                         MAX(k.last_pr_date)),
+           SUM(r.sessions), SUM(r.sessions) - COALESCE(MAX(r.session_no - r.trailing) FILTER (WHERE r.is_pr), 0)
+    FROM ranked r
+    LEFT JOIN kept k ON k.user_id = r.user_id AND k.exercise_name = r.exercise_name
+    GROUP BY r.user_id, r.exercise_name;
+"""
+
+# Everything the Progress page shows, one row per exercise.
+PROGRESS_QUERY = """
+    SELECT
+        p.exercise_name, p.best_weight_kg, p.best_e1rm, p.last_pr_date,
+        p.sessions, p.sessions_since_pr, p.last_session_date,
+        p.sessions_since_pr >= %(plateau_sessions)s
+            AND p.last_session_date - COALESCE(p.last_pr_date, p.first_session_date) >= %(plateau_days)s,
+        COALESCE(w.weeks, '{}'), COALESCE(w.volumes, '{}'), COALESCE(w.e1rms, '{}'), w.volume_trend,
+        COALESCE(h.dates, '{}'), COALESCE(h.e1rms, '{}')
+    FROM exercise_progress p
+    LEFT JOIN LATERAL (
+        SELECT
+            array_agg(week_start ORDER BY week_start) AS weeks,
+            array_agg(volume ORDER BY week_start) AS volumes,
+            array_agg(best_e1rm ORDER BY week_start) AS e1rms,
+            regr_slope(volume, (week_start - DATE '2000-01-03') / 7) AS volume_trend
+        FROM exercise_weekly x
+        WHERE x.user_id = p.user_id AND x.exercise_name = p.exercise_name
+          AND x.week_start >= date_trunc('week', CURRENT_DATE)::date - 7 * %(weeks)s
+    ) w ON true
+    LEFT JOIN LATERAL (
+        SELECT array_agg(achieved_on ORDER BY achieved_on, id) AS dates,
+               array_agg(COALESCE(e1rm, weight_kg) ORDER BY achieved_on, id) AS e1rms
+        FROM exercise_pr_history r
+        WHERE r.user_id = p.user_id AND r.exercise_name = p.exercise_name
+    ) h ON true
+    WHERE p.user_id = %(user_id)s
+    ORDER BY p.last_session_date DESC, p.exercise_name;
+"""
+
+
+class ExerciseProgress(NamedTuple):
+    exercise: str
+    best_weight: Optional[Decimal]
+    best_e1rm: Optional[Decimal]
+    last_pr_date: Optional[datetime.date]
+    sessions: int
+    sessions_since_pr: int
+    last_session_date: datetime.date
+    plateau: bool
+    weeks: list                     # week starts of the last TREND_WEEKS weeks with sessions
+    weekly_volume: list
+    weekly_e1rm: list
+    volume_trend: Optional[float]   # least-squares change in weekly volume per week
+    pr_dates: list                  # every record, oldest first
+    pr_e1rms: list
+
+
+def estimated_1rm(weight, reps):
+    """Epley estimate of the one-rep max, matching the SQL used for the tables."""
+    if weight is None or not reps or reps < 1:
+        return None
+    weight = Decimal(str(weight))
+    if reps == 1:
+        return weight
+    return round(weight * (1 + Decimal(reps) / 30), 2)
+
+
+def apply_progress_params(user_id, workout_id, workout_date, exercises):
+    """Parameters of APPLY_PROGRESS_QUERY for one workout."""
+    return {
+        'user_id': user_id,
+        'workout_id': workout_id,
+        'date': workout_date,
+        'names': [exercise['name'] for exercise in exercises],
+        'sets': [exercise.get('sets') for exercise in exercises],
+        'reps': [exercise.get('reps') for exercise in exercises],
+        'weights': [exercise.get('weight') for exercise in exercises],
+    }
+
+
+def apply_progress(cur, user_id, workout_id, workout_date, exercises):
+    """Folds one newly inserted workout into the progression tables (single statement)."""
+    if exercises:
+        cur.execute(APPLY_PROGRESS_QUERY, apply_progress_params(user_id, workout_id, workout_date, exercises))
+
+
+def rebuild_progress(cur, user_id=None):
+    """Recomputes the progression tables from raw workouts and archived months for one user, or for everyone."""
+    params, names = rebuild_params(cur, user_id)
+    clear_rollups(cur, PROGRESSION_TABLES, params)
+    cur.execute(REBUILD_PROGRESS_QUERY.format(**names), params)
+
+
+def progress_params(user_id, weeks=TREND_WEEKS):
+    return {'user_id': user_id, 'weeks': weeks,
+            'plateau_sessions': PLATEAU_SESSIONS, 'plateau_days': PLATEAU_DAYS}
+
+
+def read_progress(cur, user_id, weeks=TREND_WEEKS):
+    """Every exercise of a user with records, trend and plateau flag, in one query."""
+    cur.execute(PROGRESS_QUERY, progress_params(user_id, weeks))
+    return [ExerciseProgress(*row) for row in cur.fetchall()]
+
+
+def _greatest(a, b):
+    # GREATEST() semantics: NULLs are ignored.
+    if a is None:
+        return b
+    return a if b is None or a >= b else b
+
+
+def _regr_slope(points):
+    # regr_slope(y, x): NULL for fewer than two points or no spread in x.
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    spread = sum((x - mean_x) ** 2 for x, _ in points)
+    if not spread:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / spread
+
+
+def compute_progress(rows, today=None, weeks=TREND_WEEKS):
+    """
+    ExerciseProgress of every exercise from raw exercise rows
+    (workout_id, workout_date, exercise_name, sets, reps, weight_kg) ordered by
+    date and workout id. Gives the same result as rebuild_progress followed by
+    read_progress; used by storage engines without the progression tables.
+    """
+    sessions = {}  # exercise -> {workout_id: [date, best weight, best e1RM, volume]}, oldest first
+    for workout_id, workout_date, name, sets, reps, weight in rows:
+        weight = None if weight is None else Decimal(str(weight))
+        session = sessions.setdefault(name, {}).get(workout_id)
+        if session is None:
+            session = sessions[name][workout_id] = [workout_date, None, None, Decimal(0)]
+        session[1] = _greatest(session[1], weight)
+        session[2] = _greatest(session[2], estimated_1rm(weight, reps))
+        if sets is not None and reps is not None and weight is not None:
+            session[3] += sets * reps * weight
+
+    today = today or datetime.date.today()
+    first_week = today - datetime.timedelta(days=today.weekday(), weeks=weeks)
+    epoch = datetime.date(2000, 1, 3)
+    result = []
+    for name, by_workout in sessions.items():
+        best_weight = best_e1rm = last_pr_date = None
+        last_pr_number = 0
+        pr_dates, pr_e1rms, weekly = [], [], {}
+        for number, (day, weight, e1rm, volume) in enumerate(by_workout.values(), 1):
+            if ((weight is not None and weight > (best_weight or 0))
+                    or (e1rm is not None and e1rm > (best_e1rm or 0))):
+                last_pr_date, last_pr_number = day, number
+                pr_dates.append(day)
+                pr_e1rms.append(weight if e1rm is None else e1rm)
+            best_weight = _greatest(best_weight, weight)
+            best_e1rm = _greatest(best_e1rm, e1rm)
+            week = day - datetime.timedelta(days=day.weekday())
+            if week >= first_week:
+                week_volume, week_e1rm = weekly.get(week, (Decimal(0), None))
+                weekly[week] = (week_volume + volume, _greatest(week_e1rm, e1rm))
+        dates = [session[0] for session in by_workout.values()]
+        since_pr = len(dates) - last_pr_number
+        week_starts = sorted(weekly)
+        result.append(ExerciseProgress(
+            name, best_weight, best_e1rm, last_pr_date, len(dates), since_pr, dates[-1],
+            since_pr >= PLATEAU_SESSIONS and (dates[-1] - (last_pr_date or dates[0])).days >= PLATEAU_DAYS,
+            week_starts,
+            [weekly[week][0] for week in week_starts],
+            [weekly[week][1] for week in week_starts],
+            _regr_slope([((week - epoch).days // 7, float(weekly[week][0])) for week in week_starts]),
+            pr_dates, pr_e1rms,
+        ))
+    result.sort(key=lambda progress: (-progress.last_session_date.toordinal(), progress.exercise))
+    return result
+
+
+def main():
+    import backend_fit as db
+
+    parser = argparse.ArgumentParser(description="Maintain the per-exercise progression tables.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    rebuild = sub.add_parser('rebuild', help="Backfill progression tables from existing workouts")
+    rebuild.add_argument('--user-id', type=int, help="Only rebuild this user (default: everyone)")
+    args = parser.parse_args()
+
+    if args.command == 'rebuild':
+        with db.pooled_connection() as conn:
+            cur = conn.cursor()
+            rebuild_progress(cur, args.user_id)
+            conn.commit()
+        print("Rebuilt exercise progression for " + (f"user {args.user_id}." if args.user_id else "all users."))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+import argparse
+from datetime import date
+from decimal import Decimal
+
+# Incrementally maintained per-user rollups (user_stats, user_stats_buckets,
+# user_exercise_stats). create_workout calls apply_workout inside its own
+# transaction so the rollups never drift from the raw workouts; rebuild_user_stats
+# recomputes them from scratch for backfills. Once partitions_fit has archived
+# old months, a rebuild adds their monthly summaries to the lifetime rollups and
+# keeps the buckets that start before the archived date as they are.
+# Usage: python stats_fit.py rebuild [--user-id N]
+
+ROLLUP_DDL = """
+    CREATE TABLE IF NOT EXISTS user_stats (
+        user_id INT PRIMARY KEY,
+        total_workouts INT NOT NULL DEFAULT 0,
+        total_duration INT NOT NULL DEFAULT 0,
+        min_duration INT,
+        max_duration INT,
+        max_weight_kg DECIMAL,
+        total_volume DECIMAL NOT NULL DEFAULT 0,
+        first_workout_date DATE,
+        last_workout_date DATE,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    );
+
+    CREATE TABLE IF NOT EXISTS user_stats_buckets (
+        user_id INT NOT NULL,
+        period VARCHAR(8) NOT NULL, -- 'day' or 'week' (weeks start on Monday)
+        bucket_start DATE NOT NULL,
+        workouts INT NOT NULL DEFAULT 0,
+        duration INT NOT NULL DEFAULT 0,
+        volume DECIMAL NOT NULL DEFAULT 0,
+        max_weight_kg DECIMAL,
+        PRIMARY KEY (user_id, period, bucket_start),
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    );
+
+    CREATE TABLE IF NOT EXISTS user_exercise_stats (
+        user_id INT NOT NULL,
+        exercise_name VARCHAR(255) NOT NULL,
+        max_weight_kg DECIMAL,
+        total_volume DECIMAL NOT NULL DEFAULT 0,
+        total_sets INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, exercise_name),
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    );
+"""
+
+APPLY_WORKOUT_QUERY = """
+    WITH lifetime AS (
+        INSERT INTO user_stats AS s (
+            user_id, total_workouts, total_duration, min_duration, max_duration,
+            max_weight_kg, total_volume, first_workout_date, last_workout_date
+        )
+        VALUES (%(user_id)s, 1, %(duration)s, %(duration)s, %(duration)s,
+                %(max_weight)s, %(volume)s, %(date)s::date, %(date)s::date)
+        ON CONFLICT (user_id) DO UPDATE SET
+            total_workouts = s.total_workouts + 1,
+            total_duration = s.total_duration + EXCLUDED.total_duration,
+            min_duration = LEAST(s.min_duration, EXCLUDED.min_duration),
+            max_duration = GREATEST(s.max_duration, EXCLUDED.max_duration),
+            max_weight_kg = GREATEST(s.max_weight_kg, EXCLUDED.max_weight_kg),
+            total_volume = s.total_volume + EXCLUDED.total_volume,
+            first_workout_date = LEAST(s.first_workout_date, EXCLUDED.first_workout_date),
+            last_workout_date = GREATEST(s.last_workout_date, EXCLUDED.last_workout_date)
+        RETURNING 1
+    ),
+    buckets AS (
+        INSERT INTO user_stats_buckets AS b (
+            user_id, period, bucket_start, workouts, duration, volume, max_weight_kg
+        )
+        VALUES
+            (%(user_id)s, 'day', %(date)s::date, 1, %(duration)s, %(volume)s, %(max_weight)s),
+            (%(user_id)s, 'week', date_trunc('week', %(date)s::date)::date, 1, %(duration)s, %(volume)s, %(max_weight)s)
+        ON CONFLICT (user_id, period, bucket_start) DO UPDATE SET
+            workouts = b.workouts + 1,
+            duration = b.duration + EXCLUDED.duration,
+            volume = b.volume + EXCLUDED.volume,
+            max_weight_kg = GREATEST(b.max_weight_kg, EXCLUDED.max_weight_kg)
+        RETURNING 1
+    )
+    INSERT INTO user_exercise_stats AS x (user_id, exercise_name, max_weight_kg, total_volume, total_sets)
+    SELECT %(user_id)s, name, max_weight, volume, sets
+    FROM unnest(%(names)s::varchar[], %(max_weights)s::numeric[], %(volumes)s::numeric[], %(sets)s::int[])
+        AS t(name, max_weight, volume, sets)
+    ON CONFLICT (user_id, exercise_name) DO UPDATE SET
+        max_weight_kg = GREATEST(x.max_weight_kg, EXCLUDED.max_weight_kg),
+        total_volume = x.total_volume + EXCLUDED.total_volume,
+        total_sets = x.total_sets + EXCLUDED.total_sets;
+"""
+
+# Recomputes every rollup for the matching workouts in one statement: lifetime
+# totals from the raw workouts plus the archived months ({archived_workouts} and
+# {archived_exercises} AS a), buckets from %(since)s on. {where} and
+# {archived_where} are either empty or filters on w.user_id and a.user_id.
+REBUILD_QUERY = """
+    WITH per_workout AS (
+        SELECT
+            w.user_id, w.workout_date, w.duration_minutes,
+            MAX(e.weight_kg) AS max_weight,
+            COALESCE(SUM(e.sets * e.reps * e.weight_kg), 0) AS volume
+        FROM workouts w
+        LEFT JOIN exercises e ON e.workout_id = w.id
+        {where}
+        GROUP BY w.id, w.workout_date
+    ),
+    lifetime AS (
+        INSERT INTO user_stats (
+            user_id, total_workouts, total_duration, min_duration, max_duration,
+            max_weight_kg, total_volume, first_workout_date, last_workout_date
+        )
+        SELECT user_id, SUM(workouts), SUM(duration), MIN(min_duration), MAX(max_duration),
+               MAX(max_weight), SUM(volume), MIN(first_date), MAX(last_date)
+        FROM (
+            SELECT user_id, COUNT(*) AS workouts, SUM(duration_minutes) AS duration,
+                   MIN(duration_minutes) AS min_duration, MAX(duration_minutes) AS max_duration,
+                   MAX(max_weight) AS max_weight, SUM(volume) AS volume,
+                   MIN(workout_date) AS first_date, MAX(workout_date) AS last_date
+            FROM per_workout
+            GROUP BY user_id
+            UNION ALL
+            SELECT user_id, workouts, duration, min_duration, max_duration,
+                   max_weight_kg, volume, first_date, last_date
+            FROM {archived_workouts} AS a
+            {archived_where}
+        ) AS t
+        GROUP BY user_id
+        RETURNING 1
+    ),
+    buckets AS (
+        INSERT INTO user_stats_buckets (user_id, period, bucket_start, workouts, duration, volume, max_weight_kg)
+        SELECT user_id, period, bucket_start, COUNT(*), SUM(duration_minutes), SUM(volume), MAX(max_weight)
+        FROM (
+            SELECT user_id, 'day' AS period, workout_date AS bucket_start, duration_minutes, volume, max_weight
+            FROM per_workout
+            UNION ALL
+            SELECT user_id, 'week', date_trunc('week', workout_date)::date, duration_minutes, volume, max_weight
+            FROM per_workout
+        ) AS b
+        WHERE bucket_start >= %(since)s
+        GROUP BY user_id, period, bucket_start
+        RETURNING 1
+    )
+    INSERT INTO user_exercise_stats (user_id, exercise_name, max_weight_kg, total_volume, total_sets)
+    SELECT user_id, exercise_name, MAX(max_weight), SUM(volume), SUM(sets)
+    FROM (
+        SELECT w.user_id, e.exercise_name, MAX(e.weight_kg) AS max_weight,
+               COALESCE(SUM(e.sets * e.reps * e.weight_kg), 0) AS volume, COALESCE(SUM(e.sets), 0) AS sets
+        FROM workouts w
+        JOIN exercises e ON e.workout_id = w.id
+        {where}
+        GROUP BY w.user_id, e.exercise_name
+        UNION ALL
+        SELECT user_id, exercise_name, max_weight_kg, volume, sets
+        FROM {archived_exercises} AS a
+        {archived_where}
+    ) AS t
+    GROUP BY user_id, exercise_name;
+"""
+
+# Empty stand-ins for partitions_fit's monthly summaries on schemas without them.
+NO_ARCHIVED_WORKOUTS = """(
+    SELECT NULL::int AS user_id, 0 AS workouts, 0 AS duration, NULL::int AS min_duration,
+           NULL::int AS max_duration, NULL::decimal AS max_weight_kg, 0::decimal AS volume,
+           NULL::date AS first_date, NULL::date AS last_date
+    WHERE false
+)"""
+NO_ARCHIVED_EXERCISES = """(
+    SELECT NULL::int AS user_id, NULL::varchar AS exercise_name, 0 AS sessions, 0 AS sets,
+           0::decimal AS volume, NULL::decimal AS max_weight_kg, NULL::decimal AS best_e1rm,
+           NULL::date AS first_date, NULL::date AS last_date, NULL::date[] AS session_dates
+    WHERE false
+)"""
+
+# Rollup table -> its date column; rebuilds keep the rows dated before the archived date.
+ROLLUP_TABLES = {'user_stats': None, 'user_stats_buckets': 'bucket_start', 'user_exercise_stats': None}
+
+
+def exercise_volume(exercise):
+    """sets * reps * weight for one exercise dict, or None if any part is missing."""
+    sets, reps, weight = exercise.get('sets'), exercise.get('reps'), exercise.get('weight')
+    if sets is None or reps is None or weight is None:
+        return None
+    return sets * reps * Decimal(str(weight))
+
+
+def apply_workout_params(user_id, workout_date, duration, exercises):
+    """Parameters of APPLY_WORKOUT_QUERY for one workout."""
+    per_name = {}
+    workout_max = None
+    workout_volume = Decimal(0)
+    for exercise in exercises:
+        weight = exercise.get('weight')
+        weight = Decimal(str(weight)) if weight is not None else None
+        volume = exercise_volume(exercise)
+        stats = per_name.setdefault(exercise['name'], [None, Decimal(0), 0])
+        if weight is not None:
+            stats[0] = weight if stats[0] is None else max(stats[0], weight)
+            workout_max = weight if workout_max is None else max(workout_max, weight)
+        if volume is not None:
+            stats[1] += volume
+            workout_volume += volume
+        stats[2] += exercise.get('sets') or 0
+
+    names = list(per_name)
+    return {
+        'user_id': user_id,
+        'date': workout_date,
+        'duration': duration,
+        'max_weight': workout_max,
+        'volume': workout_volume,
+        'names': names,
+        'max_weights': [per_name[n][0] for n in names],
+        'volumes': [per_name[n][1] for n in names],
+        'sets': [per_name[n][2] for n in names],
+    }
+
+
+def apply_workout(cur, user_id, workout_date, duration, exercises):
+    """Folds one newly inserted workout into the user's rollups (single statement)."""
+    cur.execute(APPLY_WORKOUT_QUERY, apply_workout_params(user_id, workout_date, duration, exercises))
+
+
+def archived_before(cur):
+    """
+    The date before which partitions_fit has archived the raw workouts (the
+    earliest date if nothing was archived yet), or None on schemas without
+    the archive tables.
+    """
+    cur.execute("SELECT to_regclass('partition_archives') IS NOT NULL;")
+    if not cur.fetchone()[0]:
+        return None
+    cur.execute("SELECT MAX(before_date) FROM partition_archives;")
+    return cur.fetchone()[0] or date.min
+
+
+def rebuild_params(cur, user_id):
+    """Query parameters and format arguments shared by the rebuilds of stats_fit and progression_fit."""
+    since = archived_before(cur)
+    names = {
+        'where': "" if user_id is None else "WHERE w.user_id = %(user_id)s",
+        'archived_where': "" if user_id is None else "WHERE a.user_id = %(user_id)s",
+        'archived_workouts': NO_ARCHIVED_WORKOUTS if since is None else "archived_workout_months",
+        'archived_exercises': NO_ARCHIVED_EXERCISES if since is None else "archived_exercise_months",
+    }
+    return {'user_id': user_id, 'since': since or date.min}, names
+
+
+def clear_rollups(cur, tables, params):
+    """Deletes what a rebuild recomputes: a user's (or everyone's) rows, except the dated ones before `since`."""
+    for table, dated in tables.items():
+        conditions = [f"{dated} >= %(since)s"] if dated else []
+        if params['user_id'] is not None:
+            conditions.append("user_id = %(user_id)s")
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        cur.execute(f"DELETE FROM {table}{where};", params)
+
+
+def rebuild_user_stats(cur, user_id=None):
+    """Recomputes the rollups from raw workouts and archived months for one user, or for everyone if user_id is None."""
+    params, names = rebuild_params(cur, user_id)
+    clear_rollups(cur, ROLLUP_TABLES, params)
+    cur.execute(REBUILD_QUERY.format(**names), params)
+
+
+def main():
+    import backend_fit as db
+
+    parser = argparse.ArgumentParser(description="Maintain the per-user stats rollups.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    rebuild = sub.add_parser('rebuild', help="Backfill rollups from existing workouts")
+    rebuild.add_argument('--user-id', type=int, help="Only rebuild this user (default: everyone)")
+    args = parser.parse_args()
+
+    if args.command == 'rebuild':
+        with db.pooled_connection() as conn:
+            cur = conn.cursor()
+            rebuild_user_stats(cur, args.user_id)
+            conn.commit()
+        print("Rebuilt user stats for " + (f"user {args.user_id}." if args.user_id else "all users."))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,878 @@
+import argparse
+import os
+import re
+import sqlite3
+import threading
+from datetime import date, timedelta
+from decimal import Decimal
+
+import backend_fit
+from feed_fit import FEED_TOP, feed_page
+from goals_fit import GoalProgress, validate_goal
+from history_fit import WorkoutHistory
+from import_fit import ImportResult, collect_rows, date_range, detect_format, read_records
+from insights_fit import empty_insights, insights_from_row
+from instrumentation_fit import instrumented, log_error
+from leaderboard_cache_fit import window_start
+from leaderboard_fit import WINDOW_SOURCES, LeaderboardRow, leaderboard_from_rows, normalize_metric
+from progression_fit import compute_progress
+
+# Storage backends behind the backend_fit function set.
+#  - 'postgres': backend_fit itself (connection pool, rollups, caches).
+#  - 'sqlite':   EmbeddedBackend, the same functions with the same arguments
+#                and return values on an embedded SQLite file, for local and
+#                test runs without a database server. With analytics 'duckdb'
+#                the analytic reads (insights, leaderboards, history,
+#                progression) run in DuckDB over the same file.
+# get_backend() returns the engine selected by backend_fit.STORAGE_CONFIG;
+# callers use the result exactly like the backend_fit module.
+# The embedded schema is Database_Tracker translated to the SQLite dialect plus
+# the goal columns, idempotency keys and indexes added by later migrations. The Postgres rollup,
+# progression and activity feed tables are not kept there: the embedded engine
+# computes those reads from the raw workouts, which is fast at local data sizes.
+# conformance_fit.py runs the same checks against every engine.
+# Usage: python storage_fit.py schema --dialect sqlite
+#        python storage_fit.py init --path fitness_tracker.db
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Database_Tracker')
+
+# Dialect -> (pattern, replacement) rewrites of the Postgres schema.
+DIALECT_RULES = {
+    'postgres': [],
+    'sqlite': [
+        (r'\bSERIAL PRIMARY KEY\b', 'INTEGER PRIMARY KEY AUTOINCREMENT'),
+        (r'\bDECIMAL\b', 'REAL'),
+    ],
+}
+
+# Changes on top of the translated baseline, as (PRAGMA user_version, DDL) steps:
+# the hot-path indexes (migration 2), goal columns (migration 3) and workout
+# idempotency keys (migration 5) in the SQLite dialect.
+EMBEDDED_MIGRATIONS = [
+    (1, """
+    ALTER TABLE goals ADD COLUMN metric VARCHAR(16)
+        CHECK (metric IN ('minutes', 'workouts', 'volume', 'max_weight'));
+    ALTER TABLE goals ADD COLUMN period VARCHAR(16)
+        CHECK (period IN ('week', 'month', 'all_time'));
+    ALTER TABLE goals ADD COLUMN exercise_name VARCHAR(255);
+
+    CREATE INDEX workouts_user_date_idx ON workouts (user_id, workout_date DESC, id DESC);
+    CREATE INDEX exercises_workout_idx ON exercises (workout_id, id);
+    CREATE INDEX friends_friend_idx ON friends (friend_id, user_id);
+    CREATE INDEX goals_user_idx ON goals (user_id);
+    """),
+    (2, """
+    ALTER TABLE workouts ADD COLUMN idempotency_key VARCHAR(64);
+    CREATE UNIQUE INDEX workouts_idempotency_idx
+        ON workouts (user_id, idempotency_key) WHERE idempotency_key IS NOT NULL;
+    """),
+]
+
+# Per-workout duration, volume and heaviest set of the workouts in a date range;
+# {where} narrows it further. The SQL is shared by SQLite and DuckDB.
+PER_WORKOUT = """
+    SELECT
+        w.user_id, w.duration_minutes,
+        (SELECT SUM(e.sets * e.reps * e.weight_kg) FROM exercises e WHERE e.workout_id = w.id) AS volume,
+        (SELECT MAX(e.weight_kg) FROM exercises e WHERE e.workout_id = w.id) AS max_weight
+    FROM workouts w
+    WHERE w.workout_date BETWEEN ? AND ? {where}
+"""
+
+# Leaderboard metric -> aggregate over PER_WORKOUT rows.
+METRIC_AGGREGATES = {
+    'minutes': 'SUM(duration_minutes)',
+    'workouts': 'COUNT(*)',
+    'volume': 'SUM(volume)',
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def translate_schema(ddl, dialect):
+    """Rewrites Postgres DDL (e.g. Database_Tracker) for another SQL dialect."""
+    if dialect not in DIALECT_RULES:
+        raise ValueError(f"Unknown SQL dialect: {dialect}")
+    for pattern, replacement in DIALECT_RULES[dialect]:
+        ddl = re.sub(pattern, replacement, ddl)
+    return ddl
+
+
+def schema(dialect):
+    """The Database_Tracker schema in the given dialect."""
+    with open(SCHEMA_FILE, encoding='utf-8') as f:
+        return translate_schema(f.read(), dialect)
+
+
+def embedded_ddl(since=0):
+    """DDL of the embedded schema steps after version `since` (0: including the baseline)."""
+    steps = [ddl for version, ddl in EMBEDDED_MIGRATIONS if version > since]
+    return ''.join(([schema('sqlite')] if since == 0 else []) + steps)
+
+
+def create_embedded_schema(conn):
+    """Creates or upgrades the embedded schema in a SQLite database."""
+    version = conn.execute("PRAGMA user_version;").fetchone()[0]
+    latest = EMBEDDED_MIGRATIONS[-1][0]
+    if version >= latest:
+        return
+    conn.executescript(f"BEGIN; {embedded_ddl(version)} PRAGMA user_version = {latest}; COMMIT;")
+
+
+def window_bounds(window, day=None):
+    """First and last day (inclusive) of the leaderboard/goal window containing `day`."""
+    day = day or date.today()
+    start = window_start(window, day)
+    if window == 'week':
+        return start, start + timedelta(days=6)
+    if window == 'month':
+        return start, (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return date.min, date.max
+
+
+def _param(value):
+    # SQLite has no DATE or DECIMAL types; dates are stored as ISO text.
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _params(values):
+    return [_param(value) for value in values]
+
+
+def _date(value):
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _decimal(value):
+    return None if value is None else Decimal(str(value))
+
+
+def _placeholders(values):
+    return ', '.join('?' * len(values))
+
+
+class EmbeddedBackend:
+    """The backend_fit functions on an embedded SQLite file (optionally with DuckDB analytics)."""
+
+    def __init__(self, path, analytics=None):
+        if analytics not in (None, 'duckdb'):
+            raise ValueError(f"Unknown analytics engine: {analytics}")
+        self.path = path
+        self.analytics = analytics
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._schema_ready = False
+
+    # --- Connections ---
+
+    def get_connection(self):
+        """Opens a new SQLite connection to the database file."""
+        conn = sqlite3.connect(self.path, timeout=30.0, check_same_thread=False)
+        conn.execute("PRAGMA foreign_keys = ON;")
+        conn.execute("PRAGMA journal_mode = WAL;")
+        conn.execute("PRAGMA synchronous = NORMAL;")
+        return conn
+
+    def _conn(self):
+        """This thread's SQLite connection (SQLite connections are not shared between threads)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            self.get_pool()
+            conn = self._local.conn = self.get_connection()
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _analytics_conn(self):
+        """Connection for the analytic reads: DuckDB over the SQLite file, or SQLite itself."""
+        if self.analytics is None:
+            return self._conn()
+        conn = getattr(self._local, 'duckdb', None)
+        if conn is None:
+            import duckdb
+            self.get_pool()
+            conn = self._local.duckdb = duckdb.connect()
+            conn.execute("INSTALL sqlite; LOAD sqlite;")
+            conn.execute(f"ATTACH '{self.path}' AS tracker (TYPE sqlite, READ_ONLY);")
+            conn.execute("USE tracker;")
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _query(self, sql, params=(), analytic=False):
+        conn = self._analytics_conn() if analytic else self._conn()
+        return conn.execute(sql, _params(params)).fetchall()
+
+    def get_pool(self):
+        """Creates the schema on first use; returns the backend (there is no pool to share)."""
+        if not self._schema_ready:
+            with self._lock:
+                if not self._schema_ready:
+                    conn = self.get_connection()
+                    try:
+                        create_embedded_schema(conn)
+                    finally:
+                        conn.close()
+                    self._schema_ready = True
+        return self
+
+    def pool_stats(self):
+        """Open connections, in the spirit of backend_fit.pool_stats."""
+        with self._lock:
+            return {'engine': 'sqlite', 'analytics': self.analytics, 'connections': len(self._connections)}
+
+    def close_pool(self):
+        """Closes every connection opened by this backend."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._local = threading.local()
+
+    # --- CRUD Operations for User Profile ---
+
+    @instrumented
+    def create_user(self, name, email, weight):
+        """Creates a new user profile."""
+        try:
+            with self._conn() as conn:
+                cur = conn.execute(
+                    "INSERT INTO users (name, email, weight_kg) VALUES (?, ?, ?);",
+                    _params((name, email, weight))
+                )
+                return cur.lastrowid
+        except sqlite3.IntegrityError:
+            print("Error: A user with this email already exists.")
+            return None
+        except Exception as e:
+            log_error("Error creating user", e)
+            return None
+
+    @instrumented
+    def read_user(self, user_id):
+        """Retrieves a user's profile."""
+        try:
+            rows = self._query("SELECT id, name, email, weight_kg FROM users WHERE id = ?;", (user_id,))
+            return (rows[0][:3] + (_decimal(rows[0][3]),)) if rows else None
+        except Exception as e:
+            log_error("Error reading user data", e)
+            return None
+
+    @instrumented
+    def find_user_by_email(self, email):
+        """Looks up a user by email; returns (id, name) or None."""
+        try:
+            rows = self._query("SELECT id, name FROM users WHERE email = ?;", (email,))
+            return rows[0] if rows else None
+        except Exception as e:
+            log_error("Error looking up user", e)
+            return None
+
+    @instrumented
+    def update_user(self, user_id, name, email, weight):
+        """Updates a user's profile."""
+        try:
+            with self._conn() as conn:
+                conn.execute(
+                    "UPDATE users SET name = ?, email = ?, weight_kg = ? WHERE id = ?;",
+                    _params((name, email, weight, user_id))
+                )
+            return True
+        except Exception as e:
+            log_error("Error updating user", e)
+            return False
+
+    @instrumented
+    def delete_user(self, user_id):
+        """Deletes a user's profile (and, through ON DELETE CASCADE, everything they own)."""
+        try:
+            with self._conn() as conn:
+                conn.execute("DELETE FROM users WHERE id = ?;", (user_id,))
+            return True
+        except Exception as e:
+            log_error("Error deleting user", e)
+            return False
+
+    def run_deletion_jobs(self, max_batches=None):
+        """Nothing to purge: embedded deletes cascade at once, local data being small."""
+        return 0
+
+    def read_deletion_jobs(self, user_id=None):
+        return []
+
+    # --- CRUD Operations for Workouts and Exercises ---
+
+    def _insert_workout(self, conn, user_id, workout_date, duration, exercises, idempotency_key=None):
+        # Returns None (and inserts nothing) when the idempotency key was already used.
+        cur = conn.execute(
+            """
+            INSERT INTO workouts (user_id, workout_date, duration_minutes, idempotency_key)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (user_id, idempotency_key) WHERE idempotency_key IS NOT NULL DO NOTHING;
+            """,
+            _params((user_id, workout_date, duration, idempotency_key))
+        )
+        if not cur.rowcount:
+            return None
+        workout_id = cur.lastrowid
+        conn.executemany(
+            "INSERT INTO exercises (workout_id, exercise_name, sets, reps, weight_kg) VALUES (?, ?, ?, ?, ?);",
+            [_params((workout_id, e['name'], e.get('sets'), e.get('reps'), e.get('weight'))) for e in exercises]
+        )
+        return workout_id
+
+    @instrumented
+    def create_workout(self, user_id, date, duration, exercises, idempotency_key=None):
+        """Creates a new workout and its associated exercises; a retried idempotency_key is recorded once."""
+        try:
+            with self._conn() as conn:
+                self._insert_workout(conn, user_id, date, duration, exercises, idempotency_key)
+            return True
+        except Exception as e:
+            log_error("Error creating workout", e)
+            return False
+
+    @instrumented
+    def import_workouts(self, user_id, source, fmt=None):
+        """Bulk imports workouts from a CSV/JSONL export; see backend_fit.import_workouts."""
+        if fmt is None:
+            fmt = detect_format(source if isinstance(source, str) else getattr(source, 'name', ''))
+        try:
+            fileobj = open(source, newline='', encoding='utf-8') if isinstance(source, str) else source
+        except OSError as e:
+            log_error("Error opening import file", e)
+            return None
+        try:
+            workouts, exercises, errors = collect_rows(read_records(fileobj, fmt))
+            by_ref = {}
+            for ref, name, sets, reps, weight in ((e[0],) + e[2:] for e in exercises):
+                by_ref.setdefault(ref, []).append({'name': name, 'sets': sets, 'reps': reps, 'weight': weight})
+            with self._conn() as conn:
+                for ref, (workout_date, duration) in workouts.items():
+                    self._insert_workout(conn, user_id, workout_date, duration, by_ref.get(ref, []))
+            return ImportResult(len(workouts), len(exercises), errors, *date_range(workouts))
+        except Exception as e:
+            log_error("Error importing workouts", e)
+            return None
+        finally:
+            if fileobj is not source: fileobj.close()
+
+    def _workouts_query(self, user_id, limit=None, before=None, start_date=None, end_date=None):
+        # Same shape as backend_fit._workouts_query: newest-first page, then its exercises.
+        conditions, params = ["user_id = ?"], [user_id]
+        if start_date is not None:
+            conditions.append("workout_date >= ?")
+            params.append(start_date)
+        if end_date is not None:
+            conditions.append("workout_date <= ?")
+            params.append(end_date)
+        if before is not None:
+            conditions.append("(workout_date, id) < (?, ?)")
+            params.extend(before)
+        limit_clause = ""
+        if limit is not None:
+            limit_clause = "LIMIT ?"
+            params.append(limit)
+        query = f"""
+            WITH page AS (
+                SELECT id, workout_date, duration_minutes
+                FROM workouts
+                WHERE {' AND '.join(conditions)}
+                ORDER BY workout_date DESC, id DESC
+                {limit_clause}
+            )
+            SELECT
+                p.id, p.workout_date, p.duration_minutes,
+                e.exercise_name, e.sets, e.reps, e.weight_kg
+            FROM page p
+            LEFT JOIN exercises e ON p.id = e.workout_id
+            ORDER BY p.workout_date DESC, p.id DESC, e.id;
+        """
+        return query, _params(params)
+
+    @staticmethod
+    def _typed_rows(rows):
+        for workout_id, workout_date, duration, name, sets, reps, weight in rows:
+            yield workout_id, _date(workout_date), duration, name, sets, reps, _decimal(weight)
+
+    @instrumented
+    def read_workouts(self, user_id, limit=None, before=None, start_date=None, end_date=None):
+        """Retrieves workouts and their exercises for a given user, newest first."""
+        try:
+            query, params = self._workouts_query(user_id, limit, before, start_date, end_date)
+            rows = self._query(query, params)
+            return list(backend_fit._group_workout_rows(self._typed_rows(rows)))
+        except Exception as e:
+            log_error("Error reading workouts", e)
+            return []
+
+    @instrumented
+    def read_workouts_page(self, user_id, page_size=20, before=None, start_date=None, end_date=None):
+        """Retrieves one page of workouts; returns (workouts, next_before)."""
+        workouts = self.read_workouts(user_id, page_size + 1, before, start_date, end_date)
+        if len(workouts) <= page_size:
+            return workouts, None
+        workouts = workouts[:page_size]
+        return workouts, (workouts[-1]['date'], workouts[-1]['id'])
+
+    @instrumented
+    def iter_workouts(self, user_id, start_date=None, end_date=None, batch_size=500):
+        """Streams a user's workouts, newest first, `batch_size` rows at a time."""
+        try:
+            query, params = self._workouts_query(user_id, start_date=start_date, end_date=end_date)
+            cur = self._conn().cursor()
+            cur.arraysize = batch_size
+            cur.execute(query, params)
+            yield from backend_fit._group_workout_rows(self._typed_rows(cur))
+            cur.close()
+        except Exception as e:
+            log_error("Error streaming workouts", e)
+
+    @instrumented
+    def read_workout_history(self, user_id, start_date=None, end_date=None, batch_size=5000):
+        """Retrieves a user's workouts as a history_fit.WorkoutHistory, oldest first; None on error."""
+        conditions, params = ["w.user_id = ?"], [user_id]
+        if start_date is not None:
+            conditions.append("w.workout_date >= ?")
+            params.append(start_date)
+        if end_date is not None:
+            conditions.append("w.workout_date <= ?")
+            params.append(end_date)
+        try:
+            rows = self._query(f"""
+                SELECT w.id, w.workout_date, w.duration_minutes,
+                       e.exercise_name, e.sets, e.reps, CAST(e.weight_kg AS DOUBLE)
+                FROM workouts w
+                LEFT JOIN exercises e ON e.workout_id = w.id
+                WHERE {' AND '.join(conditions)}
+                ORDER BY w.workout_date, w.id, e.id;
+            """, params, analytic=True)
+            return WorkoutHistory.from_rows(
+                (workout_id, _date(day).toordinal(), duration, name, sets, reps, weight)
+                for workout_id, day, duration, name, sets, reps, weight in rows
+            )
+        except Exception as e:
+            log_error("Error reading workout history", e)
+            return None
+
+    # --- CRUD Operations for Friends ---
+
+    @instrumented
+    def create_friendship(self, user_id, friend_email):
+        """Adds a friend to a user's friend list."""
+        result = self.create_friendships(user_id, [friend_email])
+        if result is None:
+            return False
+        if result['not_found']:
+            print("Friend not found.")
+            return False
+        if result['already_friends']:
+            print("Friendship already exists.")
+            return False
+        return True
+
+    @instrumented
+    def read_friends(self, user_id):
+        """Retrieves a list of a user's friends."""
+        try:
+            return self._query(
+                "SELECT u.name, u.email FROM friends f JOIN users u ON f.friend_id = u.id WHERE f.user_id = ?;",
+                (user_id,)
+            )
+        except Exception as e:
+            log_error("Error reading friends", e)
+            return []
+
+    @instrumented
+    def delete_friendship(self, user_id, friend_email):
+        """Removes a friend from a user's friend list."""
+        removed = self.delete_friendships(user_id, [friend_email])
+        if removed is None:
+            return False
+        if not removed:
+            print("Friend not found.")
+            return False
+        return True
+
+    # --- Batch Friend Operations and Lookups ---
+
+    @instrumented
+    def find_users_by_email(self, emails):
+        """Looks up many users at once; returns {email: (id, name)} for the emails that exist."""
+        emails = list(emails)
+        if not emails:
+            return {}
+        try:
+            rows = self._query(f"SELECT email, id, name FROM users WHERE email IN ({_placeholders(emails)});", emails)
+            return {email: (user_id, name) for email, user_id, name in rows}
+        except Exception as e:
+            log_error("Error looking up users", e)
+            return {}
+
+    @instrumented
+    def create_friendships(self, user_id, friend_emails):
+        """Adds many friends by email; returns {'added', 'already_friends', 'not_found'} email lists, or None on error."""
+        emails = list(dict.fromkeys(friend_emails))
+        result = {'added': [], 'already_friends': [], 'not_found': []}
+        if not emails:
+            return result
+        try:
+            with self._conn() as conn:
+                found = conn.execute(
+                    f"SELECT email, id FROM users WHERE email IN ({_placeholders(emails)});", emails
+                ).fetchall()
+                added = set()
+                for email, friend_id in found:
+                    cur = conn.execute(
+                        "INSERT OR IGNORE INTO friends (user_id, friend_id) VALUES (?, ?);", (user_id, friend_id)
+                    )
+                    if cur.rowcount:
+                        added.add(email)
+        except Exception as e:
+            log_error("Error adding friends", e)
+            return None
+        found = {email for email, _ in found}
+        for email in emails:
+            key = 'not_found' if email not in found else 'added' if email in added else 'already_friends'
+            result[key].append(email)
+        return result
+
+    @instrumented
+    def delete_friendships(self, user_id, friend_emails):
+        """Removes many friends by email; returns the emails actually removed, or None on error."""
+        emails = list(friend_emails)
+        if not emails:
+            return []
+        try:
+            with self._conn() as conn:
+                removed = conn.execute(f"""
+                    SELECT u.email, u.id
+                    FROM friends f JOIN users u ON f.friend_id = u.id
+                    WHERE f.user_id = ? AND u.email IN ({_placeholders(emails)});
+                """, [user_id] + emails).fetchall()
+                conn.executemany(
+                    "DELETE FROM friends WHERE user_id = ? AND friend_id = ?;",
+                    [(user_id, friend_id) for _, friend_id in removed]
+                )
+        except Exception as e:
+            log_error("Error removing friends", e)
+            return None
+        return [email for email, _ in removed]
+
+    @instrumented
+    def read_friends_of_users(self, user_ids):
+        """Retrieves the friend lists of many users; returns {user_id: [(friend_id, name, email), ...]}."""
+        user_ids = list(user_ids)
+        friends = {user_id: [] for user_id in user_ids}
+        if not user_ids:
+            return friends
+        try:
+            rows = self._query(f"""
+                SELECT f.user_id, u.id, u.name, u.email
+                FROM friends f
+                JOIN users u ON f.friend_id = u.id
+                WHERE f.user_id IN ({_placeholders(user_ids)})
+                ORDER BY f.user_id, u.name;
+            """, user_ids)
+        except Exception as e:
+            log_error("Error reading friends", e)
+            return {}
+        for owner_id, friend_id, name, email in rows:
+            friends[owner_id].append((friend_id, name, email))
+        return friends
+
+    # --- Activity Feed ---
+
+    @instrumented
+    def read_feed(self, user_id, page_size=20, before=None):
+        """
+        One page of a user's activity feed; returns (items, next_before).
+        Read straight from the workouts of the user and their friends (the
+        workout id stands in for the event id).
+        """
+        try:
+            rows = self._query(
+                """
+                SELECT w.id, w.user_id, u.name, w.id, w.workout_date, w.duration_minutes,
+                       COUNT(e.id), COALESCE(SUM(e.sets * e.reps * e.weight_kg), 0)
+                FROM workouts w
+                JOIN users u ON u.id = w.user_id
+                LEFT JOIN exercises e ON e.workout_id = w.id
+                WHERE (w.user_id = ? OR w.user_id IN (SELECT friend_id FROM friends WHERE user_id = ?))
+                  AND w.id < ?
+                GROUP BY w.id
+                ORDER BY w.id DESC
+                LIMIT ?;
+                """,
+                (user_id, user_id, FEED_TOP if before is None else before, page_size + 1)
+            )
+            return feed_page(((event_id, actor_id, name, workout_id, _date(day), duration, count, _decimal(volume))
+                              for event_id, actor_id, name, workout_id, day, duration, count, volume in rows),
+                             page_size)
+        except Exception as e:
+            log_error("Error reading activity feed", e)
+            return [], None
+
+    # --- CRUD Operations for Goals ---
+
+    @instrumented
+    def create_goal(self, user_id, description, target_value, metric=None, period=None, exercise_name=None):
+        """Creates a new fitness goal; see backend_fit.create_goal for tracked goals."""
+        try:
+            validate_goal(metric, period, exercise_name)
+            with self._conn() as conn:
+                conn.execute(
+                    """
+                    INSERT INTO goals (user_id, description, target_value, metric, period, exercise_name)
+                    VALUES (?, ?, ?, ?, ?, ?);
+                    """,
+                    (user_id, description, target_value, metric, period, exercise_name)
+                )
+            return True
+        except Exception as e:
+            log_error("Error creating goal", e)
+            return False
+
+    def _window_totals(self, user_id, period):
+        # (minutes, workouts, volume, heaviest set) of one goal period, like goals_fit's `windows`.
+        start, end = window_bounds(period)
+        rows = self._query(f"""
+            SELECT COALESCE(SUM(duration_minutes), 0), COUNT(*), COALESCE(SUM(volume), 0), MAX(max_weight)
+            FROM ({PER_WORKOUT.format(where="AND w.user_id = ?")}) x;
+        """, (start, end, user_id))
+        return rows[0]
+
+    @instrumented
+    def read_goals(self, user_id):
+        """Retrieves all of a user's goals with their live progress as goals_fit.GoalProgress tuples."""
+        try:
+            goals = self._query("""
+                SELECT id, description, target_value, current_value, metric, period, exercise_name
+                FROM goals
+                WHERE user_id = ?
+                ORDER BY id;
+            """, (user_id,))
+            totals = {}
+            result = []
+            for goal_id, description, target, current, metric, period, exercise_name in goals:
+                if metric is not None:
+                    period_key = period or 'all_time'
+                    if period_key not in totals:
+                        totals[period_key] = self._window_totals(user_id, period_key)
+                    minutes, workouts, volume, max_weight = totals[period_key]
+                    if metric == 'max_weight' and exercise_name is not None:
+                        max_weight = self._query("""
+                            SELECT MAX(e.weight_kg)
+                            FROM exercises e JOIN workouts w ON w.id = e.workout_id
+                            WHERE w.user_id = ? AND e.exercise_name = ?;
+                        """, (user_id, exercise_name))[0][0]
+                    value = {'minutes': minutes, 'workouts': workouts,
+                             'volume': volume, 'max_weight': max_weight}[metric]
+                    current = int(value or 0)
+                progress = min(current / target, 1.0) if target and target > 0 else 0.0
+                result.append(GoalProgress(goal_id, description, target, current,
+                                           metric, period, exercise_name, progress))
+            return result
+        except Exception as e:
+            log_error("Error reading goals", e)
+            return []
+
+    @instrumented
+    def update_goal(self, goal_id, description, target_value, current_value):
+        """Updates a fitness goal. current_value is ignored for goals tracked from workouts."""
+        try:
+            with self._conn() as conn:
+                conn.execute(
+                    """
+                    UPDATE goals
+                    SET description = ?, target_value = ?,
+                        current_value = CASE WHEN metric IS NULL THEN ? ELSE current_value END
+                    WHERE id = ?;
+                    """,
+                    (description, target_value, current_value, goal_id)
+                )
+            return True
+        except Exception as e:
+            log_error("Error updating goal", e)
+            return False
+
+    @instrumented
+    def delete_goal(self, goal_id):
+        """Deletes a fitness goal."""
+        try:
+            with self._conn() as conn:
+                conn.execute("DELETE FROM goals WHERE id = ?;", (goal_id,))
+            return True
+        except Exception as e:
+            log_error("Error deleting goal", e)
+            return False
+
+    # --- Business Insights and Leaderboard ---
+
+    @instrumented
+    def get_exercise_progress(self, user_id):
+        """Per-exercise progression (progression_fit.ExerciseProgress), computed from the raw exercises."""
+        try:
+            rows = self._query("""
+                SELECT w.id, w.workout_date, e.exercise_name, e.sets, e.reps, e.weight_kg
+                FROM workouts w
+                JOIN exercises e ON e.workout_id = w.id
+                WHERE w.user_id = ?
+                ORDER BY w.workout_date, w.id, e.id;
+            """, (user_id,), analytic=True)
+            return compute_progress((workout_id, _date(day), name, sets, reps, weight)
+                                    for workout_id, day, name, sets, reps, weight in rows)
+        except Exception as e:
+            log_error("Error reading exercise progress", e)
+            return []
+
+    @instrumented
+    def get_business_insights(self, user_id):
+        """Aggregate workout metrics for a user as an insights_fit.Insights."""
+        try:
+            (total_workouts, total_duration, min_duration, max_duration,
+             first_date, last_date), = self._query("""
+                SELECT COUNT(*), COALESCE(SUM(duration_minutes), 0),
+                       COALESCE(MIN(duration_minutes), 0), COALESCE(MAX(duration_minutes), 0),
+                       MIN(workout_date), MAX(workout_date)
+                FROM workouts
+                WHERE user_id = ?;
+            """, (user_id,), analytic=True)
+            if not total_workouts:
+                return empty_insights()
+            exercises = self._query("""
+                SELECT e.exercise_name, MAX(e.weight_kg), SUM(e.sets * e.reps * e.weight_kg)
+                FROM exercises e
+                JOIN workouts w ON e.workout_id = w.id
+                WHERE w.user_id = ?
+                GROUP BY e.exercise_name
+                ORDER BY e.exercise_name;
+            """, (user_id,), analytic=True)
+            prs = [(name, _decimal(pr)) for name, pr, _ in exercises if pr is not None]
+            return insights_from_row((
+                total_workouts, total_duration, Decimal(total_duration) / total_workouts,
+                min_duration, max_duration, _date(first_date), _date(last_date),
+                max((pr for _, pr in prs), default=Decimal(0)),
+                sum((_decimal(volume) for _, _, volume in exercises if volume is not None), Decimal(0)),
+                [name for name, _ in prs], [pr for _, pr in prs],
+            ))
+        except Exception as e:
+            log_error("Error getting business insights", e)
+            return None
+
+    def _scores(self, metric, window, members=None):
+        # [(user_id, name, score)] of everyone (or of `members`) active in the window.
+        metric = normalize_metric(metric)
+        if window not in WINDOW_SOURCES:
+            raise ValueError(f"Unknown leaderboard window: {window}")
+        start, end = window_bounds(window)
+        params = [start, end]
+        where = ""
+        if members is not None:
+            where = f"AND w.user_id IN ({_placeholders(members)})"
+            params += members
+        rows = self._query(f"""
+            SELECT x.user_id, u.name, {METRIC_AGGREGATES[metric]}
+            FROM ({PER_WORKOUT.format(where=where)}) x
+            JOIN users u ON u.id = x.user_id
+            GROUP BY x.user_id, u.name;
+        """, params, analytic=True)
+        convert = _decimal if metric == 'volume' else int
+        return [(user_id, name, convert(score or 0)) for user_id, name, score in rows]
+
+    @staticmethod
+    def _ranked(scores):
+        # SQL RANK(): ties share a rank; best first, then by name and id like leaderboard_query.
+        scores = sorted(scores, key=lambda s: (-s[2], s[1], s[0]))
+        rows = []
+        for index, (user_id, name, score) in enumerate(scores):
+            rank = rows[-1].rank if rows and rows[-1].value == score else index + 1
+            rows.append(LeaderboardRow(rank, user_id, name, score))
+        return rows
+
+    @instrumented
+    def get_leaderboard(self, user_id, metric='total_workout_minutes', window='week', limit=None):
+        """Ranks the user and their friends; returns a leaderboard_fit.Leaderboard."""
+        try:
+            metric = normalize_metric(metric)
+            members = self._query("""
+                SELECT u.id, u.name FROM users u
+                WHERE u.id = ? OR u.id IN (SELECT friend_id FROM friends WHERE user_id = ?);
+            """, (user_id, user_id))
+            scores = {member_id: score for member_id, _, score in
+                      self._scores(metric, window, [member_id for member_id, _ in members])}
+            zero = Decimal(0) if metric == 'volume' else 0
+            rows = self._ranked((member_id, name, scores.get(member_id, zero)) for member_id, name in members)
+            return leaderboard_from_rows(rows, user_id, metric, window, limit)
+        except Exception as e:
+            log_error("Error getting leaderboard", e)
+            return None
+
+    @instrumented
+    def get_global_leaderboard(self, metric='minutes', window='week', limit=10):
+        """Ranks all users active in the window; returns a list of leaderboard_fit.LeaderboardRow."""
+        try:
+            return self._ranked(self._scores(metric, window))[:limit]
+        except Exception as e:
+            log_error("Error getting global leaderboard", e)
+            return []
+
+    @instrumented
+    def get_global_rank(self, user_id, metric='minutes', window='week'):
+        """Returns a user's rank among all users."""
+        try:
+            scores = self._scores(metric, window)
+            own = next((score for member_id, _, score in scores if member_id == user_id), 0)
+            return sum(1 for _, _, score in scores if score > own) + 1
+        except Exception as e:
+            log_error("Error getting global rank", e)
+            return None
+
+
+def open_backend(config):
+    """Builds the backend described by a STORAGE_CONFIG dict."""
+    engine = config.get('engine', 'postgres')
+    if engine == 'postgres':
+        return backend_fit
+    if engine == 'sqlite':
+        return EmbeddedBackend(config['sqlite_path'], config.get('analytics'))
+    raise ValueError(f"Unknown storage engine: {engine}")
+
+
+def get_backend():
+    """The storage backend selected by backend_fit.STORAGE_CONFIG, created once per process."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = open_backend(backend_fit.STORAGE_CONFIG)
+    return _backend
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and create the storage backends' schemas.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    show = sub.add_parser('schema', help="Print Database_Tracker translated to a SQL dialect")
+    show.add_argument('--dialect', choices=sorted(DIALECT_RULES), default='sqlite')
+    init = sub.add_parser('init', help="Create an embedded SQLite database")
+    init.add_argument('--path', default=backend_fit.STORAGE_CONFIG['sqlite_path'])
+    args = parser.parse_args()
+
+    if args.command == 'schema':
+        print(embedded_ddl() if args.dialect == 'sqlite' else schema(args.dialect))
+    elif args.command == 'init':
+        EmbeddedBackend(args.path).get_pool()
+        print(f"Created the embedded schema in {args.path}.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+import io
+from datetime import date, timedelta
+from decimal import Decimal
+
+from import_fit import RowError, collect_rows, date_range, read_records
+from partitions_fit import latest_workout_date
+
+
+def workout(**fields):
+    record = {'workout_ref': 'w1', 'workout_date': '2025-03-01', 'duration_minutes': '45'}
+    record.update(fields)
+    return record
+
+
+def test_csv_rows_sharing_a_ref_form_one_workout():
+    source = io.StringIO(
+        "workout_ref,workout_date,duration_minutes,exercise_name,sets,reps,weight_kg\n"
+        "w1,2025-03-01,45,Squat,3,5,100\n"
+        "w1,2025-03-01,45,Bench,3,8,\n"
+    )
+    workouts, exercises, errors = collect_rows(read_records(source, 'csv'))
+    assert errors == []
+    assert workouts == {'w1': (date(2025, 3, 1), 45)}
+    assert exercises == [('w1', 0, 'Squat', 3, 5, Decimal('100')), ('w1', 1, 'Bench', 3, 8, None)]
+
+
+def test_jsonl_whole_workouts_and_bad_json():
+    source = io.StringIO(
+        '{"workout_ref": "a", "workout_date": "2025-03-01", "duration_minutes": 30,'
+        ' "exercises": [{"name": "Row", "sets": 2, "reps": 10, "weight": 40.5}]}\n'
+        '\n'
+        '{not json\n'
+    )
+    workouts, exercises, errors = collect_rows(read_records(source, 'jsonl'))
+    assert workouts == {'a': (date(2025, 3, 1), 30)}
+    assert exercises == [('a', 0, 'Row', 2, 10, Decimal('40.5'))]
+    assert [error.line for error in errors] == [3]
+
+
+def test_invalid_rows_are_reported_not_fatal():
+    records = [
+        (1, workout()),
+        (2, workout(workout_ref='')),
+        (3, workout(workout_date='03/01/2025')),
+        (4, workout(duration_minutes='0')),
+        (5, workout(exercise_name='Squat', sets='-1')),
+        (6, workout(exercise_name='Squat', weight_kg='NaN')),
+        (7, workout(exercise_name='x' * 256)),
+        (8, workout(duration_minutes='60')),
+    ]
+    workouts, exercises, errors = collect_rows(records)
+    assert [error.line for error in errors] == [2, 3, 4, 5, 6, 7, 8]
+    assert errors[0] == RowError(2, "missing workout_ref")
+    assert errors[-1] == RowError(8, "workout w1 has conflicting date or duration")
+    assert workouts == {'w1': (date(2025, 3, 1), 45)}
+    assert exercises == []
+
+
+def test_malformed_exercise_entries_are_row_errors():
+    records = [
+        (1, workout(exercises=['Squat'])),
+        (2, workout(exercises='Squat')),
+        (3, workout(exercises=[{'name': 5}])),
+        (4, workout(exercise_name=7)),
+    ]
+    workouts, exercises, errors = collect_rows(records)
+    assert [error.line for error in errors] == [1, 2, 3, 4]
+    assert errors[0].message == "exercise must be an object, got 'Squat'"
+    assert errors[1].message == "exercises must be a list, got 'Squat'"
+    assert errors[2].message == "name must be a string, got 5"
+    assert errors[3].message == "exercise_name must be a string, got 7"
+    assert workouts == {} and exercises == []
+
+
+def test_dates_past_the_premade_partitions_are_rejected():
+    last = latest_workout_date()
+    workouts, _, errors = collect_rows([
+        (1, workout(workout_ref='ok', workout_date=last.isoformat())),
+        (2, workout(workout_ref='late', workout_date=(last + timedelta(days=1)).isoformat())),
+    ])
+    assert list(workouts) == ['ok']
+    assert [error.line for error in errors] == [2]
+
+
+def test_date_range_of_the_imported_workouts():
+    workouts, _, _ = collect_rows([
+        (1, workout(workout_ref='a', workout_date='2025-03-09')),
+        (2, workout(workout_ref='b', workout_date='2024-11-30')),
+        (3, workout(workout_ref='c', workout_date='2025-01-15')),
+    ])
+    assert date_range(workouts) == (date(2024, 11, 30), date(2025, 3, 9))
+    assert date_range({}) == (None, None)
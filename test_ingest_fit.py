@@ -0,0 +1,67 @@
+from datetime import date
+from decimal import Decimal
+
+from ingest_fit import WorkoutQueue, record_args, workout_record
+
+
+def record(n):
+    return workout_record(1, date(2025, 3, n), 30 + n, [{'name': 'Squat', 'sets': 3, 'reps': 5,
+                                                          'weight': Decimal('100.5')}], f"key-{n}")
+
+
+def test_record_round_trip():
+    args = record_args(record(1))
+    assert args == (1, date(2025, 3, 1), 31,
+                    [{'name': 'Squat', 'sets': 3, 'reps': 5, 'weight': Decimal('100.5')}], 'key-1')
+
+
+def test_torn_tail_is_dropped_on_open(tmp_path):
+    path = str(tmp_path / 'queue')
+    queue = WorkoutQueue(path, fsync=False)
+    queue.append(record(1))
+    end = queue.append(record(2))
+    queue.close()
+    with open(path, 'ab') as f:
+        f.write(b'{"key":"key-3","user_')   # crash halfway through an append
+
+    queue = WorkoutQueue(path, fsync=False)
+    assert queue.end() == end
+    queue.append(record(4))
+    records, _ = queue.read_batch(10)
+    assert [r['key'] for r in records] == ['key-1', 'key-2', 'key-4']
+    queue.close()
+
+
+def test_checkpoint_survives_reopen(tmp_path):
+    path = str(tmp_path / 'queue')
+    queue = WorkoutQueue(path, fsync=False)
+    for n in range(1, 4):
+        queue.append(record(n))
+    records, offset = queue.read_batch(2)
+    assert [r['key'] for r in records] == ['key-1', 'key-2']
+    queue.commit(offset)
+    queue.close()
+
+    queue = WorkoutQueue(path, fsync=False)
+    assert queue.committed == offset
+    assert queue.pending() == 1
+    records, offset = queue.read_batch(10)
+    assert [r['key'] for r in records] == ['key-3']
+    assert offset == queue.end()
+    queue.close()
+
+
+def test_checkpoint_past_a_torn_tail_is_clamped(tmp_path):
+    path = str(tmp_path / 'queue')
+    queue = WorkoutQueue(path, fsync=False)
+    end = queue.append(record(1))
+    queue.close()
+    with open(path, 'ab') as f:
+        f.write(b'{"partial')
+    with open(path + '.checkpoint', 'w') as f:
+        f.write(str(end + 9))
+
+    queue = WorkoutQueue(path, fsync=False)
+    assert queue.committed == end
+    assert queue.pending() == 0
+    queue.close()
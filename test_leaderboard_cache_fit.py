@@ -0,0 +1,153 @@
+import random
+from datetime import date
+from decimal import Decimal
+
+from leaderboard_cache_fit import (LeaderboardCache, LocalSortedSet, LocalSortedSetStore, board_score, key_overlaps,
+                                   load_board_members, load_global_scores, snapshot_includes, window_key)
+
+DAY = date(2025, 3, 5)
+
+
+def test_ranks_share_ties_and_follow_updates():
+    zset = LocalSortedSet([(1, 50), (2, 80), (3, 50), (4, 10)])
+    assert [zset.rank(m) for m in (2, 1, 3, 4)] == [1, 2, 2, 4]
+    assert zset.zincrby(4, 45) == 55
+    assert [zset.rank(m) for m in (2, 4, 1, 3)] == [1, 2, 3, 3]
+    assert zset.zrem(2) and not zset.zrem(2)
+    assert zset.rank(2) is None
+    assert zset.top(2) == [(4, 55), (1, 50)]
+    assert len(zset) == 3
+
+
+def test_sorted_set_matches_a_plain_sort_under_random_updates():
+    rng = random.Random(7)
+    zset, scores = LocalSortedSet(), {}
+    for step in range(5000):
+        member, op = rng.randrange(100), rng.random()
+        if op < 0.5:
+            scores[member] = rng.randrange(50)
+            zset.zadd(member, scores[member])
+        elif op < 0.8:
+            scores[member] = scores.get(member, 0) + rng.randrange(-5, 10)
+            assert zset.zincrby(member, scores[member] - (zset.zscore(member) or 0)) == scores[member]
+        else:
+            assert zset.zrem(member) == (scores.pop(member, None) is not None)
+        if step % 50 == 0:
+            expected = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+            assert zset.top() == expected
+            assert zset.top(3) == expected[:3]
+            for member, score in scores.items():
+                assert zset.rank(member) == sum(1 for other in scores.values() if other > score) + 1
+    assert len(zset) == len(scores)
+
+
+def test_store_ranks_unknown_members_after_everyone_scored():
+    store = LocalSortedSetStore()
+    store.replace('k', [(1, 30), (2, 20)])
+    assert store.rank('k', 3) == 3
+    store.incr('k', 3, 25)
+    assert store.rank('k', 3) == 2
+    store.remove('k', 1)
+    assert store.rank('k', 3) == 1
+
+
+def test_snapshot_includes():
+    snapshot = '100:110:103,107'
+    assert snapshot_includes(snapshot, 99)
+    assert snapshot_includes(snapshot, 105)
+    assert not snapshot_includes(snapshot, 103)
+    assert not snapshot_includes(snapshot, 110)
+    assert snapshot_includes('100:100:', 99)
+    assert not snapshot_includes('100:100:', 100)
+
+
+def cache_with(rows, snapshot):
+    def run_query(fn, *args):
+        assert fn is load_global_scores
+        return list(rows), snapshot
+    return LeaderboardCache(LocalSortedSetStore(), run_query)
+
+
+def test_record_workout_skips_deltas_the_loaded_board_counts():
+    cache = cache_with([(1, 60), (2, 40)], '200:205:202')
+    assert cache.global_rank(2, 'minutes', 'all_time') == 2
+    cache.record_workout(2, DAY, 30, 0, xact=201)   # committed before the load: already counted
+    assert cache.global_top('minutes', 'all_time') == [(1, 60), (2, 40)]
+    cache.record_workout(2, DAY, 30, 0, xact=202)   # in progress during the load
+    assert cache.global_top('minutes', 'all_time') == [(2, 70), (1, 60)]
+    assert cache.global_rank(2, 'minutes', 'all_time') == 1
+
+
+def test_deltas_recorded_during_a_load_are_replayed():
+    def run_query(fn, *args):
+        # Two workouts commit while the scores are being read.
+        cache.record_workout(2, DAY, 30, 0, xact=210)   # after the snapshot: replayed
+        cache.record_workout(1, DAY, 5, 0, xact=150)    # inside the snapshot: already counted
+        return [(1, 60), (2, 40)], '200:205:'
+
+    cache = LeaderboardCache(LocalSortedSetStore(), run_query)
+    assert cache.global_top('minutes', 'all_time') == [(2, 70), (1, 60)]
+    assert cache._loading == {}
+
+
+class FloatStore(LocalSortedSetStore):
+    """Keeps and returns scores as floats, like RedisSortedSetStore (ZADD/ZMSCORE)."""
+
+    def replace(self, key, items):
+        super().replace(key, [(member, float(score)) for member, score in items])
+
+    def incr(self, key, member, delta):
+        super().incr(key, member, float(delta))
+
+    def scores(self, key, members):
+        return [None if score is None else float(score) for score in super().scores(key, members)]
+
+
+def test_board_score_turns_redis_floats_into_rollup_types():
+    assert board_score(None) == 0
+    assert board_score(90.0) == 90 and isinstance(board_score(90.0), int)
+    assert board_score(1234.5) == Decimal('1234.5')
+    assert board_score(Decimal('7.25')) == Decimal('7.25')
+
+
+def test_decimal_volume_patches_friend_boards_seeded_from_float_scores():
+    def run_query(fn, *args):
+        if fn is load_board_members:
+            return [(1, 'Ann'), (2, 'Bob')]
+        if fn is load_global_scores:
+            return [(1, Decimal('1000.5')), (2, Decimal('800'))], '100:100:'
+        raise AssertionError(fn)
+
+    cache = LeaderboardCache(FloatStore(), run_query)
+    for window in ('week', 'month', 'all_time'):
+        cache.friend_board(1, 'volume', window)
+    cache.record_workout(2, date.today(), 30, Decimal('300.25'), xact=100)
+    for window in ('week', 'month', 'all_time'):
+        board = cache.friend_board(1, 'volume', window)
+        assert [(row.user_id, row.value) for row in board.rows] == [(2, Decimal('1100.25')), (1, Decimal('1000.5'))]
+        assert cache.global_rank(2, 'volume', window) == 1
+
+
+def test_key_overlaps_matches_buckets_to_a_date_range():
+    first, last = date(2025, 1, 29), date(2025, 2, 4)   # Wednesday to the next Tuesday
+    assert key_overlaps('minutes:all_time', first, last)
+    assert key_overlaps('minutes:week:2025-01-27', first, last)
+    assert key_overlaps('minutes:week:2025-02-03', first, last)
+    assert not key_overlaps('minutes:week:2025-02-10', first, last)
+    assert key_overlaps('volume:month:2025-01-01', first, last)
+    assert key_overlaps('volume:month:2025-02-01', first, last)
+    assert not key_overlaps('volume:month:2024-12-01', first, last)
+    assert key_overlaps('volume:month:2024-12-01', None, None)
+
+
+def test_invalidate_user_only_drops_boards_of_the_imported_range():
+    store = LocalSortedSetStore()
+    imported, current = date(2024, 6, 12), date(2025, 3, 5)
+    keys = [window_key(metric, window, day) for metric in ('minutes', 'volume')
+            for window in ('week', 'month', 'all_time') for day in (imported, current)]
+    for key in keys:
+        store.replace(key, [(1, 10)])
+    cache = LeaderboardCache(store, run_query=None)
+    cache.invalidate_user(1, imported, imported)
+    assert sorted(store.keys()) == sorted({window_key(metric, window, current) for metric in ('minutes', 'volume')
+                                           for window in ('week', 'month')})
@@ -0,0 +1,134 @@
+import re
+from datetime import date
+
+import pytest
+
+from partitions_fit import (Partition, add_months, latest_workout_date, list_partitions, month_start,
+                            partition_for, partition_months, partition_name, partition_tables)
+
+
+class BoundsCursor:
+    """Answers list_partitions' catalog query with fixed partition bounds."""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self, query, params=None):
+        pass
+
+    def fetchall(self):
+        return self.rows
+
+
+class MigrationCursor:
+    """
+    Plays the unpartitioned tables for partition_tables: `rows` rows, the
+    newest dated `newest`. Like PostgreSQL, copying fails if that row has no
+    workouts partition to go to.
+    """
+
+    def __init__(self, rows, newest):
+        self.rows = rows
+        self.newest = newest
+        self.created = []
+        self.bounds = []
+        self.rowcount = 0
+        self._result = None
+
+    def execute(self, query, params=None):
+        self._result = None
+        if 'relkind' in query:
+            self._result = (False,)
+        elif 'pg_get_serial_sequence' in query:
+            self._result = (f"{params[0]}_id_seq",)
+        elif 'MAX(workout_date)' in query:
+            self._result = (self.newest,)
+        elif 'COUNT(*)' in query:
+            self._result = (self.rows,)
+        elif query.lstrip().startswith('INSERT INTO workouts'):
+            if not any((lower is None or lower <= self.newest) and self.newest < upper
+                       for lower, upper in self.bounds):
+                raise ValueError('no partition of relation "workouts" found for row')
+            self.rowcount = self.rows
+        elif query.lstrip().startswith('INSERT INTO'):
+            self.rowcount = self.rows
+        match = re.match(r"CREATE TABLE IF NOT EXISTS (workouts_p\w+) PARTITION OF", query)
+        if match:
+            self.created.append(match.group(1))
+            self.bounds.append((None,) + tuple(params) if len(params) == 1 else tuple(params))
+
+    def fetchone(self):
+        return self._result
+
+    def fetchall(self):
+        return []
+
+
+CATALOG_ROWS = [
+    ('workouts_p2025_02', "FOR VALUES FROM ('2025-02-01') TO ('2025-03-01')"),
+    ('workouts_p_before', "FOR VALUES FROM (MINVALUE) TO ('2025-01-01')"),
+    ('workouts_p2025_01', "FOR VALUES FROM ('2025-01-01') TO ('2025-02-01')"),
+]
+
+
+def test_dates_route_to_the_partition_whose_bounds_hold_them():
+    partitions = list_partitions(BoundsCursor(CATALOG_ROWS))
+
+    def routed_to(day):
+        partition = partition_for(partitions, day)
+        return partition and partition.name
+
+    assert routed_to(date(2025, 1, 1)) == 'workouts_p2025_01'
+    assert routed_to(date(2025, 1, 31)) == 'workouts_p2025_01'
+    assert routed_to(date(2025, 2, 28)) == 'workouts_p2025_02'
+    assert routed_to(date(2024, 12, 31)) == 'workouts_p_before'
+    assert routed_to(date(1990, 6, 1)) == 'workouts_p_before'
+    assert routed_to(date(2025, 3, 1)) is None
+    assert partition_for([], date(2025, 1, 1)) is None
+    # The monthly partitions are named after the month their bounds start in.
+    for day in (date(2025, 1, 17), date(2025, 2, 1)):
+        assert routed_to(day) == partition_name('workouts', month_start(day))
+
+
+def test_a_gap_between_partitions_routes_nowhere():
+    partitions = list_partitions(BoundsCursor([CATALOG_ROWS[0], CATALOG_ROWS[1]]))
+    assert partition_for(partitions, date(2025, 1, 15)) is None
+    assert partition_for(partitions, date(2025, 2, 15)).name == 'workouts_p2025_02'
+
+
+def test_add_months_crosses_years():
+    assert add_months(date(2024, 11, 1), 3) == date(2025, 2, 1)
+    assert add_months(date(2025, 1, 1), -1) == date(2024, 12, 1)
+    assert add_months(date(2025, 1, 1), -24) == date(2023, 1, 1)
+
+
+def test_latest_workout_date_stays_inside_the_premade_months():
+    assert latest_workout_date(date(2025, 3, 15), premake=3) == date(2025, 5, 31)
+    assert latest_workout_date(date(2025, 11, 1), premake=3) == date(2026, 1, 31)
+    with pytest.raises(ValueError):
+        latest_workout_date(date(2025, 3, 31), premake=0)
+
+
+def test_list_partitions_parses_bounds_oldest_first():
+    assert list_partitions(BoundsCursor(CATALOG_ROWS)) == [
+        Partition('workouts_p_before', None, date(2025, 1, 1)),
+        Partition('workouts_p2025_01', date(2025, 1, 1), date(2025, 2, 1)),
+        Partition('workouts_p2025_02', date(2025, 2, 1), date(2025, 3, 1)),
+    ]
+
+
+def test_partition_months_reach_the_newest_stored_workout():
+    months = partition_months(date(2025, 3, 15), keep_months=2, premake=1)
+    assert months == [date(2025, 1, 1), date(2025, 2, 1), date(2025, 3, 1), date(2025, 4, 1)]
+    months = partition_months(date(2025, 3, 15), keep_months=2, premake=1, newest=date(2025, 7, 4))
+    assert months[0] == date(2025, 1, 1) and months[-1] == date(2025, 7, 1)
+    assert partition_months(date(2025, 3, 15), keep_months=2, premake=1, newest=date(2020, 1, 1)) == \
+        partition_months(date(2025, 3, 15), keep_months=2, premake=1)
+
+
+def test_migration_creates_partitions_for_future_dated_rows():
+    cur = MigrationCursor(rows=10, newest=date(2031, 6, 30))
+    assert partition_tables(cur, today=date(2025, 3, 15), keep_months=24, premake=3)
+    assert cur.created[0] == 'workouts_p_before'
+    assert cur.created[-1] == 'workouts_p2031_06'
+    assert len(set(cur.created)) == len(cur.created)